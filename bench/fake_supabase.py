@@ -0,0 +1,336 @@
+"""
+In-memory stand-in for the part of the supabase-py client bot.py uses:
+table(...).select/insert/upsert/update/delete + eq/in_/gt/gte/lt/lte/order/limit + execute,
+and rpc(...) for the aura_* functions in sql/.
+
+Every execute() can sleep (simulated network latency) and fail at random,
+and every call is counted per (table or rpc, operation).
+"""
+import random
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+
+# primary key ของแต่ละตาราง (ใช้ทำ upsert / lookup ตรง)
+PRIMARY_KEYS = {
+    "users": ("guild_id", "user_id"),
+    "settings": ("guild_id", "key"),
+    "voice_progress": ("guild_id", "user_id"),
+    "voice_channels": ("guild_id", "channel_id"),
+    "gacha_rewards": ("guild_id", "name"),
+    "gacha_history": ("id",),
+    "gacha_reward_stats": ("guild_id", "reward"),
+}
+
+
+class FakeAPIError(Exception):
+    """code=None looks like an outage to the bot's circuit breaker; a SQLSTATE means the DB answered."""
+
+    def __init__(self, message, code=None):
+        super().__init__(message)
+        self.code = code
+
+
+class _Query:
+    def __init__(self, db, table: str):
+        self._db = db
+        self._table = table
+        self._op = None
+        self._payload = None
+        self._columns = None
+        self._on_conflict = None
+        self._filters = []  # (column, op, value)
+        self._order = []  # [(column, desc)] ตามลำดับที่เรียก
+        self._limit = None
+        self._offset = 0
+
+    # --- operations ---
+    def select(self, columns: str = "*"):
+        self._op = "select"
+        self._columns = None if columns.strip() == "*" else [c.strip() for c in columns.split(",")]
+        return self
+
+    def insert(self, payload):
+        self._op, self._payload = "insert", payload
+        return self
+
+    def upsert(self, payload, on_conflict: str = ""):
+        self._op, self._payload = "upsert", payload
+        self._on_conflict = tuple(c.strip() for c in on_conflict.split(",") if c.strip()) or None
+        return self
+
+    def update(self, payload):
+        self._op, self._payload = "update", payload
+        return self
+
+    def delete(self):
+        self._op = "delete"
+        return self
+
+    # --- filters ---
+    def eq(self, column, value):
+        self._filters.append((column, "eq", value))
+        return self
+
+    def in_(self, column, values):
+        self._filters.append((column, "in", set(values)))
+        return self
+
+    def gt(self, column, value):
+        self._filters.append((column, "gt", value))
+        return self
+
+    def gte(self, column, value):
+        self._filters.append((column, "gte", value))
+        return self
+
+    def lt(self, column, value):
+        self._filters.append((column, "lt", value))
+        return self
+
+    def lte(self, column, value):
+        self._filters.append((column, "lte", value))
+        return self
+
+    def order(self, column, desc: bool = False):
+        self._order.append((column, desc))
+        return self
+
+    def limit(self, n: int):
+        self._limit = n
+        return self
+
+    def range(self, start: int, end: int):
+        self._offset = start
+        self._limit = end - start + 1
+        return self
+
+    def execute(self):
+        return self._db._execute(self)
+
+
+class _Rpc:
+    def __init__(self, db, name: str, params: dict):
+        self._db = db
+        self.name = name
+        self.params = params
+
+    def execute(self):
+        return self._db._execute_rpc(self)
+
+
+def _match(row, filters) -> bool:
+    for col, op, value in filters:
+        v = row.get(col)
+        if op == "eq":
+            if v != value:
+                return False
+        elif op == "in":
+            if v not in value:
+                return False
+        elif v is None:
+            return False
+        elif op == "gt" and not v > value:
+            return False
+        elif op == "gte" and not v >= value:
+            return False
+        elif op == "lt" and not v < value:
+            return False
+        elif op == "lte" and not v <= value:
+            return False
+    return True
+
+
+class FakeSupabase:
+    """
+    latency: seconds slept per execute() (a (low, high) tuple picks uniformly).
+    failure_rate: probability that an execute() raises FakeAPIError.
+    failure_code: code of the injected error (None = timeout-like, "PGRST000" = PostgREST lost Postgres, ...).
+    """
+
+    def __init__(self, latency=0.0, failure_rate: float = 0.0, seed=None):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.failure_code = None
+        self.tables = {}      # table -> {pk_tuple: row}
+        self.calls = Counter()  # (table|rpc:name, op) -> count
+        self.rpc_functions = {
+            "aura_add_points": self._rpc_add_points,
+            "aura_spend_points": self._rpc_spend_points,
+            "aura_add_points_bulk": self._rpc_add_points_bulk,
+            "aura_claim_daily": self._rpc_claim_daily,
+            "aura_record_gacha": self._rpc_record_gacha,
+        }
+        self._lock = threading.RLock()
+        self._rng = random.Random(seed)
+
+    # --- supabase-py surface ---
+    def table(self, name: str) -> _Query:
+        return _Query(self, name)
+
+    def rpc(self, name: str, params: dict) -> _Rpc:
+        return _Rpc(self, name, params)
+
+    # --- helpers for benchmarks ---
+    def seed(self, table: str, rows):
+        with self._lock:
+            for r in rows:
+                self._put(table, dict(r))
+
+    def rows(self, table: str) -> list:
+        with self._lock:
+            return [dict(r) for r in self.tables.get(table, {}).values()]
+
+    def age_column(self, table: str, column: str, seconds: float):
+        """Move an ISO timestamp column back in time (simulates the minute between two ticks)."""
+        with self._lock:
+            for r in self.tables.get(table, {}).values():
+                if r.get(column):
+                    r[column] = (datetime.fromisoformat(r[column]) - timedelta(seconds=seconds)).isoformat()
+
+    def total_calls(self) -> int:
+        return sum(self.calls.values())
+
+    def reset_calls(self):
+        self.calls.clear()
+
+    # --- internals ---
+    def _simulate_network(self, key):
+        with self._lock:
+            self.calls[key] += 1
+            fail = self.failure_rate and self._rng.random() < self.failure_rate
+            delay = self._rng.uniform(*self.latency) if isinstance(self.latency, tuple) else self.latency
+        if delay:
+            time.sleep(delay)
+        if fail:
+            raise FakeAPIError(f"injected failure: {key}", code=self.failure_code)
+
+    def _pk(self, table, row, keys=None):
+        keys = keys or PRIMARY_KEYS.get(table)
+        if not keys:
+            return id(row)
+        return tuple(row.get(k) for k in keys)
+
+    def _put(self, table, row, keys=None):
+        t = self.tables.setdefault(table, {})
+        pk = self._pk(table, row, keys)
+        if pk in t:
+            t[pk].update(row)
+        else:
+            t[pk] = row
+        return t[pk]
+
+    def _candidates(self, table, filters):
+        t = self.tables.get(table, {})
+        keys = PRIMARY_KEYS.get(table)
+        # ใช้ primary key ตรงๆ ถ้า filter ครอบคลุม (กันสแกนทั้งตารางตอน benchmark ใหญ่)
+        if keys:
+            by_col = {}
+            for col, op, value in filters:
+                if op == "eq":
+                    by_col[col] = [value]
+                elif op == "in":
+                    by_col[col] = list(value)
+            if all(k in by_col for k in keys):
+                pks = [()]
+                for k in keys:
+                    pks = [pk + (v,) for pk in pks for v in by_col[k]]
+                return [t[pk] for pk in pks if pk in t]
+        return list(t.values())
+
+    def _execute(self, q: _Query):
+        self._simulate_network((q._table, q._op))
+        with self._lock:
+            payload = q._payload
+            if q._op in ("insert", "upsert"):
+                rows = payload if isinstance(payload, list) else [payload]
+                keys = q._on_conflict if q._op == "upsert" else None
+                out = []
+                for r in rows:
+                    if q._op == "insert" and self._pk(q._table, r) in self.tables.get(q._table, {}):
+                        raise FakeAPIError(f"duplicate key in {q._table}", code="23505")
+                    out.append(dict(self._put(q._table, dict(r), keys)))
+                return SimpleNamespace(data=out)
+
+            rows = [r for r in self._candidates(q._table, q._filters) if _match(r, q._filters)]
+            if q._op == "update":
+                for r in rows:
+                    r.update(payload)
+                return SimpleNamespace(data=[dict(r) for r in rows])
+            if q._op == "delete":
+                t = self.tables.get(q._table, {})
+                for r in rows:
+                    t.pop(self._pk(q._table, r), None)
+                return SimpleNamespace(data=[dict(r) for r in rows])
+
+            for col, desc in reversed(q._order):
+                rows.sort(key=lambda r: (r.get(col) is None, r.get(col)), reverse=desc)
+            if q._offset or q._limit is not None:
+                rows = rows[q._offset:None if q._limit is None else q._offset + q._limit]
+            if q._columns:
+                rows = [{c: r.get(c) for c in q._columns} for r in rows]
+            else:
+                rows = [dict(r) for r in rows]
+            return SimpleNamespace(data=rows)
+
+    def _execute_rpc(self, call: _Rpc):
+        self._simulate_network((f"rpc:{call.name}", "rpc"))
+        fn = self.rpc_functions.get(call.name)
+        if fn is None:
+            raise FakeAPIError(f"unknown function {call.name}")
+        with self._lock:
+            return SimpleNamespace(data=fn(**call.params))
+
+    # --- sql/ functions ---
+    def _user(self, guild_id, user_id):
+        u = self.tables.get("users", {}).get((guild_id, user_id))
+        if u is None:
+            u = self._put("users", {"guild_id": guild_id, "user_id": user_id, "points": 0})
+        return u
+
+    def _rpc_add_points(self, p_guild_id, p_user_id, p_amount):
+        u = self._user(p_guild_id, p_user_id)
+        before = int(u.get("points") or 0)
+        u["points"] = before + int(p_amount)
+        return [{"points_before": before, "points_after": u["points"]}]
+
+    def _rpc_spend_points(self, p_guild_id, p_user_id, p_cost):
+        u = self.tables.get("users", {}).get((p_guild_id, p_user_id))
+        before = int((u or {}).get("points") or 0)
+        if u is None or before < int(p_cost):
+            return [{"ok": False, "points_before": before, "points_after": before}]
+        u["points"] = before - int(p_cost)
+        return [{"ok": True, "points_before": before, "points_after": u["points"]}]
+
+    def _rpc_add_points_bulk(self, p_guild_id, p_user_ids, p_amounts):
+        out = []
+        for uid, amount in zip(p_user_ids, p_amounts):
+            u = self._user(p_guild_id, uid)
+            u["points"] = int(u.get("points") or 0) + int(amount)
+            out.append({"user_id": uid, "points_after": u["points"]})
+        return out
+
+    def _rpc_claim_daily(self, p_guild_id, p_user_id, p_amount, p_today):
+        u = self._user(p_guild_id, p_user_id)
+        before = int(u.get("points") or 0)
+        if u.get("last_daily") == p_today:
+            return [{"claimed": False, "points_before": before, "points_after": before}]
+        u["points"] = before + int(p_amount)
+        u["last_daily"] = p_today
+        return [{"claimed": True, "points_before": before, "points_after": u["points"]}]
+
+    def _rpc_record_gacha(self, p_rows):
+        history = self.tables.setdefault("gacha_history", {})
+        for r in p_rows:
+            rid = len(history) + 1
+            history[(rid,)] = {**r, "id": rid}
+            key = (r["guild_id"], r["reward"])
+            st = self.tables.setdefault("gacha_reward_stats", {}).get(key)
+            if st is None:
+                st = self._put("gacha_reward_stats", {"guild_id": key[0], "reward": key[1], "rolls": 0, "points_spent": 0})
+            st["rolls"] += 1
+            st["points_spent"] += int(r.get("cost") or 0)
+        return None
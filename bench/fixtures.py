@@ -0,0 +1,171 @@
+"""
+Fake Discord objects for the benchmarks: just the attributes bot.py reads
+(guild / member / voice state / channel / interaction), no gateway needed.
+"""
+import itertools
+import random
+import time
+
+_ids = itertools.count(10_000_000_000)
+
+
+def next_id() -> int:
+    return next(_ids)
+
+
+class FakeVoiceState:
+    def __init__(self, channel, self_mute=False, self_deaf=False, mute=False, deaf=False):
+        self.channel = channel
+        self.self_mute = self_mute
+        self.self_deaf = self_deaf
+        self.mute = mute
+        self.deaf = deaf
+
+
+class FakeChannel:
+    """Text or voice channel. `sent` keeps every message (log channels)."""
+
+    def __init__(self, guild, channel_id=None, name="channel"):
+        self.id = channel_id or next_id()
+        self.guild = guild
+        self.name = name
+        self.members = []
+        self.sent = []
+        self.mention = f"<#{self.id}>"
+
+    async def send(self, content=None, **kwargs):
+        self.sent.append(content)
+
+
+class FakeMember:
+    def __init__(self, guild, member_id=None, bot=False):
+        self.id = member_id or next_id()
+        self.guild = guild
+        self.bot = bot
+        self.voice = None
+        self.dms = []
+        self.mention = f"<@{self.id}>"
+        self.display_name = f"member-{self.id}"
+        self.roles = []
+
+    async def send(self, content=None, **kwargs):
+        self.dms.append(content)
+
+    def join(self, channel, muted=False):
+        if self.voice and self.voice.channel:
+            self.voice.channel.members.remove(self)
+        self.voice = FakeVoiceState(channel, self_mute=muted)
+        channel.members.append(self)
+
+    def leave(self):
+        if self.voice and self.voice.channel:
+            self.voice.channel.members.remove(self)
+        self.voice = None
+
+
+class FakeGuild:
+    def __init__(self, guild_id=None, name="guild"):
+        self.id = guild_id or next_id()
+        self.name = name
+        self.channels = {}
+        self.members_by_id = {}
+
+    @property
+    def members(self):
+        return list(self.members_by_id.values())
+
+    def get_channel(self, channel_id):
+        return self.channels.get(channel_id)
+
+    def get_member(self, member_id):
+        return self.members_by_id.get(member_id)
+
+    def add_channel(self, name="channel") -> FakeChannel:
+        ch = FakeChannel(self, name=name)
+        self.channels[ch.id] = ch
+        return ch
+
+    def add_member(self, member_id=None, bot=False) -> FakeMember:
+        m = FakeMember(self, member_id, bot)
+        self.members_by_id[m.id] = m
+        return m
+
+
+class FakeBot:
+    """What bot.py's loops read from `bot`: guilds, latency and readiness."""
+
+    def __init__(self, guilds):
+        self.guilds = guilds
+        self.latency = 0.05
+
+    def is_ready(self):
+        return True
+
+    def is_closed(self):
+        return False
+
+    def get_guild(self, guild_id):
+        return next((g for g in self.guilds if g.id == guild_id), None)
+
+
+class _FakeResponse:
+    def __init__(self, interaction):
+        self._interaction = interaction
+        self._done = False
+
+    def is_done(self) -> bool:
+        return self._done
+
+    def _ack(self):
+        self._done = True
+        if self._interaction.acked_at is None:
+            self._interaction.acked_at = time.perf_counter()
+
+    async def send_message(self, content=None, **kwargs):
+        self._ack()
+        self._interaction.messages.append(content)
+
+    async def defer(self, **kwargs):
+        self._ack()
+
+
+class _FakeFollowup:
+    def __init__(self, interaction):
+        self._interaction = interaction
+
+    async def send(self, content=None, **kwargs):
+        self._interaction.messages.append(content)
+
+
+class FakeInteraction:
+    def __init__(self, guild, user, custom_id=None):
+        self.guild = guild
+        self.guild_id = guild.id if guild else None
+        self.user = user
+        self.data = {"custom_id": custom_id}
+        self.messages = []
+        self.message = None
+        self.created_at = time.perf_counter()
+        self.acked_at = None  # เวลาที่ตอบ/defer ครั้งแรก (Discord ให้ 3 วินาที)
+        self.response = _FakeResponse(self)
+        self.followup = _FakeFollowup(self)
+
+
+def build_voice_world(guild_count: int, members_per_guild: int, channels_per_guild: int = 4,
+                      muted_ratio: float = 0.2, seed: int = 1):
+    """
+    Guilds whose members all sit in voice channels (a `muted_ratio` share muted).
+    Returns (guilds, voice_channel_rows) — the rows go into the fake voice_channels table.
+    """
+    rng = random.Random(seed)
+    guilds, rows = [], []
+    for gi in range(guild_count):
+        g = FakeGuild(name=f"guild-{gi}")
+        chans = [g.add_channel(f"voice-{ci}") for ci in range(channels_per_guild)]
+        rows.extend({"guild_id": g.id, "channel_id": ch.id} for ch in chans)
+        for _ in range(members_per_guild):
+            m = g.add_member()
+            m.join(rng.choice(chans), muted=rng.random() < muted_ratio)
+        guilds.append(g)
+    return guilds, rows
+
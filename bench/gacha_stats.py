@@ -0,0 +1,94 @@
+"""
+Statistical check for the gacha alias tables.
+
+Draws millions of samples and verifies the observed frequencies match the
+configured rates (chi-square goodness of fit + per-reward z-scores).
+
+    python bench/gacha_stats.py                      # default table, 5M draws
+    python bench/gacha_stats.py -n 20000000 --seed 1
+    python bench/gacha_stats.py --rates rates.json   # [{"name": ..., "rate": ...}, ...]
+
+Exits with status 1 if the samples don't match the rates.
+"""
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gacha import GACHA_REWARDS, AliasTable  # noqa: E402
+
+
+def chi_square_critical(df: int, alpha: float) -> float:
+    """Upper critical value of chi-square (Wilson-Hilferty approximation)."""
+    # z จาก alpha ด้วย bisection บน erfc (ไม่ต้องพึ่ง scipy)
+    lo, hi = 0.0, 10.0
+    for _ in range(100):
+        mid = (lo + hi) / 2
+        if 0.5 * math.erfc(mid / math.sqrt(2)) > alpha:
+            lo = mid
+        else:
+            hi = mid
+    z = (lo + hi) / 2
+    k = 2.0 / (9.0 * df)
+    return df * (1 - k + z * math.sqrt(k)) ** 3
+
+
+def check(table: AliasTable, draws: int, rng, batch: int, alpha: float, max_z: float) -> bool:
+    counts = [0] * len(table)
+    t0 = time.perf_counter()
+    left = draws
+    while left > 0:
+        # ใช้ sample_indices แบบเดียวกับปุ่มสุ่ม x10
+        for i in table.sample_indices(min(batch, left), rng):
+            counts[i] += 1
+        left -= batch
+    elapsed = time.perf_counter() - t0
+
+    chi2 = 0.0
+    ok = True
+    print(f"{'reward':<40} {'rate%':>8} {'observed%':>10} {'z':>7}")
+    for i, name in enumerate(table.names):
+        p = table.rates[i] / table.total
+        expected = draws * p
+        chi2 += (counts[i] - expected) ** 2 / expected
+        z = (counts[i] - expected) / math.sqrt(draws * p * (1 - p)) if p < 1 else 0.0
+        flag = "" if abs(z) <= max_z else "  <-- out of range"
+        ok = ok and abs(z) <= max_z
+        print(f"{name[:40]:<40} {p * 100:>8.3f} {counts[i] / draws * 100:>10.3f} {z:>7.2f}{flag}")
+
+    df = max(1, len(table) - 1)
+    critical = chi_square_critical(df, alpha)
+    ok = ok and chi2 <= critical
+    print(f"\nchi2={chi2:.2f} (df={df}, critical@{alpha}={critical:.2f})")
+    print(f"{draws:,} draws in {elapsed:.2f}s ({draws / elapsed / 1e6:.2f}M draws/s)")
+    print("PASS" if ok else "FAIL")
+    return ok
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("-n", "--draws", type=int, default=5_000_000)
+    ap.add_argument("--seed", type=int, default=None)
+    ap.add_argument("--batch", type=int, default=100_000)
+    ap.add_argument("--alpha", type=float, default=0.001)
+    ap.add_argument("--max-z", type=float, default=5.0)
+    ap.add_argument("--rates", help="JSON file with [{name, rate}, ...] (default: gacha.GACHA_REWARDS)")
+    args = ap.parse_args()
+
+    rewards = GACHA_REWARDS
+    if args.rates:
+        with open(args.rates, encoding="utf-8") as f:
+            rewards = json.load(f)
+
+    rng = random.Random(args.seed)
+    ok = check(AliasTable(rewards), args.draws, rng, args.batch, args.alpha, args.max_z)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
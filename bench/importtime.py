@@ -0,0 +1,116 @@
+"""
+Import-time benchmark for bot.py (python -X importtime), tracked against a baseline.
+
+Imports bot in a fresh interpreter several times, keeps the fastest run and
+reports the total plus the heaviest direct imports. Modules in LAZY must not
+be imported by `import bot` at all (they are loaded on first use).
+
+    python bench/importtime.py                    # compare with bench/importtime_baseline.json
+    python bench/importtime.py --runs 10 --top 15
+    python bench/importtime.py --update-baseline
+
+Exits with status 1 when the import got slower than the baseline or a LAZY module was imported eagerly.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+BASELINE_PATH = os.path.join(BENCH_DIR, "importtime_baseline.json")
+
+# ช้ากว่า baseline เกิน TIME_TOLERANCE และเกิน TIME_FLOOR_MS ถือว่า regress
+# (หลวมกว่า run_bench.py: import time แกว่งตาม disk cache ของเครื่อง)
+TIME_TOLERANCE = 0.5
+TIME_FLOOR_MS = 50.0
+# ต้องไม่ถูก import ตอน import bot (สร้างตอนใช้ครั้งแรก)
+LAZY = ("supabase",)
+
+
+def import_once() -> list:
+    """[(self_us, cumulative_us, depth, module)] from one `python -X importtime -c "import bot"`."""
+    env = {**os.environ, "JOURNAL_PATH": ":memory:"}
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import bot"],
+        cwd=ROOT, env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise SystemExit(f"import bot failed:\n{proc.stderr[-2000:]}")
+    out = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, cum_us, name = line[len("import time:"):].split("|", 2)
+        if not self_us.strip().isdigit():
+            continue  # หัวตาราง
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        out.append((int(self_us), int(cum_us), depth, name.strip()))
+    return out
+
+
+def measure(runs: int, top: int) -> dict:
+    best = None
+    for _ in range(runs):
+        rows = import_once()
+        total = next(cum for _, cum, depth, name in rows if name == "bot" and depth == 0)
+        if best is None or total < best[0]:
+            best = (total, rows)
+    total, rows = best
+    # -X importtime พิมพ์ลูกก่อนพ่อ: import ตรงของ bot = depth 1 ที่อยู่ก่อนบรรทัด bot (หลัง depth 0 ตัวก่อนหน้า)
+    group, direct, imported = [], [], set()
+    for _, cum, depth, name in rows:
+        group.append((cum, depth, name))
+        if depth == 0:
+            if name == "bot":
+                direct = [(c, n) for c, d, n in group if d == 1]
+                imported = {n for _, _, n in group}
+            group = []
+    direct = sorted(direct, reverse=True)[:top]
+    return {
+        "import_ms": round(total / 1000, 1),
+        "modules": len(rows),
+        "top": {name: round(cum / 1000, 1) for cum, name in direct},
+        "eager_lazy": sorted(m for m in LAZY if m in imported),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--top", type=int, default=10)
+    ap.add_argument("--baseline", default=BASELINE_PATH)
+    ap.add_argument("--update-baseline", action="store_true")
+    args = ap.parse_args()
+
+    # รอบแรก compile .pyc ทิ้งก่อน ไม่นับ
+    import_once()
+    res = measure(args.runs, args.top)
+    print(f"import bot: {res['import_ms']}ms ({res['modules']} modules, best of {args.runs})")
+    for name, ms in res["top"].items():
+        print(f"  {ms:>8.1f}ms  {name}")
+
+    problems = [f"{m} is imported eagerly (should load on first use)" for m in res["eager_lazy"]]
+
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"meta": {"python": platform.python_version()}, **res}, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"baseline updated: {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            base = json.load(f)
+        b, c = base["import_ms"], res["import_ms"]
+        print(f"baseline: {b}ms")
+        if c > b * (1 + TIME_TOLERANCE) and c - b > TIME_FLOOR_MS:
+            problems.append(f"import_ms {b} -> {c}")
+
+    for p in problems:
+        print("REGRESSION", p)
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
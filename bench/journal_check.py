@@ -0,0 +1,200 @@
+"""
+Checks for the local write journal: replay order, upsert coalescing, keeping
+entries through outage error codes, single attempts for non-idempotent RPCs,
+dropping rows the DB rejects, and spend / daily claim waiting for queued writes.
+
+Runs bot.py's DB helpers against bench/fake_supabase.FakeSupabase; an outage
+is simulated with failure_rate=1 (errors without a SQLSTATE, like a timeout).
+
+    python bench/journal_check.py
+
+Exits with status 1 if a check fails.
+"""
+import os
+import sys
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from fake_supabase import FakeAPIError, FakeSupabase  # noqa: E402
+from run_bench import install, load_bot  # noqa: E402
+
+GID = 10_000
+
+
+class CheckedSupabase(FakeSupabase):
+    """FakeSupabase with a CHECK (points >= 0) on users, answered with a SQLSTATE like Postgres."""
+
+    def _execute(self, q):
+        if q._table == "users" and q._op in ("insert", "upsert"):
+            rows = q._payload if isinstance(q._payload, list) else [q._payload]
+            if any(int(r.get("points", 0)) < 0 for r in rows):
+                self._simulate_network((q._table, q._op))
+                raise FakeAPIError("violates check constraint users_points_check", code="23514")
+        return super()._execute(q)
+
+
+def fresh(botmod) -> CheckedSupabase:
+    db = CheckedSupabase()
+    install(botmod, db)
+    # breaker ไม่ต้องพัก: กลับมาใช้ได้ทันทีที่ "DB กลับมา"
+    botmod._breaker = botmod.CircuitBreaker(botmod.DB_BREAKER_THRESHOLD, 0)
+    return db
+
+
+def points(db, uid: int):
+    row = db.tables.get("users", {}).get((GID, uid))
+    return None if row is None else row["points"]
+
+
+def check_replay_order(botmod):
+    db = fresh(botmod)
+    botmod.set_points(GID, 1, 100)
+    db.failure_rate = 1.0
+    botmod.set_points(GID, 1, 10)     # journal
+    botmod.add_points(GID, 1, 5)      # ต้องต่อท้าย set (ไม่ใช่ยิงตรง)
+    botmod.set_points(GID, 2, 7)
+    botmod.add_points(GID, 2, 1)
+    assert botmod._journal.depth() == 4, f"depth={botmod._journal.depth()}"
+    assert points(db, 1) == 100
+    db.failure_rate = 0.0
+    applied = botmod.replay_journal()
+    assert applied == 4, f"applied={applied}"
+    assert points(db, 1) == 15, f"user 1 = {points(db, 1)} (want 15: set 10 then +5)"
+    assert points(db, 2) == 8, f"user 2 = {points(db, 2)}"
+    assert botmod._journal.depth() == 0
+
+
+def check_write_queues_behind_backlog(botmod):
+    db = fresh(botmod)
+    db.failure_rate = 1.0
+    botmod.set_points(GID, 1, 10)
+    db.failure_rate = 0.0
+    # DB กลับมาแล้ว แต่ journal ยังไม่ replay → งานใหม่ต้องต่อคิว ไม่แซง
+    res = botmod.add_points(GID, 1, 5)
+    assert res == (None, None), f"add_points ran directly: {res}"
+    assert points(db, 1) is None
+    botmod.replay_journal()
+    assert points(db, 1) == 15, f"user 1 = {points(db, 1)}"
+
+
+def check_kept_while_postgrest_down(botmod):
+    db = fresh(botmod)
+    db.failure_rate = 1.0
+    for code in ("PGRST000", "PGRST002", "08006", "53300", "57014", "57P01", "40001", "XX000"):
+        db.failure_code = code        # PostgREST ตอบ แต่ Postgres ใช้ไม่ได้ → ต้องเก็บไว้ ไม่ใช่ทิ้ง
+        botmod.set_points(GID, 1, 10)
+        try:
+            botmod.replay_journal()
+        except Exception:
+            pass
+        assert botmod._journal.depth() == 1, f"{code}: depth={botmod._journal.depth()} (entry dropped)"
+        botmod._journal.delete([rid for rid, _, _ in botmod._journal.peek(10)])
+    botmod.set_points(GID, 1, 10)
+    db.failure_rate = 0.0
+    assert botmod.replay_journal() == 1
+    assert points(db, 1) == 10, f"user 1 = {points(db, 1)}"
+
+
+def check_rpc_not_retried(botmod):
+    db = fresh(botmod)
+    db.failure_rate = 1.0
+    db.reset_calls()
+    botmod.set_points(GID, 2, 5)
+    assert db.calls[("users", "upsert")] == 2, f"upserts={db.calls[('users', 'upsert')]} (idempotent: retried)"
+    botmod._journal.delete([rid for rid, _, _ in botmod._journal.peek(10)])
+    # timeout อาจเกิดหลัง commit → rpc เพิ่มแต้มห้ามยิงซ้ำทันที ให้ journal รับไป
+    assert botmod.add_points(GID, 1, 5) == (None, None)
+    assert db.calls[("rpc:aura_add_points", "rpc")] == 1, f"rpc calls={db.calls[('rpc:aura_add_points', 'rpc')]}"
+    assert botmod._journal.depth() == 1
+
+
+def check_coalescing(botmod):
+    db = fresh(botmod)
+    db.failure_rate = 1.0
+    botmod.set_points(GID, 1, 1)
+    botmod.set_points(GID, 2, 2)
+    botmod.set_points(GID, 1, 3)      # ชนกับแถวแรก → ตัวหลังชนะ
+    botmod.add_points(GID, 2, 10)     # rpc คั่น → แยกก้อน
+    botmod.set_points(GID, 3, 4)
+    db.failure_rate = 0.0
+    db.reset_calls()
+    applied = botmod.replay_journal()
+    assert applied == 5, f"applied={applied}"
+    upserts = db.calls[("users", "upsert")]
+    rpcs = db.calls[("rpc:aura_add_points", "rpc")]
+    assert upserts == 2, f"users upserts={upserts} (want 2: [1,2,1] merged, then [3])"
+    assert rpcs == 1, f"rpcs={rpcs}"
+    assert (points(db, 1), points(db, 2), points(db, 3)) == (3, 12, 4), \
+        f"points={(points(db, 1), points(db, 2), points(db, 3))}"
+
+
+def check_rejected_row_dropped(botmod):
+    db = fresh(botmod)
+    db.failure_rate = 1.0
+    botmod.set_points(GID, 1, 5)
+    botmod.set_points(GID, 2, -1)     # DB ไม่รับ (CHECK) → ทิ้งเฉพาะแถวนี้
+    botmod.set_points(GID, 3, 6)
+    db.failure_rate = 0.0
+    botmod.replay_journal()
+    assert botmod._journal.depth() == 0, f"depth={botmod._journal.depth()}"
+    assert (points(db, 1), points(db, 2), points(db, 3)) == (5, None, 6), \
+        f"points={(points(db, 1), points(db, 2), points(db, 3))}"
+
+
+def check_spend_waits_for_journal(botmod):
+    db = fresh(botmod)
+    botmod.set_points(GID, 1, 100)
+    db.failure_rate = 1.0
+    botmod.set_points(GID, 1, 10)     # admin ตั้งแต้มตอน DB ล่ม
+    res = botmod.spend_points(GID, 1, 3)
+    assert res is botmod.SYNCING, f"spend during outage -> {res}"
+    db.failure_rate = 0.0
+    res = botmod.spend_points(GID, 1, 3)   # drain journal ก่อน แล้วค่อยหัก
+    assert res == (True, 10, 7), f"spend after recovery -> {res}"
+    botmod.replay_journal()
+    assert points(db, 1) == 7, f"user 1 = {points(db, 1)} (queued set overwrote the spend)"
+
+
+def check_daily_waits_for_journal(botmod):
+    db = fresh(botmod)
+    db.failure_rate = 1.0
+    botmod.set_points(GID, 1, 50)
+    assert botmod.claim_daily(GID, 1, 20) is botmod.SYNCING
+    db.failure_rate = 0.0
+    res = botmod.claim_daily(GID, 1, 20)
+    assert res and res["claimed"] and (res["before"], res["after"]) == (50, 70), f"claim -> {res}"
+    assert points(db, 1) == 70, f"user 1 = {points(db, 1)}"
+
+
+CHECKS = [
+    check_replay_order,
+    check_write_queues_behind_backlog,
+    check_kept_while_postgrest_down,
+    check_rpc_not_retried,
+    check_coalescing,
+    check_rejected_row_dropped,
+    check_spend_waits_for_journal,
+    check_daily_waits_for_journal,
+]
+
+
+def main():
+    botmod = load_bot()
+    if botmod.WRITE_BEHIND:
+        sys.exit("journal_check runs in direct-write mode (unset WRITE_BEHIND)")
+    ok = True
+    for fn in CHECKS:
+        try:
+            fn(botmod)
+            print(f"PASS {fn.__name__}")
+        except AssertionError as e:
+            ok = False
+            print(f"FAIL {fn.__name__}: {e}")
+    print("PASS" if ok else "FAIL")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
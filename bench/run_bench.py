@@ -0,0 +1,319 @@
+"""
+Offline benchmarks for bot.py's hot paths (no Supabase or Discord connection).
+
+bot.py is imported against bench/fake_supabase.FakeSupabase (with simulated
+network latency) and the fake guilds / members / interactions in bench/fixtures.py.
+Every scenario reports DB calls, wall time, event-loop blocking time and
+p50 / p99 latency (per guild for voice ticks, per click for buttons).
+
+    python bench/run_bench.py                    # run all, compare with bench/baseline.json
+    python bench/run_bench.py --quick            # small scenarios only
+    python bench/run_bench.py -k voice           # scenarios whose name contains "voice"
+    python bench/run_bench.py --update-baseline  # store this run as the new baseline
+    WRITE_BEHIND=1 python bench/run_bench.py     # same scenarios in write-behind mode
+
+Exits with status 1 when a scenario regressed against the baseline: more DB
+calls, or wall / p99 time that grew after normalizing both runs by a CPU
+calibration loop (so a slower box does not fail an unchanged tree).
+loop_blocked_ms is reported but not gated: it is a sum of scheduler noise
+that varies several-fold between runs on the same machine.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from fake_supabase import FakeSupabase  # noqa: E402
+from fixtures import FakeBot, FakeGuild, FakeInteraction, build_voice_world  # noqa: E402
+
+BASELINE_PATH = os.path.join(BENCH_DIR, "baseline.json")
+
+# เวลาถือว่า regress: ช้ากว่า baseline เกิน TIME_TOLERANCE และเกิน TIME_FLOOR_MS
+TIME_TOLERANCE = 0.25
+TIME_FLOOR_MS = 50.0
+# db_calls แกว่งได้นิดหน่อย (cache miss พร้อมกันตอน burst แรก)
+CALLS_TOLERANCE = 0.05
+# เวลาที่ใช้ตัดสิน regress (หลังปรับด้วย calibration); loop_blocked_ms แค่รายงาน
+GATED_TIMES = ("wall_ms", "p99_ms")
+
+
+def calibrate(rounds: int = 5) -> float:
+    """ms for a fixed pure-Python workload (best of `rounds`): how fast this box runs bot.py's CPU work."""
+    best = None
+    for _ in range(rounds):
+        t0 = time.perf_counter()
+        d = {}
+        for i in range(200_000):
+            d[i % 1000] = d.get(i % 1000, 0) + i
+        sorted(str(v) for v in d.values())
+        ms = (time.perf_counter() - t0) * 1000
+        best = ms if best is None else min(best, ms)
+    return round(best, 2)
+
+
+def load_bot():
+    """Import bot.py (its Supabase client is built lazily, install() hands it a FakeSupabase)."""
+    os.environ.setdefault("JOURNAL_PATH", ":memory:")
+    import bot as botmod
+    return botmod
+
+
+def install(botmod, db: FakeSupabase, guilds=()):
+    """Point bot.py at a fresh fake DB / fake guild list and drop every in-memory cache."""
+    botmod._supabase = db
+    botmod.bot = FakeBot(list(guilds))
+    botmod._settings_cache.clear()
+    botmod._voice_cache["allowed"].clear()
+    botmod._gacha_tables.clear()
+    botmod._voice_sessions.clear()
+    botmod._voice_states.clear()
+    botmod._wb_users.clear()
+    botmod._wb_voice.clear()
+    botmod._click_buckets.clear()
+    botmod._click_inflight.clear()
+    botmod._leaderboards.clear()
+    botmod._leaderboard_loading.clear()
+    botmod._gacha_history_buf.clear()
+    botmod._journal = botmod.WriteJournal(":memory:")
+    botmod._breaker = botmod.CircuitBreaker(botmod.DB_BREAKER_THRESHOLD, botmod.DB_BREAKER_COOLDOWN)
+
+
+class LoopMonitor:
+    """Measures how long the event loop was blocked (sleep overshoot beyond `interval`)."""
+
+    def __init__(self, interval: float = 0.002, threshold: float = 0.001):
+        self.interval = interval
+        self.threshold = threshold
+        self.blocked = 0.0
+        self.worst = 0.0
+        self._task = None
+
+    async def _run(self):
+        while True:
+            t0 = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = time.perf_counter() - t0 - self.interval
+            if lag > self.threshold:
+                self.blocked += lag
+                self.worst = max(self.worst, lag)
+
+    async def __aenter__(self):
+        self._task = asyncio.create_task(self._run())
+        await asyncio.sleep(0)
+        return self
+
+    async def __aexit__(self, *exc):
+        self._task.cancel()
+
+
+def percentile(values, p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = min(len(values) - 1, max(0, int(round(p / 100 * (len(values) - 1)))))
+    return values[k]
+
+
+def result(db: FakeSupabase, wall: float, mon: LoopMonitor, latencies, **extra) -> dict:
+    return {
+        "db_calls": db.total_calls(),
+        "wall_ms": round(wall * 1000, 1),
+        "loop_blocked_ms": round(mon.blocked * 1000, 1),
+        "loop_worst_stall_ms": round(mon.worst * 1000, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        **extra,
+    }
+
+
+# ======================
+# Scenarios
+# ======================
+def _voice_world(botmod, latency, guild_count: int, members_per_guild: int):
+    guilds, channel_rows = build_voice_world(guild_count, members_per_guild)
+    db = FakeSupabase(latency=latency)
+    db.seed("voice_channels", channel_rows)
+    # ครบ 2 นาทีได้รางวัล → tick ที่วัดมีจ่ายแต้มด้วย
+    db.seed("settings", [{"guild_id": g.id, "key": "voice_reward_minutes", "value": "2"} for g in guilds])
+    install(botmod, db, guilds)
+    return db, guilds
+
+
+def _age_voice(botmod, db, seconds: float):
+    """A minute passes: move last_tick back both in the DB and in the in-memory voice state."""
+    db.age_column("voice_progress", "last_tick_utc", seconds)
+    for state in botmod._voice_states.values():
+        for i in range(len(state)):
+            state.last_tick[i] -= seconds
+
+
+async def voice_tick_scenario(botmod, latency, guild_count: int, members_per_guild: int):
+    db, guilds = _voice_world(botmod, latency, guild_count, members_per_guild)
+
+    # tick แรก: โหลด settings / ห้อง / สร้างแถว voice_progress
+    # แล้ว tick ต่ออีก VOICE_STATE_VERIFY_TICKS รอบจนแถวผ่านการ re-read → tick ที่วัดคือ steady state
+    # (ปัดเป็นจำนวนคี่ ให้ tick ที่วัดตกนาทีคู่ = มีจ่ายแต้ม)
+    warm = 1 + botmod.VOICE_STATE_VERIFY_TICKS
+    for _ in range(warm + 1 - warm % 2):
+        await botmod.run_for_guilds("BENCH", botmod._tick_guild_voice)
+        _age_voice(botmod, db, 60)
+    db.reset_calls()
+
+    async with LoopMonitor() as mon:
+        t0 = time.perf_counter()
+        per_guild = await botmod.run_for_guilds("BENCH", botmod._tick_guild_voice)
+        wall = time.perf_counter() - t0
+
+    members = sum(res[0] for _, res in per_guild.values() if res)
+    rewarded = sum(len(res[1]) for _, res in per_guild.values() if res)
+    return result(db, wall, mon, [t for t, _ in per_guild.values()], members=members, rewarded=rewarded)
+
+
+async def first_tick_scenario(botmod, latency, guild_count: int, members_per_guild: int, warm: bool):
+    """First voice tick after a restart, with or without the startup warm_up() in front of it."""
+    db, guilds = _voice_world(botmod, latency, guild_count, members_per_guild)
+
+    async with LoopMonitor() as mon:
+        t0 = time.perf_counter()
+        if warm:
+            await botmod.warm_up()
+            # warm_up start voice loop ไว้ → หยุดก่อนมันได้รัน แล้ว tick เองข้างล่าง (จะได้วัดได้)
+            botmod.voice_tick.cancel()
+            botmod.voice_checkpoint.cancel()
+        per_guild = await botmod.run_for_guilds("BENCH", botmod._tick_guild_voice)
+        wall = time.perf_counter() - t0
+
+    members = sum(res[0] for _, res in per_guild.values() if res)
+    return result(db, wall, mon, [t for t, _ in per_guild.values()], members=members)
+
+
+def _click_world(db, users: int, points: int):
+    g = FakeGuild()
+    members = [g.add_member() for _ in range(users)]
+    db.seed("users", [{"guild_id": g.id, "user_id": m.id, "points": points} for m in members])
+    return g, members
+
+
+async def click_scenario(botmod, latency, view_cls, item_name: str, users: int, clicks_per_user: int):
+    db = FakeSupabase(latency=latency)
+    g, members = _click_world(db, users, points=1000)
+    install(botmod, db, [g])
+    item = getattr(view_cls(), item_name)
+
+    latencies = []
+
+    async def click(member):
+        inter = FakeInteraction(g, member, custom_id=item.custom_id)
+        t0 = time.perf_counter()
+        await item.callback(inter)
+        latencies.append(time.perf_counter() - t0)
+        return inter
+
+    async with LoopMonitor() as mon:
+        t0 = time.perf_counter()
+        inters = await asyncio.gather(*(click(m) for m in members for _ in range(clicks_per_user)))
+        wall = time.perf_counter() - t0
+
+    errors = sum(1 for i in inters if any("ผิดพลาด" in (msg or "") for msg in i.messages))
+    acks = [i.acked_at - i.created_at for i in inters if i.acked_at is not None]
+    return result(db, wall, mon, latencies, clicks=len(inters), errors=errors,
+                  p99_ack_ms=round(percentile(acks, 99) * 1000, 1))
+
+
+def scenarios(quick: bool):
+    out = {
+        "voice_tick_1k": lambda b, lat: voice_tick_scenario(b, lat, 10, 100),
+        "first_tick_cold_1k": lambda b, lat: first_tick_scenario(b, lat, 10, 100, warm=False),
+        "first_tick_warm_1k": lambda b, lat: first_tick_scenario(b, lat, 10, 100, warm=True),
+        "daily_burst_200": lambda b, lat: click_scenario(b, lat, b.DailyView, "daily_btn", 200, 1),
+        "daily_double_click_200": lambda b, lat: click_scenario(b, lat, b.DailyView, "daily_btn", 100, 2),
+        "roll_burst_200": lambda b, lat: click_scenario(b, lat, b.RollView, "roll_btn", 100, 2),
+        "checkpoints_burst_200": lambda b, lat: click_scenario(b, lat, b.RollView, "checkpoints_btn", 200, 1),
+        "leaderboard_burst_200": lambda b, lat: click_scenario(b, lat, b.RollView, "leaderboard_btn", 200, 1),
+    }
+    if not quick:
+        out.update({
+            "voice_tick_10k": lambda b, lat: voice_tick_scenario(b, lat, 50, 200),
+            "voice_tick_50k": lambda b, lat: voice_tick_scenario(b, lat, 100, 500),
+            "daily_burst_1000": lambda b, lat: click_scenario(b, lat, b.DailyView, "daily_btn", 1000, 1),
+            "roll_burst_1000": lambda b, lat: click_scenario(b, lat, b.RollView, "roll_btn", 500, 2),
+        })
+    return out
+
+
+# ======================
+# Baseline
+# ======================
+def compare(current: dict, baseline: dict, scale: float = 1.0) -> list:
+    """scale = this run's calibration / the baseline's: baseline times are multiplied by it first."""
+    problems = []
+    for name, cur in current.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        if cur["db_calls"] > base["db_calls"] * (1 + CALLS_TOLERANCE):
+            problems.append(f"{name}: db_calls {base['db_calls']} -> {cur['db_calls']}")
+        for key in GATED_TIMES:
+            b, c = base.get(key, 0.0) * scale, cur.get(key, 0.0)
+            if c > b * (1 + TIME_TOLERANCE) and c - b > TIME_FLOOR_MS:
+                problems.append(f"{name}: {key} {b:.1f} (normalized) -> {c}")
+    return problems
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--quick", action="store_true")
+    ap.add_argument("-k", dest="keyword", default="")
+    ap.add_argument("--latency-ms", type=float, default=10.0, help="simulated Supabase round trip")
+    ap.add_argument("--baseline", default=BASELINE_PATH)
+    ap.add_argument("--update-baseline", action="store_true")
+    args = ap.parse_args()
+
+    botmod = load_bot()
+    latency = args.latency_ms / 1000
+    calibration_ms = calibrate()
+    print(f"calibration {calibration_ms}ms")
+
+    current = {}
+    for name, make in scenarios(args.quick).items():
+        if args.keyword not in name:
+            continue
+        res = asyncio.run(make(botmod, latency))
+        current[name] = res
+        print(f"{name:<24} " + " ".join(f"{k}={v}" for k, v in res.items()), flush=True)
+
+    baseline, base_meta = {}, {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            data = json.load(f)
+        baseline, base_meta = data.get("scenarios", {}), data.get("meta", {})
+
+    if args.update_baseline:
+        merged = {**baseline, **current}
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({
+                "meta": {"python": platform.python_version(), "latency_ms": args.latency_ms,
+                         "calibration_ms": calibration_ms},
+                "scenarios": merged,
+            }, f, indent=2, ensure_ascii=False, sort_keys=True)
+            f.write("\n")
+        print(f"baseline updated: {args.baseline}")
+        return
+
+    # baseline เก่าที่ไม่มี calibration: เทียบตรงๆ
+    scale = calibration_ms / base_meta["calibration_ms"] if base_meta.get("calibration_ms") else 1.0
+    problems = compare(current, baseline, scale)
+    for p in problems:
+        print("REGRESSION", p)
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Memory / throughput of the poll-mode voice state: GuildVoiceState (parallel
+arrays) against the old dict-per-row tick (select("*") rows every minute).
+
+    python bench/voice_state_bench.py                 # 10k and 100k members
+    python bench/voice_state_bench.py -n 50000 --ticks 20
+
+Per size it reports the memory held between ticks, the peak allocated during
+one tick and the tick throughput (members per second). No DB is involved:
+the dict side gets fresh row dicts the way the select returned them.
+"""
+import argparse
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from voicestate import GuildVoiceState  # noqa: E402
+
+GUILD_ID = 1
+REWARD_MINUTES = 60
+MUTE_LIMIT = 30
+
+
+def make_rows(n: int, seed: int) -> list:
+    rng = random.Random(seed)
+    ts = datetime(2024, 1, 1, tzinfo=timezone.utc).isoformat()
+    return [{
+        "guild_id": GUILD_ID,
+        "user_id": 10**17 + i,
+        "channel_id": 10**17 + rng.randrange(20),
+        "active_minutes": rng.randrange(REWARD_MINUTES),
+        "muted_streak_minutes": rng.randrange(MUTE_LIMIT),
+        "last_tick_utc": ts,
+    } for i in range(n)]
+
+
+def make_present(rows: list, seed: int) -> list:
+    """(user_id, channel_id, is_muted) of everyone, ~10% muted."""
+    rng = random.Random(seed)
+    return [(r["user_id"], r["channel_id"], rng.random() < 0.1) for r in rows]
+
+
+def dict_tick(select_rows: list, present: list) -> list:
+    """The old tick: {user_id: row} from the select, then one pass building update tuples."""
+    rows = {int(r["user_id"]): r for r in select_rows}
+    updates = []
+    for uid, ch_id, is_muted in present:
+        row = rows.get(uid) or {}
+        active = int(row.get("active_minutes") or 0)
+        muted_streak = int(row.get("muted_streak_minutes") or 0)
+        if is_muted:
+            muted_streak += 1
+            if muted_streak >= MUTE_LIMIT:
+                active = 0
+        else:
+            muted_streak = 0
+            active += 1
+            if active >= REWARD_MINUTES:
+                active = 0
+        updates.append((uid, ch_id, active, muted_streak))
+    return updates
+
+
+def state_tick(state: GuildVoiceState, present: list, now: float) -> list:
+    updated, _, _ = state.tick(present, now, REWARD_MINUTES, MUTE_LIMIT, 0)
+    return state.updates(updated)
+
+
+def measure(fn, ticks: int):
+    """(seconds per tick, peak bytes allocated by one tick)."""
+    gc.collect()
+    tracemalloc.start()
+    fn(0)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    t0 = time.perf_counter()
+    for i in range(ticks):
+        fn(i + 1)
+    return (time.perf_counter() - t0) / ticks, peak
+
+
+def held(build):
+    """Bytes still allocated after build() returns its object (kept alive until measured)."""
+    gc.collect()
+    tracemalloc.start()
+    obj = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del obj
+    return size
+
+
+def run(n: int, ticks: int, seed: int) -> dict:
+    rows = make_rows(n, seed)
+    present = make_present(rows, seed + 1)
+
+    # dict: แถวที่ select มาทุกรอบ (ถือไว้ระหว่าง tick ถ้าจะ cache แบบเดิม)
+    dict_held = held(lambda: {int(r["user_id"]): dict(r) for r in rows})
+    dict_sec, dict_peak = measure(lambda i: dict_tick([dict(r) for r in rows], present), ticks)
+
+    def build_state():
+        st = GuildVoiceState()
+        for r in rows:
+            st.load(r["user_id"], r)
+        return st
+
+    state_held = held(build_state)
+    state = build_state()
+    base = time.time()
+    state_sec, state_peak = measure(lambda i: state_tick(state, present, base + 60 * i), ticks)
+
+    return {
+        "members": n,
+        "dict": {"held_mb": dict_held / 2**20, "tick_peak_mb": dict_peak / 2**20, "tick_ms": dict_sec * 1000,
+                 "members_per_s": n / dict_sec},
+        "state": {"held_mb": state_held / 2**20, "tick_peak_mb": state_peak / 2**20, "tick_ms": state_sec * 1000,
+                  "members_per_s": n / state_sec, "array_mb": state.nbytes() / 2**20},
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("-n", type=int, action="append", help="members (repeatable, default 10000 and 100000)")
+    ap.add_argument("--ticks", type=int, default=10)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    for n in args.n or [10_000, 100_000]:
+        res = run(n, args.ticks, args.seed)
+        print(f"members={n}")
+        for name in ("dict", "state"):
+            r = res[name]
+            print(
+                f"  {name:<6} held={r['held_mb']:.1f}MB tick_peak={r['tick_peak_mb']:.1f}MB "
+                f"tick={r['tick_ms']:.1f}ms ({r['members_per_s']:,.0f} members/s)"
+                + (f" arrays={r['array_mb']:.1f}MB" if "array_mb" in r else "")
+            )
+        d, s = res["dict"], res["state"]
+        print(f"  state vs dict: held x{d['held_mb'] / s['held_mb']:.1f} smaller, "
+              f"tick peak x{d['tick_peak_mb'] / s['tick_peak_mb']:.1f} smaller, "
+              f"tick x{d['tick_ms'] / s['tick_ms']:.1f} faster", flush=True)
+
+
+if __name__ == "__main__":
+    main()
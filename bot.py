@@ -1,22 +1,32 @@
 import os
-import random
+import io
+import csv
+import math
+import tempfile
 import asyncio
+import time
+import signal
+import functools
+import threading
+import contextvars
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 from zoneinfo import ZoneInfo
 
 import discord
 from discord.ext import commands, tasks
 from dotenv import load_dotenv
-from supabase import create_client, Client
 
-
-# ==============
-# Optional keep-alive (Railway/health)
-# ==============
-try:
-    from myserver import server_on
-except Exception:
-    server_on = None
+import metrics
+import tracing
+from gacha import GACHA_REWARDS, AliasTable
+from journal import WriteJournal
+from leaderboard import Leaderboards
+from logdispatch import LogDispatcher
+from writebehind import RowCache
+from profiler import LoopWatchdog, sample_stacks
+from voicestate import GuildVoiceState
 
 
 # ======================
@@ -30,13 +40,29 @@ DISCORD_TOKEN = os.getenv("DISCORD_TOKEN")
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 
-# ❗ กันเคส ENV ไม่ครบแล้วรันมั่ว (ทำให้เอ๋อ/รีสตาร์ทวน)
-if not DISCORD_TOKEN:
-    raise RuntimeError("Missing DISCORD_TOKEN in environment")
-if not SUPABASE_URL or not SUPABASE_KEY:
-    raise RuntimeError("Missing SUPABASE_URL / SUPABASE_KEY in environment")
-
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+def check_env():
+    # ❗ กันเคส ENV ไม่ครบแล้วรันมั่ว (ทำให้เอ๋อ/รีสตาร์ทวน) — เช็คตอน start ไม่ใช่ตอน import
+    if not DISCORD_TOKEN:
+        raise RuntimeError("Missing DISCORD_TOKEN in environment")
+    if not SUPABASE_URL or not SUPABASE_KEY:
+        raise RuntimeError("Missing SUPABASE_URL / SUPABASE_KEY in environment")
+    if SHARD_COUNT < 1 or not 0 <= SHARD_ID < SHARD_COUNT:
+        raise RuntimeError(f"Invalid SHARD_ID={SHARD_ID} / SHARD_COUNT={SHARD_COUNT}")
+
+# Supabase client สร้างตอนใช้ครั้งแรก (import supabase หนัก ~0.5s) — setup_hook อุ่นไว้ระหว่างต่อ gateway
+_supabase = None
+_supabase_lock = threading.Lock()
+
+def get_supabase():
+    global _supabase
+    if _supabase is None:
+        with _supabase_lock:
+            if _supabase is None:
+                if not SUPABASE_URL or not SUPABASE_KEY:
+                    raise RuntimeError("Missing SUPABASE_URL / SUPABASE_KEY in environment")
+                from supabase import create_client
+                _supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+    return _supabase
 
 # ค่ามาตรฐานที่จะใช้ถ้าในฐานข้อมูลยังไม่ได้ตั้งค่า
 DEFAULT_DAILY_AMOUNT = 10
@@ -44,17 +70,73 @@ DEFAULT_ROLL_COST = 10
 DEFAULT_VOICE_REWARD_MINUTES = 60
 DEFAULT_VOICE_REWARD_POINTS = 10
 DEFAULT_VOICE_MUTE_LIMIT_MIN = 30
+GACHA_MULTI_ROLL = 10
+
+# write-behind: เก็บแต้ม / voice_progress ไว้ในหน่วยความจำแล้วค่อย flush เป็นก้อน
+# (ใช้ได้เมื่อ process นี้เป็นคนเขียนตาราง users / voice_progress คนเดียว)
+WRITE_BEHIND = os.getenv("WRITE_BEHIND", "0") == "1"
+WRITE_BEHIND_FLUSH_SECONDS = float(os.getenv("WRITE_BEHIND_FLUSH_SECONDS", "5"))  # เสียข้อมูลได้มากสุดเท่านี้ถ้า process ตาย
+WRITE_BEHIND_MAX_ROWS = int(os.getenv("WRITE_BEHIND_MAX_ROWS", "50000"))          # ต่อกิลด์ ต่อตาราง (LRU)
+WRITE_BEHIND_BATCH = int(os.getenv("WRITE_BEHIND_BATCH", "500"))
+
+# gacha_history: flush บัฟเฟอร์ทุกกี่วินาที / แถวต่อ 1 RPC
+GACHA_HISTORY_FLUSH_SECONDS = float(os.getenv("GACHA_HISTORY_FLUSH_SECONDS", "5"))
+GACHA_HISTORY_BATCH = int(os.getenv("GACHA_HISTORY_BATCH", "500"))
+GACHA_HISTORY_PAGE = 10
+
+# tracing: handler ที่ช้ากว่านี้ log span breakdown / event loop ค้างเกินนี้ log stack (ms)
+SLOW_HANDLER_MS = float(os.getenv("SLOW_HANDLER_MS", "1000"))
+LOOP_STALL_MS = float(os.getenv("LOOP_STALL_MS", "250"))
+PROFILE_MAX_SECONDS = 60
+
+# leaderboard: ต่อหน้า / จำนวนกิลด์ที่เก็บ index ไว้ในหน่วยความจำ (LRU)
+LEADERBOARD_PAGE = 10
+LEADERBOARD_MAX_GUILDS = int(os.getenv("LEADERBOARD_MAX_GUILDS", "200"))
+
+# log channel: รวมข้อความทุกกี่วินาที / คิวสูงสุดต่อห้อง (เกินแล้วทิ้ง)
+LOG_FLUSH_SECONDS = float(os.getenv("LOG_FLUSH_SECONDS", "1.5"))
+LOG_QUEUE_MAX = int(os.getenv("LOG_QUEUE_MAX", "1000"))
+# จำนวน thread สูงสุดที่ใช้ยิง Supabase (กันยิงพร้อมกันเยอะเกิน)
+DB_MAX_WORKERS = int(os.getenv("DB_MAX_WORKERS", "8"))
+
+# cache settings ทั้งกิลด์ (วินาที / จำนวนกิลด์สูงสุด)
+SETTINGS_CACHE_TTL = int(os.getenv("SETTINGS_CACHE_TTL", "300"))
+SETTINGS_CACHE_MAX_GUILDS = int(os.getenv("SETTINGS_CACHE_MAX_GUILDS", "1000"))
+
+# โหมดนับเวลาห้องเสียง: "poll" = voice_tick ทุกนาที, "events" = ตาม on_voice_state_update
+VOICE_TRACKING_MODE = os.getenv("VOICE_TRACKING_MODE", "poll").lower()
+# โหมด events: บันทึก voice_progress ลง DB ทุกกี่นาที (นอกจากตอนออกห้อง/ได้รางวัล)
+VOICE_PERSIST_MINUTES = int(os.getenv("VOICE_PERSIST_MINUTES", "10"))
+# voice_tick: ทำพร้อมกันได้กี่กิลด์ / คิว DM แจ้งรางวัล
+VOICE_TICK_CONCURRENCY = int(os.getenv("VOICE_TICK_CONCURRENCY", "8"))
+DM_QUEUE_MAX = int(os.getenv("DM_QUEUE_MAX", "5000"))
+DM_WORKERS = int(os.getenv("DM_WORKERS", "2"))
+
+# /readyz: เกณฑ์ความพร้อม
+READY_MAX_LATENCY = float(os.getenv("READY_MAX_LATENCY", "10"))      # วินาที (gateway heartbeat)
+READY_MAX_TICK_AGE = float(os.getenv("READY_MAX_TICK_AGE", "180"))   # วินาทีนับจาก tick ที่สำเร็จล่าสุด
+DB_PROBE_SECONDS = int(os.getenv("DB_PROBE_SECONDS", "15"))
+
+# sharding: รันหลาย process แต่ละตัวถือกิลด์ของ shard ตัวเอง (ดู run_shards.py)
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "1"))
+SHARD_ID = int(os.getenv("SHARD_ID", "0"))
+# voice_tick: แถวที่มี process อื่นเพิ่ง tick ไป (เช่น shard เก่ายังไม่ปิดตอน restart) ข้ามรอบนี้ กันได้แต้มซ้ำ
+# ต้องยาวกว่ารอบ tick (60 วิ) → ตราบใดที่อีก process ยัง tick อยู่ เราถอยให้ทุกรอบ ไม่นับซ้อนกัน
+VOICE_TICK_MIN_GAP = float(os.getenv("VOICE_TICK_MIN_GAP", "90"))
+# voice_tick: อ่านแถวซ้ำทุกรอบจนกว่า DB จะตรงกับที่เราเขียนติดกันกี่รอบ (จับ process อื่นที่ tick คนเดียวกัน)
+VOICE_STATE_VERIFY_TICKS = int(os.getenv("VOICE_STATE_VERIFY_TICKS", "3"))
+# voice_tick: คนที่ออกจากห้องเกินกี่วินาทีถึงทิ้ง state ในหน่วยความจำ (กลับมาค่อยอ่านจาก DB ใหม่)
+VOICE_STATE_IDLE_SECONDS = float(os.getenv("VOICE_STATE_IDLE_SECONDS", "900"))
+
+# circuit breaker: ล้มติดกันกี่ครั้งถึงหยุดยิง DB / พักกี่วินาทีก่อนลองใหม่
+DB_BREAKER_THRESHOLD = int(os.getenv("DB_BREAKER_THRESHOLD", "5"))
+DB_BREAKER_COOLDOWN = float(os.getenv("DB_BREAKER_COOLDOWN", "15"))
+# journal ในเครื่อง: งานเขียนที่ DB รับไม่ได้จะรอ replay อยู่ที่นี่ (ไฟล์ SQLite)
+JOURNAL_PATH = os.getenv("JOURNAL_PATH", "aura_journal.db" if SHARD_COUNT == 1 else f"aura_journal.shard{SHARD_ID}.db")
+JOURNAL_REPLAY_SECONDS = float(os.getenv("JOURNAL_REPLAY_SECONDS", "5"))
+JOURNAL_REPLAY_BATCH = int(os.getenv("JOURNAL_REPLAY_BATCH", "500"))
+JOURNAL_BACKOFF_MAX = float(os.getenv("JOURNAL_BACKOFF_MAX", "300"))
 
-GACHA_REWARDS = [
-    {"name": "สกินสุดแรร์ทอมแอนเจอรี่", "rate": 0.2},
-    {"name": "สกินสุดแรร์ชีส", "rate": 0.2},
-    {"name": "อาหารหมูกระทะ 6 ชม.", "rate": 3},
-    {"name": "เงินเขียว 10,000.-", "rate": 3},
-    {"name": "เงินเขียว 8,000.-", "rate": 5},
-    {"name": "เงินเขี่ยว 4,000.-", "rate": 8.8},
-    {"name": "เหรียญออนไลน์ 1 เหรียญ", "rate": 5},
-    {"name": "เสียใจด้วยคุณไม่ได้รางวัลร้องไห้สะสิ", "rate": 74.8},
-]
 
 
 # ======================
@@ -65,7 +147,91 @@ intents.message_content = True   # ต้องเปิดใน Discord Dev Po
 intents.members = True           # ต้องเปิดใน Discord Dev Portal ด้วย (SERVER MEMBERS INTENT)
 intents.voice_states = True
 
-bot = commands.Bot(command_prefix="!", intents=intents)
+class AuraBot(commands.Bot):
+    async def setup_hook(self):
+        # รอบแรกของ db_probe สร้าง Supabase client + เปิด connection ไว้ ระหว่างที่ gateway กำลังต่อ
+        if not db_probe.is_running():
+            db_probe.start()
+        # health server รันใน event loop เดียวกับบอท (ไม่ใช้ thread แยก) / ไม่มี myserver ก็ข้าม
+        self.health_runner = None
+        try:
+            from myserver import server_on
+            self.health_runner = await server_on(readiness)
+        except ImportError:
+            pass
+        except Exception as e:
+            print("[HEALTH-ERROR]", type(e).__name__, e)
+        if WRITE_BEHIND and not write_behind_flush.is_running():
+            write_behind_flush.start()
+        if not journal_replay.is_running():
+            journal_replay.start()
+        if not gacha_history_flush.is_running():
+            gacha_history_flush.start()
+        self.loop_watchdog = LoopWatchdog(LOOP_STALL_MS, on_stall=_record_loop_stall)
+        self.loop_watchdog.start()
+        # bot.run() จับแค่ KeyboardInterrupt → SIGTERM ตอน deploy/stop ต้องผ่าน close() ให้ flush ก่อนออก
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            try:
+                loop.add_signal_handler(sig, self._on_stop_signal, sig)
+            except (NotImplementedError, RuntimeError):
+                pass  # Windows / ไม่ใช่ main thread
+
+    def _on_stop_signal(self, sig):
+        print(f"[SHUTDOWN] {signal.Signals(sig).name} → ปิดบอท (flush ก่อนออก)")
+        asyncio.create_task(self.close())
+
+    async def invoke(self, ctx):
+        # ทุกคำสั่ง ! มี trace ของตัวเอง (log span ถ้าช้าเกิน SLOW_HANDLER_MS)
+        with tracing.trace(f"cmd {ctx.command}", SLOW_HANDLER_MS):
+            await super().invoke(ctx)
+
+    async def close(self):
+        # close() ถูกเรียกได้หลายทาง (signal, bot.run ตอนจบ) → ทำงานปิดจริงครั้งเดียว
+        task = getattr(self, "_close_task", None)
+        if task is None:
+            task = self._close_task = asyncio.ensure_future(self._close_once())
+        await asyncio.shield(task)
+
+    async def _close_once(self):
+        # ส่ง log ที่ค้างก่อน (ต้องใช้ HTTP ของ Discord ที่ยังไม่ปิด)
+        try:
+            await log_dispatcher.close()
+        except Exception as e:
+            print("[LOG-ERROR]", e)
+        if getattr(self, "health_runner", None):
+            await self.health_runner.cleanup()
+        if getattr(self, "loop_watchdog", None):
+            self.loop_watchdog.stop()
+        await super().close()
+        gacha_history_flush.cancel()
+        try:
+            await run_db(flush_gacha_history)
+        except Exception as e:
+            print("[GACHA-HISTORY ERROR] final flush", type(e).__name__, e)
+        if WRITE_BEHIND:
+            write_behind_flush.cancel()
+            try:
+                flushed = await run_db(flush_write_behind)
+                print(f"[WRITE_BEHIND] final flush: {flushed} rows")
+            except Exception as e:
+                print("[WRITE_BEHIND ERROR] final flush", type(e).__name__, e)
+
+def shard_for(guild_id: int) -> int:
+    """Discord's guild -> shard mapping."""
+    return (guild_id >> 22) % SHARD_COUNT
+
+def owns_guild(guild_id: int) -> bool:
+    return SHARD_COUNT == 1 or shard_for(guild_id) == SHARD_ID
+
+def owned_guilds() -> list:
+    return [g for g in bot.guilds if owns_guild(g.id)]
+
+if SHARD_COUNT > 1:
+    bot = AuraBot(command_prefix="!", intents=intents, shard_id=SHARD_ID, shard_count=SHARD_COUNT)
+    metrics.set_const_labels(shard=SHARD_ID)
+else:
+    bot = AuraBot(command_prefix="!", intents=intents)
 
 
 # ======================
@@ -74,111 +240,555 @@ bot = commands.Bot(command_prefix="!", intents=intents)
 def _sb_err(label: str, e: Exception):
     print(f"[SB-ERROR] {label}: {type(e).__name__}: {e}")
 
+# metrics (/metrics บน keep-alive server)
+DB_CALLS = metrics.Counter("aura_db_calls_total", "Supabase call attempts")
+DB_LATENCY = metrics.Histogram("aura_db_latency_seconds", "Supabase call latency per label", ("label",))
+DB_ERRORS = metrics.Counter("aura_db_errors_total", "Supabase call attempts that raised", ("label",))
+DB_RETRIES = metrics.Counter("aura_db_retries_total", "Supabase call retries", ("label",))
+DB_FAILURES = metrics.Counter("aura_db_failures_total", "Supabase calls that failed after every retry", ("label",))
+DB_IN_FLIGHT = metrics.Gauge("aura_db_in_flight", "Supabase calls currently running")
+DB_EXECUTOR_QUEUED = metrics.Gauge("aura_db_executor_queued", "DB jobs waiting for an executor thread")
+DB_EXECUTOR_RUNNING = metrics.Gauge("aura_db_executor_running", "DB jobs running on the executor")
+
+# executor แยกสำหรับ DB — event loop ของ Discord ไม่ต้องรอ HTTP เอง
+_db_executor = ThreadPoolExecutor(max_workers=DB_MAX_WORKERS, thread_name_prefix="supabase")
+
+def db_stats() -> dict:
+    """Snapshot of the DB executor: jobs waiting for a worker and jobs currently running."""
+    return {
+        "queued": DB_EXECUTOR_QUEUED.value(),
+        "in_flight": DB_EXECUTOR_RUNNING.value(),
+        "workers": DB_MAX_WORKERS,
+    }
+
+def sb_call_count() -> int:
+    return DB_CALLS.value()
+
+async def run_db(fn, *args, **kwargs):
+    """
+    Run a blocking DB helper on the bounded DB executor.
+    """
+    def job():
+        # รอ thread ว่างนานแค่ไหน (แยกจากเวลายิง DB จริง)
+        tracing.record("db queue", time.perf_counter() - submitted)
+        DB_EXECUTOR_QUEUED.dec()
+        DB_EXECUTOR_RUNNING.inc()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            DB_EXECUTOR_RUNNING.dec()
+
+    DB_EXECUTOR_QUEUED.inc()
+    submitted = time.perf_counter()
+    # copy context → span ที่เกิดใน thread ของ DB ไปลง trace ของ handler ที่เรียก
+    ctx = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(_db_executor, ctx.run, job)
+
+def _sb_attempt(label: str, fn, attempt: int):
+    """One instrumented call (latency / errors / retries / in-flight), gated by the circuit breaker."""
+    if not _breaker.allow():
+        DB_SHORT_CIRCUITS.inc(label)
+        raise CircuitOpenError(label)
+    DB_CALLS.inc()
+    if attempt:
+        DB_RETRIES.inc(label)
+    DB_IN_FLIGHT.inc()
+    t0 = time.perf_counter()
+    try:
+        with tracing.span(f"db {label}"):
+            res = fn()
+    except Exception as e:
+        DB_ERRORS.inc(label)
+        if _is_outage(e):
+            _breaker.record_failure()
+        else:
+            _breaker.record_success()
+        raise
+    finally:
+        DB_LATENCY.observe(label, value=time.perf_counter() - t0)
+        DB_IN_FLIGHT.dec()
+    _breaker.record_success()
+    return res
+
 async def sb_async(label: str, fn, retries: int = 3, base_delay: float = 0.6):
     """
-    Run blocking Supabase calls in a thread with retries.
+    Run blocking Supabase calls on the DB executor with retries.
     Never crashes the whole process.
     """
     for attempt in range(retries):
         try:
-            return await asyncio.to_thread(fn)
+            return await run_db(_sb_attempt, label, fn, attempt)
+        except CircuitOpenError:
+            return None
         except Exception as e:
             _sb_err(label, e)
             # retry with backoff
             if attempt < retries - 1:
                 await asyncio.sleep(base_delay * (2 ** attempt))
             else:
+                DB_FAILURES.inc(label)
                 return None
 
 def sb_sync(label: str, fn, retries: int = 2):
     """
     Sync version for very simple paths (still guarded).
     """
-    last = None
-    for _ in range(retries):
+    for attempt in range(retries):
         try:
-            return fn()
+            return _sb_attempt(label, fn, attempt)
+        except CircuitOpenError:
+            return None
         except Exception as e:
-            last = e
             _sb_err(label, e)
+    DB_FAILURES.inc(label)
     return None
 
 
+# ======================
+# Circuit breaker (DB ล่ม → หยุดยิงชั่วคราว ให้คำสั่งตอบ error ทันทีแทนการรอ timeout)
+# ======================
+class CircuitOpenError(Exception):
+    """Raised instead of calling Supabase while the breaker is open."""
+
+class CircuitBreaker:
+    """
+    closed -> open after `threshold` consecutive outage errors. After `cooldown`
+    seconds a single trial call is let through (half_open); its result closes
+    or re-opens the breaker.
+    """
+    STATES = ("closed", "open", "half_open")
+
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = max(1, threshold)
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.opened = 0
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.cooldown:
+                self.state = "half_open"
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self.state = "closed"
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == "half_open" or (self.state == "closed" and self._failures >= self.threshold):
+                if self.state == "closed":
+                    print(f"[DB-BREAKER] open after {self._failures} failures (retry in {self.cooldown:.0f}s)")
+                    self.opened += 1
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+# code ที่ตอบกลับมาก็จริง แต่แปลว่าตัว DB มีปัญหา: PostgREST ต่อ Postgres ไม่ได้ / internal error
+_OUTAGE_CODES = ("PGRST000", "PGRST001", "PGRST002", "PGRST003", "XX000")
+# SQLSTATE class: 08 connection, 53 resources (too many connections), 57 timeout / shutdown, 40 serialization / deadlock
+_OUTAGE_CLASSES = ("08", "53", "57", "40")
+# ข้อมูลผิดแน่ๆ ส่งซ้ำกี่รอบก็ไม่ผ่าน: 22 data exception, 23 constraint, 42 syntax / undefined column
+_DATA_ERROR_CLASSES = ("22", "23", "42")
+
+def _error_code(e: Exception):
+    code = getattr(e, "code", None)
+    return code if isinstance(code, str) else None
+
+def _is_outage(e: Exception) -> bool:
+    """False when Postgres / PostgREST answered with an error about the request (bad query, unique violation): the DB is up."""
+    code = _error_code(e)
+    if not code or code in _OUTAGE_CODES:
+        return True
+    if len(code) == 5:
+        return code[:2] in _OUTAGE_CLASSES
+    return not code.startswith("PGRST")
+
+def _is_data_error(e: Exception) -> bool:
+    """The DB refused the write itself (bad value, constraint, schema): retrying it can never succeed."""
+    code = _error_code(e)
+    return code is not None and len(code) == 5 and code[:2] in _DATA_ERROR_CLASSES
+
+_breaker = CircuitBreaker(DB_BREAKER_THRESHOLD, DB_BREAKER_COOLDOWN)
+DB_SHORT_CIRCUITS = metrics.Counter("aura_db_short_circuits_total", "Supabase calls refused while the breaker was open", ("label",))
+metrics.CallbackMetric(
+    "aura_db_breaker_state", "Circuit breaker state (1 = current)",
+    lambda: {(st,): int(_breaker.state == st) for st in CircuitBreaker.STATES}, ("state",),
+)
+metrics.CallbackMetric(
+    "aura_db_breaker_opened_total", "Times the breaker opened", lambda: {(): _breaker.opened}, kind="counter",
+)
+
+
+# ======================
+# Write journal (เขียน DB ไม่ได้ → เก็บลง SQLite ในเครื่อง แล้ว replay ตามลำดับ)
+# ======================
+JOURNALED = object()  # ผลของ db_write เมื่องานถูกเก็บลง journal แทน
+SYNCING = object()    # หัก/รับแต้มตรงไม่ได้ เพราะยังมีงานเขียนค้างใน journal (ลำดับจะผิด)
+
+_journal = WriteJournal(JOURNAL_PATH)
+_replay_lock = threading.Lock()
+_replay_state = {"backoff": 0.0, "next_at": 0.0}
+
+JOURNAL_APPENDS = metrics.Counter("aura_journal_appends_total", "Writes deferred to the local journal", ("label",))
+JOURNAL_REPLAYED = metrics.Counter("aura_journal_replayed_total", "Journal entries applied to Supabase")
+JOURNAL_DROPPED = metrics.Counter("aura_journal_dropped_total", "Journal entries the DB rejected (logged, then dropped)")
+metrics.CallbackMetric("aura_journal_depth", "Entries waiting in the local journal", lambda: {(): _journal.depth()})
+metrics.CallbackMetric(
+    "aura_journal_lag_seconds", "Age of the oldest journal entry", lambda: {(): round(_journal.lag_seconds(), 3)},
+)
+
+def journal_stats() -> dict:
+    return {
+        "depth": _journal.depth(),
+        "lag_seconds": round(_journal.lag_seconds(), 1),
+        "breaker": _breaker.state,
+        "retry_in": round(max(0.0, _replay_state["next_at"] - time.monotonic()), 1),
+    }
+
+def _exec_write(entry: dict):
+    if entry["kind"] == "upsert":
+        return get_supabase().table(entry["table"]).upsert(entry["rows"], on_conflict=entry["on_conflict"]).execute()
+    if entry["kind"] == "rpc":
+        return get_supabase().rpc(entry["fn"], entry["params"]).execute()
+    raise ValueError(f"unknown journal entry kind: {entry['kind']}")
+
+def db_write(label: str, entry: dict):
+    """
+    Write that must survive a DB outage. entry is {"kind": "upsert", "table", "rows", "on_conflict"}
+    or {"kind": "rpc", "fn", "params"}. While the journal has a backlog the write queues behind it
+    (keeps order); otherwise it is tried directly and journaled if the call fails.
+    Upserts are retried; RPCs (point increments, gacha records) are not idempotent and get a
+    single attempt -- a timeout after the commit must not credit twice right away.
+    Returns the response, or JOURNALED.
+    """
+    if _journal.depth() == 0:
+        res = sb_sync(label, lambda: _exec_write(entry), retries=2 if entry["kind"] == "upsert" else 1)
+        if res is not None:
+            return res
+    _journal.append(label, entry)
+    JOURNAL_APPENDS.inc(label)
+    return JOURNALED
+
+def _coalesce(entries: list):
+    """
+    Merge consecutive upserts into the same table (same columns) into one call, last write
+    per key winning -- Postgres refuses an upsert that touches the same row twice.
+    Yields (ids, label, entry).
+    """
+    group = None
+    for rid, label, entry in entries:
+        if entry["kind"] == "upsert":
+            rows = entry["rows"] if isinstance(entry["rows"], list) else [entry["rows"]]
+            shape = (entry["table"], entry["on_conflict"], frozenset(rows[0]) if rows else None)
+            if group and group[0] == shape:
+                group[1].append(rid)
+                group[2].extend(rows)
+                continue
+            if group:
+                yield _merged(group)
+            group = (shape, [rid], list(rows), label)
+            continue
+        if group:
+            yield _merged(group)
+            group = None
+        yield [rid], label, entry
+    if group:
+        yield _merged(group)
+
+def _merged(group):
+    (table, on_conflict, _), ids, rows, label = group
+    keys = on_conflict.split(",")
+    by_key = {}
+    for row in rows:
+        by_key[tuple(row.get(k) for k in keys)] = row
+    return ids, label, {"kind": "upsert", "table": table, "rows": list(by_key.values()), "on_conflict": on_conflict}
+
+def replay_journal() -> int:
+    """
+    Apply journaled writes oldest first until the journal is empty. Stops (raises) at the
+    first error; only an entry the DB rejects as bad data (_is_data_error) is logged and
+    dropped so it cannot block the rest -- anything else stays queued for the next replay.
+    Returns the number of entries applied.
+    """
+    applied = 0
+    with _replay_lock:
+        while True:
+            entries = _journal.peek(JOURNAL_REPLAY_BATCH)
+            if not entries:
+                return applied
+            for ids, label, entry in _coalesce(entries):
+                try:
+                    _sb_attempt(f"replay {label}", lambda: _exec_write(entry), 0)
+                except Exception as e:
+                    if not _is_data_error(e):
+                        raise
+                    if len(ids) > 1:
+                        # ก้อนที่รวมกันมีแถวที่ DB ไม่รับ → ส่งทีละรายการแทน
+                        for rid, one_label, one in entries:
+                            if rid in ids:
+                                _replay_one(rid, one_label, one)
+                                applied += 1
+                        continue
+                    print(f"[JOURNAL-DROP] {label}: {type(e).__name__}: {e} entry={entry}")
+                    JOURNAL_DROPPED.inc()
+                _journal.delete(ids)
+                JOURNAL_REPLAYED.inc(amount=len(ids))
+                applied += len(ids)
+
+def _replay_one(rid: int, label: str, entry: dict):
+    try:
+        _sb_attempt(f"replay {label}", lambda: _exec_write(entry), 0)
+        JOURNAL_REPLAYED.inc()
+    except Exception as e:
+        if not _is_data_error(e):
+            raise
+        print(f"[JOURNAL-DROP] {label}: {type(e).__name__}: {e} entry={entry}")
+        JOURNAL_DROPPED.inc()
+    _journal.delete([rid])
+
+def journal_drained(label: str) -> bool:
+    """
+    Direct read-modify-write RPCs (spend / daily claim) must not run ahead of journaled
+    writes: a queued absolute set_points replayed later would overwrite their result.
+    Tries to drain the journal first; True when nothing is waiting anymore.
+    """
+    if _journal.depth() == 0:
+        return True
+    try:
+        replay_journal()
+    except Exception as e:
+        print(f"[JOURNAL] {label} รอก่อน: ยังค้าง {_journal.depth()} งาน ({type(e).__name__})")
+    return _journal.depth() == 0
+
+@tasks.loop(seconds=JOURNAL_REPLAY_SECONDS)
+async def journal_replay():
+    if not _journal.depth() or time.monotonic() < _replay_state["next_at"]:
+        return
+    lag = _journal.lag_seconds()
+    try:
+        applied = await run_db(replay_journal)
+        _replay_state["backoff"] = 0.0
+        print(f"[JOURNAL] replayed {applied} writes (oldest waited {lag:.0f}s)")
+    except Exception as e:
+        # exponential backoff (breaker ก็กันไม่ให้ยิงถี่อยู่แล้ว)
+        backoff = min(JOURNAL_BACKOFF_MAX, max(JOURNAL_REPLAY_SECONDS, _replay_state["backoff"] * 2))
+        _replay_state["backoff"] = backoff
+        _replay_state["next_at"] = time.monotonic() + backoff
+        if not isinstance(e, CircuitOpenError):
+            _sb_err("journal replay", e)
+        print(f"[JOURNAL] {_journal.depth()} writes waiting, retry in {backoff:.0f}s")
+
+
 # ======================
 # DB helpers (Supabase)
 # ======================
+# ======================
+# Guild settings cache (โหลดทั้งกิลด์ทีเดียว, TTL + LRU)
+# ======================
+_settings_cache = OrderedDict()  # guild_id -> (loaded_at_monotonic, {key: value})
+_settings_lock = threading.Lock()
+_settings_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+def settings_cache_stats() -> dict:
+    with _settings_lock:
+        return {**_settings_stats, "guilds": len(_settings_cache)}
+
+metrics.CallbackMetric(
+    "aura_settings_cache_total", "Guild settings cache lookups / evictions",
+    lambda: {(k,): v for k, v in settings_cache_stats().items() if k != "guilds"}, ("result",), kind="counter",
+)
+
+def _settings_lookup(guild_id: int):
+    """Return the cached {key: value} for a guild, or None on miss/expiry."""
+    with _settings_lock:
+        item = _settings_cache.get(guild_id)
+        if item and (time.monotonic() - item[0]) < SETTINGS_CACHE_TTL:
+            _settings_cache.move_to_end(guild_id)
+            _settings_stats["hits"] += 1
+            return item[1]
+        _settings_stats["misses"] += 1
+        return None
+
+def _settings_store(guild_id: int, values: dict):
+    with _settings_lock:
+        _settings_cache[guild_id] = (time.monotonic(), values)
+        _settings_cache.move_to_end(guild_id)
+        while len(_settings_cache) > SETTINGS_CACHE_MAX_GUILDS:
+            _settings_cache.popitem(last=False)
+            _settings_stats["evictions"] += 1
+
+def load_guild_settings(guild_id: int):
+    """Load every settings key of a guild in one query and cache it. Returns {} on failure (not cached)."""
+    res = sb_sync(
+        "load_guild_settings",
+        lambda: get_supabase().table("settings").select("key,value").eq("guild_id", guild_id).execute()
+    )
+    if res is None:
+        return {}
+    values = {r["key"]: r.get("value") for r in (getattr(res, "data", None) or [])}
+    _settings_store(guild_id, values)
+    return values
+
+def get_guild_settings(guild_id: int) -> dict:
+    cached = _settings_lookup(guild_id)
+    if cached is not None:
+        return cached
+    return load_guild_settings(guild_id)
+
 def set_setting(guild_id: int, key: str, value: str):
     # settings ควร unique (guild_id, key)
-    return sb_sync(
-        f"set_setting {key}",
-        lambda: supabase.table("settings").upsert(
-            {"guild_id": guild_id, "key": key, "value": str(value)},
-            on_conflict="guild_id,key"
-        ).execute()
-    )
+    res = db_write(f"set_setting {key}", {
+        "kind": "upsert", "table": "settings", "on_conflict": "guild_id,key",
+        "rows": {"guild_id": guild_id, "key": key, "value": str(value)},
+    })
+    # write-through: อัปเดต cache ทันที (รวมถึงตอนที่รอ replay จาก journal)
+    with _settings_lock:
+        item = _settings_cache.get(guild_id)
+        if item:
+            item[1][key] = str(value)
+    return res
 
 def get_setting(guild_id: int, key: str, default=None):
-    res = sb_sync(
-        f"get_setting {key}",
-        lambda: supabase.table("settings").select("value").eq("guild_id", guild_id).eq("key", key).execute()
-    )
-    if res and getattr(res, "data", None):
-        return res.data[0].get("value", default)
-    return default
+    return get_guild_settings(guild_id).get(key, default)
+
+# ======================
+# Leaderboard index (helper ที่รู้ยอดแต้มล่าสุดส่งเข้า index ทุกครั้ง)
+# ======================
+_leaderboards = Leaderboards(LEADERBOARD_MAX_GUILDS)
+_leaderboard_loading = {}  # guild_id -> asyncio.Task ที่กำลัง seed
+
+metrics.CallbackMetric(
+    "aura_leaderboard_index", "Guilds / users held by the leaderboard index",
+    lambda: {(k,): v for k, v in _leaderboards.stats().items()}, ("stat",),
+)
+
+def _ranked(balances):
+    """
+    Report the balances a points helper returns to the leaderboard index.
+    balances(args_after_guild_id, result) -> {user_id: points}; points=None means unknown.
+    """
+    def deco(fn):
+        @functools.wraps(fn)
+        def wrapper(guild_id, *args):
+            res = fn(guild_id, *args)
+            try:
+                for uid, pts in balances(args, res).items():
+                    _leaderboards.update(guild_id, uid, pts)
+            except Exception as e:
+                print("[LEADERBOARD-ERROR]", type(e).__name__, e)
+            return res
+        return wrapper
+    return deco
 
 def get_points(guild_id: int, user_id: int) -> int:
+    if WRITE_BEHIND:
+        return _wb_get_points(guild_id, user_id)
     res = sb_sync(
         "get_points",
-        lambda: supabase.table("users").select("points").eq("guild_id", guild_id).eq("user_id", user_id).execute()
+        lambda: get_supabase().table("users").select("points").eq("guild_id", guild_id).eq("user_id", user_id).execute()
     )
     if not res or not getattr(res, "data", None):
         # create row
         sb_sync(
             "users insert",
-            lambda: supabase.table("users").insert(
+            lambda: get_supabase().table("users").insert(
                 {"guild_id": guild_id, "user_id": user_id, "points": 0}
             ).execute()
         )
         return 0
     return int(res.data[0].get("points") or 0)
 
+@_ranked(lambda a, res: {a[0]: a[1]})
 def set_points(guild_id: int, user_id: int, points: int):
+    if WRITE_BEHIND:
+        return _wb_set_points(guild_id, user_id, points)
     # users ต้อง unique (guild_id, user_id)
-    sb_sync(
-        "set_points",
-        lambda: supabase.table("users").upsert(
-            {"guild_id": guild_id, "user_id": user_id, "points": int(points)},
-            on_conflict="guild_id,user_id"
-        ).execute()
-    )
+    db_write("set_points", {
+        "kind": "upsert", "table": "users", "on_conflict": "guild_id,user_id",
+        "rows": {"guild_id": guild_id, "user_id": user_id, "points": int(points)},
+    })
 
+@_ranked(lambda a, res: {a[0]: res[1]} if res else {})
 def add_points(guild_id: int, user_id: int, amount: int):
-    before = get_points(guild_id, user_id)
-    after = before + int(amount)
-    set_points(guild_id, user_id, after)
-    return before, after
+    """
+    Atomic server-side increment (sql/001_point_functions.sql: aura_add_points).
+    Returns (before, after); (None, None) if the DB is down and the increment
+    was journaled for replay; None if the call returned nothing.
+    """
+    if WRITE_BEHIND:
+        return _wb_add_points(guild_id, user_id, amount)
+    res = db_write("add_points", {
+        "kind": "rpc", "fn": "aura_add_points",
+        "params": {"p_guild_id": guild_id, "p_user_id": user_id, "p_amount": int(amount)},
+    })
+    if res is JOURNALED:
+        return None, None
+    if not res or not getattr(res, "data", None):
+        return None
+    row = res.data[0]
+    return int(row["points_before"]), int(row["points_after"])
 
-def can_claim_daily(guild_id: int, user_id: int) -> bool:
-    today = datetime.now(TH_TZ).strftime("%Y-%m-%d")
+@_ranked(lambda a, res: {a[0]: res[2]} if res and res is not SYNCING else {})
+def spend_points(guild_id: int, user_id: int, cost: int):
+    """
+    Conditional debit: subtract cost only if balance >= cost (aura_spend_points).
+    Returns (ok, before, after), SYNCING while journaled writes are still waiting,
+    or None if the DB call failed.
+    """
+    if WRITE_BEHIND:
+        return _wb_spend_points(guild_id, user_id, cost)
+    if not journal_drained("spend_points"):
+        return SYNCING
     res = sb_sync(
-        "can_claim_daily",
-        lambda: supabase.table("users").select("last_daily").eq("guild_id", guild_id).eq("user_id", user_id).execute()
+        "spend_points",
+        lambda: get_supabase().rpc(
+            "aura_spend_points",
+            {"p_guild_id": guild_id, "p_user_id": user_id, "p_cost": int(cost)}
+        ).execute(),
+        retries=1,  # หักซ้ำได้ถ้า retry หลัง commit ไปแล้ว
     )
     if not res or not getattr(res, "data", None):
-        return True
-    return (res.data[0].get("last_daily") != today)
+        return None
+    row = res.data[0]
+    return bool(row["ok"]), int(row["points_before"]), int(row["points_after"])
 
-def set_daily_claimed(guild_id: int, user_id: int):
+@_ranked(lambda a, res: {a[0]: res["after"]} if res and res is not SYNCING else {})
+def claim_daily(guild_id: int, user_id: int, amount: int):
+    """
+    Check last_daily against today's Bangkok date, credit points and stamp the
+    claim in one atomic call (sql/003_claim_daily.sql: aura_claim_daily).
+    Returns {"claimed", "before", "after"}, SYNCING while journaled writes are still
+    waiting, or None if the DB call failed.
+    """
     today = datetime.now(TH_TZ).strftime("%Y-%m-%d")
-    sb_sync(
-        "set_daily_claimed",
-        lambda: supabase.table("users").update({"last_daily": today}).eq("guild_id", guild_id).eq("user_id", user_id).execute()
+    if WRITE_BEHIND:
+        return _wb_claim_daily(guild_id, user_id, amount, today)
+    if not journal_drained("claim_daily"):
+        return SYNCING
+    res = sb_sync(
+        "claim_daily",
+        lambda: get_supabase().rpc(
+            "aura_claim_daily",
+            {"p_guild_id": guild_id, "p_user_id": user_id, "p_amount": int(amount), "p_today": today}
+        ).execute()
     )
+    if not res or not getattr(res, "data", None):
+        return None
+    row = res.data[0]
+    return {"claimed": bool(row["claimed"]), "before": int(row["points_before"]), "after": int(row["points_after"])}
 
 def list_voice_channels(guild_id: int):
     res = sb_sync(
         "list_voice_channels",
-        lambda: supabase.table("voice_channels").select("channel_id").eq("guild_id", guild_id).execute()
+        lambda: get_supabase().table("voice_channels").select("channel_id").eq("guild_id", guild_id).execute()
     )
     if not res or not getattr(res, "data", None):
         return []
@@ -190,53 +800,602 @@ def list_voice_channels(guild_id: int):
             pass
     return ids
 
-def get_or_create_voice_progress(guild_id: int, user_id: int):
+
+# ======================
+# Bulk DB helpers (voice_tick ยิงทีละกิลด์ ไม่ใช่ทีละคน)
+# ======================
+# PostgREST ส่ง in_() ผ่าน URL — แบ่งก้อนกัน URL ยาวเกิน
+BULK_IN_CHUNK = 200
+# RPC / upsert ส่งใน body จึงก้อนใหญ่กว่าได้
+BULK_RPC_CHUNK = 500
+
+def _chunks(items, size: int):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def get_voice_progress_bulk(guild_id: int, user_ids):
+    """
+    Fetch voice_progress rows for many users with in_() selects.
+    Returns {user_id: row}; users without a row are simply absent.
+    Returns None if any select fails, so callers never overwrite progress with zeros.
+    """
+    if WRITE_BEHIND:
+        return _wb_get_voice_progress_bulk(guild_id, list(user_ids))
+    ids = list(user_ids)
+    rows = {}
+    for chunk in _chunks(ids, BULK_IN_CHUNK):
+        res = sb_sync(
+            "get_voice_progress_bulk",
+            lambda chunk=chunk: get_supabase().table("voice_progress").select("*").eq("guild_id", guild_id).in_("user_id", chunk).execute()
+        )
+        if res is None:
+            return None
+        for r in (getattr(res, "data", None) or []):
+            rows[int(r["user_id"])] = r
+    return rows
+
+def update_voice_progress_bulk(guild_id: int, updates, tick_at: datetime = None):
+    """
+    updates: iterable of (user_id, channel_id, active_minutes, muted_streak).
+    Writes every row back in one multi-row upsert, stamped with tick_at (default now).
+    """
+    now_iso = (tick_at or datetime.now(timezone.utc)).isoformat()
+    payload = [{
+        "guild_id": guild_id,
+        "user_id": uid,
+        "channel_id": ch_id,
+        "active_minutes": int(active),
+        "muted_streak_minutes": int(muted),
+        "last_tick_utc": now_iso,
+    } for uid, ch_id, active, muted in updates]
+    if not payload:
+        return
+    if WRITE_BEHIND:
+        return _wb_update_voice_rows(guild_id, payload)
+    db_write("update_voice_progress_bulk", {
+        "kind": "upsert", "table": "voice_progress", "rows": payload, "on_conflict": "guild_id,user_id",
+    })
+
+@_ranked(lambda a, res: {uid: after for uid, (_, after) in res.items()} if res else {})
+def add_points_bulk(guild_id: int, amounts: dict):
+    """
+    amounts: {user_id: amount}. Atomic server-side increments (aura_add_points_bulk),
+    one RPC per BULK_RPC_CHUNK users.
+    Returns {user_id: (before, after)}; users of a chunk that was journaled get
+    (None, None). Returns None if a chunk came back empty.
+    """
+    if WRITE_BEHIND:
+        return _wb_add_points_bulk(guild_id, amounts)
+    ids = list(amounts)
+    result = {}
+    for chunk in _chunks(ids, BULK_RPC_CHUNK):
+        res = db_write("add_points_bulk", {
+            "kind": "rpc", "fn": "aura_add_points_bulk",
+            "params": {
+                "p_guild_id": guild_id,
+                "p_user_ids": chunk,
+                "p_amounts": [int(amounts[uid]) for uid in chunk],
+            },
+        })
+        if res is JOURNALED:
+            result.update((uid, (None, None)) for uid in chunk)
+            continue
+        if res is None:
+            return None
+        for r in (getattr(res, "data", None) or []):
+            uid = int(r["user_id"])
+            after = int(r["points_after"])
+            result[uid] = (after - int(amounts[uid]), after)
+    return result
+
+
+@_ranked(lambda a, res: dict(a[0]) if res else {})
+def set_points_bulk(guild_id: int, balances: dict) -> bool:
+    """
+    balances: {user_id: points}. Absolute balances written as multi-row upserts of
+    BULK_RPC_CHUNK rows (journaled if the DB is down). False if write-behind could not load the rows.
+    """
+    if WRITE_BEHIND:
+        return _wb_set_points_bulk(guild_id, balances)
+    ids = list(balances)
+    for chunk in _chunks(ids, BULK_RPC_CHUNK):
+        db_write("set_points_bulk", {
+            "kind": "upsert", "table": "users", "on_conflict": "guild_id,user_id",
+            "rows": [{"guild_id": guild_id, "user_id": uid, "points": int(balances[uid])} for uid in chunk],
+        })
+    return True
+
+
+# ======================
+# CSV import / export (!importpoints / !exportpoints)
+# ======================
+IMPORT_MAX_ROWS = 100_000
+EXPORT_PAGE = 1000
+
+def parse_points_csv(data: bytes, mode: str):
+    """
+    Parse user_id,points lines (header optional). Duplicate users: last wins for
+    mode "set", summed for mode "add". Returns ({user_id: points}, [bad line numbers]).
+    """
+    balances, bad = {}, []
+    reader = csv.reader(io.StringIO(data.decode("utf-8-sig", errors="replace")))
+    for lineno, row in enumerate(reader, 1):
+        if not row or not "".join(row).strip():
+            continue
+        try:
+            uid, pts = int(row[0].strip()), int(row[1].strip())
+            if uid <= 0:
+                raise ValueError
+        except (ValueError, IndexError):
+            if lineno != 1:  # บรรทัดแรกอาจเป็น header
+                bad.append(lineno)
+            continue
+        balances[uid] = balances.get(uid, 0) + pts if mode == "add" else pts
+        if len(balances) > IMPORT_MAX_ROWS:
+            bad.append(lineno)
+            break
+    return balances, bad
+
+def export_points_csv(guild_id: int):
+    """
+    Stream the guild's users rows into a temp file, EXPORT_PAGE rows at a time with
+    keyset pagination (user_id > last seen) so memory stays flat.
+    Returns (file positioned at 0, row count), or None on DB failure.
+    """
+    fp = tempfile.TemporaryFile()
+    text = io.TextIOWrapper(fp, encoding="utf-8", newline="")
+    writer = csv.writer(text)
+    writer.writerow(["user_id", "points"])
+    # write-behind: แต้มที่ยังไม่ flush ใหม่กว่าใน DB
+    pending = {uid: int(r["points"]) for uid, r in _wb_users.dirty_rows(guild_id).items()} if WRITE_BEHIND else {}
+    last, count = 0, 0
+    while True:
+        res = sb_sync(
+            "export_points",
+            lambda: get_supabase().table("users").select("user_id,points").eq("guild_id", guild_id)
+            .gt("user_id", last).order("user_id").limit(EXPORT_PAGE).execute()
+        )
+        if res is None:
+            text.close()
+            return None
+        page = getattr(res, "data", None) or []
+        for r in page:
+            uid = int(r["user_id"])
+            writer.writerow([uid, pending.pop(uid, int(r.get("points") or 0))])
+        count += len(page)
+        if len(page) < EXPORT_PAGE:
+            break
+        last = int(page[-1]["user_id"])
+    for uid, pts in sorted(pending.items()):
+        writer.writerow([uid, pts])
+        count += 1
+    text.flush()
+    text.detach()
+    fp.seek(0)
+    return fp, count
+
+
+# ======================
+# Write-behind mode (WRITE_BEHIND=1)
+# ======================
+_wb_users = RowCache("users", WRITE_BEHIND_MAX_ROWS)            # row: {points, last_daily}
+_wb_voice = RowCache("voice_progress", WRITE_BEHIND_MAX_ROWS)   # row: คอลัมน์เดียวกับตาราง
+_wb_flush_lock = threading.Lock()
+
+def write_behind_stats() -> dict:
+    return {"users": _wb_users.stats(), "voice_progress": _wb_voice.stats()}
+
+metrics.CallbackMetric(
+    "aura_write_behind", "Write-behind cache counters (rows / dirty are current sizes)",
+    lambda: {(table, k): v for table, st in write_behind_stats().items() for k, v in st.items()},
+    ("table", "stat"),
+)
+
+def _wb_load_users(guild_id: int, user_ids):
+    """
+    Read balances that are not cached yet. Returns {user_id: row} for them
+    (absent users get 0 points), or None if the DB read failed.
+    """
+    missing = _wb_users.missing(guild_id, list(user_ids))
+    loaded = {}
+    for chunk in _chunks(missing, BULK_IN_CHUNK):
+        res = sb_sync(
+            "wb load users",
+            lambda chunk=chunk: get_supabase().table("users").select("user_id,points,last_daily").eq("guild_id", guild_id).in_("user_id", chunk).execute()
+        )
+        if res is None:
+            return None
+        found = {int(r["user_id"]): r for r in (getattr(res, "data", None) or [])}
+        for uid in chunk:
+            r = found.get(uid) or {}
+            loaded[uid] = {"points": int(r.get("points") or 0), "last_daily": r.get("last_daily")}
+    return loaded
+
+def _wb_user_mutate(guild_id: int, user_id: int, fn):
+    try:
+        return _wb_users.mutate(guild_id, user_id, fn)
+    except KeyError:
+        pass
+    loaded = _wb_load_users(guild_id, [user_id])
+    if loaded is None:
+        return None
+    # ถ้าระหว่างโหลดมีแถวที่ใหม่กว่าเข้ามาแล้ว mutate จะใช้แถวนั้นแทน default
+    return _wb_users.mutate(guild_id, user_id, fn, default=loaded.get(user_id) or {"points": 0, "last_daily": None})
+
+def _wb_get_points(guild_id: int, user_id: int) -> int:
+    res = _wb_user_mutate(guild_id, user_id, lambda r: (r["points"], False))
+    return res or 0
+
+def _wb_set_points(guild_id: int, user_id: int, points: int):
+    return _wb_user_mutate(guild_id, user_id, lambda r: (r.update(points=int(points)), True))
+
+def _wb_set_points_bulk(guild_id: int, balances: dict) -> bool:
+    loaded = _wb_load_users(guild_id, balances)
+    if loaded is None:
+        return False
+    for uid, pts in balances.items():
+        _wb_users.mutate(
+            guild_id, uid, lambda r, pts=pts: (r.update(points=int(pts)), True),
+            default=loaded.get(uid) or {"points": 0, "last_daily": None},
+        )
+    return True
+
+def _wb_add(row: dict, amount: int):
+    before = row["points"]
+    row["points"] = before + int(amount)
+    return (before, row["points"]), True
+
+def _wb_add_points(guild_id: int, user_id: int, amount: int):
+    return _wb_user_mutate(guild_id, user_id, lambda r: _wb_add(r, amount))
+
+def _wb_spend_points(guild_id: int, user_id: int, cost: int):
+    def spend(row):
+        before = row["points"]
+        if before < int(cost):
+            return (False, before, before), False
+        row["points"] = before - int(cost)
+        return (True, before, row["points"]), True
+    return _wb_user_mutate(guild_id, user_id, spend)
+
+def _wb_claim_daily(guild_id: int, user_id: int, amount: int, today: str):
+    def claim(row):
+        before = row["points"]
+        if row.get("last_daily") == today:
+            return {"claimed": False, "before": before, "after": before}, False
+        row["points"] = before + int(amount)
+        row["last_daily"] = today
+        return {"claimed": True, "before": before, "after": row["points"]}, True
+    return _wb_user_mutate(guild_id, user_id, claim)
+
+def _wb_add_points_bulk(guild_id: int, amounts: dict):
+    loaded = _wb_load_users(guild_id, amounts)
+    if loaded is None:
+        return None
+    result = {}
+    for uid, amount in amounts.items():
+        result[uid] = _wb_users.mutate(
+            guild_id, uid, lambda r, amount=amount: _wb_add(r, amount),
+            default=loaded.get(uid) or {"points": 0, "last_daily": None},
+        )
+    return result
+
+def _wb_get_voice_progress_bulk(guild_id: int, user_ids: list):
+    rows = {}
+    for uid in user_ids:
+        row = _wb_voice.get(guild_id, uid)
+        if row is not None:
+            rows[uid] = dict(row)
+
+    missing = [uid for uid in user_ids if uid not in rows]
+    for chunk in _chunks(missing, BULK_IN_CHUNK):
+        res = sb_sync(
+            "wb load voice_progress",
+            lambda chunk=chunk: get_supabase().table("voice_progress").select("*").eq("guild_id", guild_id).in_("user_id", chunk).execute()
+        )
+        if res is None:
+            return None
+        for r in (getattr(res, "data", None) or []):
+            uid = int(r["user_id"])
+            _wb_voice.put_loaded(guild_id, uid, r)
+            rows[uid] = dict(r)
+    return rows
+
+def _wb_update_voice_rows(guild_id: int, payload: list):
+    for row in payload:
+        _wb_voice.mutate(guild_id, row["user_id"], lambda r, row=row: (r.update(row), True), default={})
+
+def _wb_user_payload(guild_id: int, user_id: int, row: dict) -> dict:
+    return {"guild_id": guild_id, "user_id": user_id, "points": int(row["points"]), "last_daily": row.get("last_daily")}
+
+def _wb_voice_payload(guild_id: int, user_id: int, row: dict) -> dict:
+    return {**row, "guild_id": guild_id, "user_id": user_id}
+
+def flush_write_behind() -> int:
+    """Upsert every dirty row in batches of WRITE_BEHIND_BATCH (rows of many guilds share one upsert)."""
+    flushed = 0
+    with _wb_flush_lock:
+        for cache, table, build in (
+            (_wb_users, "users", _wb_user_payload),
+            (_wb_voice, "voice_progress", _wb_voice_payload),
+        ):
+            while True:
+                items = cache.take_dirty(WRITE_BEHIND_BATCH)
+                if not items:
+                    break
+                payload = [build(gid, uid, row) for gid, uid, row in items]
+                try:
+                    # DB ล่ม → ลง journal ในเครื่อง (ไม่หายแม้ process ตาย)
+                    db_write(f"wb flush {table}", {
+                        "kind": "upsert", "table": table, "rows": payload, "on_conflict": "guild_id,user_id",
+                    })
+                except Exception as e:
+                    print("[WRITE_BEHIND ERROR]", type(e).__name__, e)
+                    cache.restore_dirty(items)
+                    break
+                cache.mark_flushed(len(items))
+                flushed += len(items)
+    return flushed
+
+@tasks.loop(seconds=WRITE_BEHIND_FLUSH_SECONDS)
+async def write_behind_flush():
+    try:
+        flushed = await run_db(flush_write_behind)
+        if flushed:
+            print(f"[WRITE_BEHIND] flushed {flushed} rows")
+    except Exception as e:
+        print("[WRITE_BEHIND ERROR]", type(e).__name__, e)
+
+
+# ======================
+# Gacha tables (ต่อกิลด์, compile เป็น alias table แล้ว cache จนกว่าจะแก้ตาราง)
+# ======================
+_gacha_tables = {}  # guild_id -> AliasTable (None = ปิดกาชา: rate เป็น 0 ทุกรางวัล)
+_gacha_lock = threading.Lock()
+
+def load_gacha_rewards(guild_id: int):
+    """Reward rows of a guild ordered by position, [] if not configured, None on DB failure."""
     res = sb_sync(
-        "get_voice_progress",
-        lambda: supabase.table("voice_progress").select("*").eq("guild_id", guild_id).eq("user_id", user_id).execute()
+        "load_gacha_rewards",
+        lambda: get_supabase().table("gacha_rewards").select("name,rate,position").eq("guild_id", guild_id).order("position").execute()
     )
-    if not res or not getattr(res, "data", None):
-        new_row = {
-            "guild_id": guild_id,
-            "user_id": user_id,
-            "active_minutes": 0,
-            "muted_streak_minutes": 0,
-            "channel_id": None,
-            "last_tick_utc": None,
-        }
-        sb_sync(
-            "voice_progress insert",
-            lambda: supabase.table("voice_progress").insert(new_row).execute()
-        )
-        return new_row
-    return res.data[0]
-
-def update_voice_progress(guild_id: int, user_id: int, channel_id, active_minutes: int, muted_streak: int):
-    # voice_progress ต้อง unique (guild_id, user_id)
-    sb_sync(
-        "update_voice_progress",
-        lambda: supabase.table("voice_progress").upsert({
-            "guild_id": guild_id,
-            "user_id": user_id,
-            "channel_id": channel_id,
-            "active_minutes": int(active_minutes),
-            "muted_streak_minutes": int(muted_streak),
-            "last_tick_utc": datetime.now(timezone.utc).isoformat(),
-        }, on_conflict="guild_id,user_id").execute()
+    if res is None:
+        return None
+    return [{"name": r["name"], "rate": float(r["rate"])} for r in (getattr(res, "data", None) or [])]
+
+def get_gacha_table(guild_id: int):
+    """AliasTable of the guild, or None when the admin set every rate to 0 (gacha disabled)."""
+    with _gacha_lock:
+        if guild_id in _gacha_tables:
+            return _gacha_tables[guild_id]
+
+    rewards = load_gacha_rewards(guild_id)
+    try:
+        table = AliasTable(rewards or GACHA_REWARDS)
+    except ValueError:
+        # ตั้ง rate เป็น 0 หมด → ปิดกาชา (ไม่แอบใช้ตารางเริ่มต้นแล้วหักแต้ม)
+        table = None
+    if rewards is not None:
+        with _gacha_lock:
+            _gacha_tables[guild_id] = table
+    return table
+
+def invalidate_gacha_table(guild_id: int):
+    with _gacha_lock:
+        _gacha_tables.pop(guild_id, None)
+
+def set_gacha_reward(guild_id: int, name: str, rate: float):
+    # ถ้ากิลด์ยังไม่มีตาราง ให้คัดลอกตารางเริ่มต้นลง DB ก่อน แล้วค่อยแก้
+    rewards = load_gacha_rewards(guild_id)
+    if rewards is None:
+        return None
+    if not rewards:
+        rewards = [dict(r) for r in GACHA_REWARDS]
+
+    for r in rewards:
+        if r["name"] == name:
+            r["rate"] = float(rate)
+            break
+    else:
+        rewards.append({"name": name, "rate": float(rate)})
+
+    payload = [
+        {"guild_id": guild_id, "name": r["name"], "rate": r["rate"], "position": i}
+        for i, r in enumerate(rewards)
+    ]
+    res = sb_sync(
+        "set_gacha_reward",
+        lambda: get_supabase().table("gacha_rewards").upsert(payload, on_conflict="guild_id,name").execute()
+    )
+    invalidate_gacha_table(guild_id)
+    return res
+
+def delete_gacha_reward(guild_id: int, name: str):
+    res = sb_sync(
+        "delete_gacha_reward",
+        lambda: get_supabase().table("gacha_rewards").delete().eq("guild_id", guild_id).eq("name", name).execute()
+    )
+    invalidate_gacha_table(guild_id)
+    if res is None:
+        return None
+    return bool(getattr(res, "data", None))
+
+
+# ======================
+# Gacha history (บัฟเฟอร์ในหน่วยความจำ แล้วบันทึกเป็นก้อน → ไม่เพิ่มเวลาให้การสุ่ม)
+# ======================
+_gacha_history_buf = []
+_gacha_history_lock = threading.Lock()
+_gacha_history_flushing = {"task": None}
+GACHA_HISTORY_ROWS = metrics.Counter("aura_gacha_history_rows_total", "Gacha results buffered / handed to the DB", ("stage",))
+metrics.CallbackMetric("aura_gacha_history_buffered", "Gacha results waiting for the next batch", lambda: {(): len(_gacha_history_buf)})
+
+def record_gacha(guild_id: int, user_id: int, rewards: list, cost: int):
+    """Buffer one roll's results (cost split evenly across them). Never touches the DB."""
+    now_iso = datetime.now(timezone.utc).isoformat()
+    each = cost // max(1, len(rewards))
+    rows = [{"guild_id": guild_id, "user_id": user_id, "reward": r, "cost": each, "rolled_at": now_iso} for r in rewards]
+    with _gacha_history_lock:
+        _gacha_history_buf.extend(rows)
+        full = len(_gacha_history_buf) >= GACHA_HISTORY_BATCH
+    GACHA_HISTORY_ROWS.inc("buffered", amount=len(rows))
+    # เต็มก้อนแล้วไม่ต้องรอรอบ loop
+    task = _gacha_history_flushing["task"]
+    if full and (task is None or task.done()):
+        _gacha_history_flushing["task"] = asyncio.create_task(run_db(flush_gacha_history), context=tracing.detached())
+
+def flush_gacha_history() -> int:
+    """
+    Write buffered results with aura_record_gacha (inserts history rows and bumps
+    gacha_reward_stats in the same call), GACHA_HISTORY_BATCH rows per RPC.
+    Goes through db_write, so a DB outage parks the batch in the journal.
+    """
+    with _gacha_history_lock:
+        rows = _gacha_history_buf[:]
+        _gacha_history_buf.clear()
+    for chunk in _chunks(rows, GACHA_HISTORY_BATCH):
+        db_write("record_gacha", {"kind": "rpc", "fn": "aura_record_gacha", "params": {"p_rows": chunk}})
+    GACHA_HISTORY_ROWS.inc("written", amount=len(rows))
+    return len(rows)
+
+@tasks.loop(seconds=GACHA_HISTORY_FLUSH_SECONDS)
+async def gacha_history_flush():
+    try:
+        await run_db(flush_gacha_history)
+    except Exception as e:
+        print("[GACHA-HISTORY ERROR]", type(e).__name__, e)
+
+def load_gacha_history(guild_id: int, user_id=None, before_id=None, limit: int = GACHA_HISTORY_PAGE, since: datetime = None):
+    """
+    Newest first, keyset-paginated: pass the smallest id of the previous page as before_id.
+    user_id=None lists the whole guild; since keeps only rolls at or after that time
+    (gacha_history_time_idx). Returns rows, or None on DB failure.
+    """
+    def query():
+        q = get_supabase().table("gacha_history").select("id,user_id,reward,cost,rolled_at").eq("guild_id", guild_id)
+        if user_id:
+            q = q.eq("user_id", user_id)
+        if since:
+            q = q.gte("rolled_at", since.astimezone(timezone.utc).isoformat())
+        if before_id:
+            q = q.lt("id", before_id)
+        return q.order("id", desc=True).limit(limit).execute()
+
+    res = sb_sync("load_gacha_history", query)
+    if res is None:
+        return None
+    return getattr(res, "data", None) or []
+
+def load_gacha_stats(guild_id: int):
+    """Per-reward counters maintained by aura_record_gacha: [{reward, rolls, points_spent}], or None."""
+    res = sb_sync(
+        "load_gacha_stats",
+        lambda: get_supabase().table("gacha_reward_stats").select("reward,rolls,points_spent").eq("guild_id", guild_id).order("rolls", desc=True).execute()
+    )
+    if res is None:
+        return None
+    return getattr(res, "data", None) or []
+
+
+# ======================
+# Async DB helpers (ใช้ใน handler / loop ทั้งหมด)
+# ======================
+def _db_async(fn):
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        return await run_db(fn, *args, **kwargs)
+    wrapper.__name__ = wrapper.__qualname__ = f"{fn.__name__}_async"
+    return wrapper
+
+set_setting_async = _db_async(set_setting)
+get_guild_settings_async = _db_async(get_guild_settings)
+
+_settings_loading = {}  # guild_id -> asyncio.Task ที่กำลังโหลด (คลิกพร้อมกันตอน cache ว่างรอตัวเดียวกัน)
+
+async def get_setting_async(guild_id: int, key: str, default=None):
+    # cache hit ไม่ต้องกระโดดไป executor
+    values = _settings_lookup(guild_id)
+    if values is None:
+        task = _settings_loading.get(guild_id)
+        if task is None:
+            task = _settings_loading[guild_id] = asyncio.ensure_future(run_db(load_guild_settings, guild_id))
+            task.add_done_callback(lambda _: _settings_loading.pop(guild_id, None))
+        values = await asyncio.shield(task)
+    return values.get(key, default)
+
+get_points_async = _db_async(get_points)
+set_points_async = _db_async(set_points)
+add_points_async = _db_async(add_points)
+spend_points_async = _db_async(spend_points)
+claim_daily_async = _db_async(claim_daily)
+list_voice_channels_async = _db_async(list_voice_channels)
+get_voice_progress_bulk_async = _db_async(get_voice_progress_bulk)
+update_voice_progress_bulk_async = _db_async(update_voice_progress_bulk)
+add_points_bulk_async = _db_async(add_points_bulk)
+set_points_bulk_async = _db_async(set_points_bulk)
+load_gacha_rewards_async = _db_async(load_gacha_rewards)
+set_gacha_reward_async = _db_async(set_gacha_reward)
+delete_gacha_reward_async = _db_async(delete_gacha_reward)
+load_gacha_history_async = _db_async(load_gacha_history)
+load_gacha_stats_async = _db_async(load_gacha_stats)
+
+def load_leaderboard(guild_id: int) -> bool:
+    """Seed the guild's rank index from every users row (paged). False on DB failure."""
+    _leaderboards.begin_load(guild_id)
+    rows = _select_pages(
+        "load_leaderboard",
+        lambda: get_supabase().table("users").select("user_id,points").eq("guild_id", guild_id).order("user_id"),
     )
+    balances = None
+    if rows is not None:
+        balances = {int(r["user_id"]): int(r.get("points") or 0) for r in rows}
+        if WRITE_BEHIND:
+            # แต้มที่ยังไม่ flush ใหม่กว่าใน DB
+            balances.update((uid, int(row["points"])) for uid, row in _wb_users.dirty_rows(guild_id).items())
+    return _leaderboards.finish_load(guild_id, balances.items() if balances is not None else None) is not None
+
+async def leaderboard_page_async(guild_id: int, page: int):
+    """((rows, total), page) with page clamped to the valid range, or None if the index could not be seeded."""
+    if not _leaderboards.loaded(guild_id):
+        task = _leaderboard_loading.get(guild_id)
+        if task is None:
+            task = _leaderboard_loading[guild_id] = asyncio.ensure_future(run_db(load_leaderboard, guild_id))
+            task.add_done_callback(lambda _: _leaderboard_loading.pop(guild_id, None))
+        if not await asyncio.shield(task):
+            return None
+    first = _leaderboards.page(guild_id, 0, 0)
+    if first is None:
+        return None
+    pages = max(1, math.ceil(first[1] / LEADERBOARD_PAGE))
+    page = min(max(1, page), pages)
+    return _leaderboards.page(guild_id, (page - 1) * LEADERBOARD_PAGE, LEADERBOARD_PAGE), page
+
+async def get_gacha_table_async(guild_id: int):
+    with _gacha_lock:
+        if guild_id in _gacha_tables:
+            return _gacha_tables[guild_id]
+    return await run_db(get_gacha_table, guild_id)
 
 
 # ======================
 # Logging Helpers
 # ======================
+log_dispatcher = LogDispatcher(flush_interval=LOG_FLUSH_SECONDS, max_queue=LOG_QUEUE_MAX)
+metrics.CallbackMetric(
+    "aura_log_dispatch", "Log dispatcher counters (queued is current depth)",
+    lambda: {(k,): v for k, v in log_dispatcher.stats().items()}, ("stat",),
+)
+
 async def send_log(guild: discord.Guild, key: str, text: str):
+    """Queue a line for the guild's log channel (channel id comes from the settings cache)."""
+    if not owns_guild(guild.id):
+        return
     try:
-        ch_id = get_setting(guild.id, key)
+        ch_id = await get_setting_async(guild.id, key)
         if not ch_id:
             return
         ch = guild.get_channel(int(ch_id))
         if ch:
-            await ch.send(text)
+            log_dispatcher.enqueue(ch, text)
     except Exception as e:
         print("[LOG-ERROR]", e)
 
@@ -244,42 +1403,122 @@ async def send_log(guild: discord.Guild, key: str, text: str):
 # ======================
 # UI Views
 # ======================
+INTERACTION_SECONDS = metrics.Histogram("aura_interaction_seconds", "Button handler latency per custom_id", ("custom_id",))
+
+def timed_interaction(fn):
+    """Record handler latency per custom_id (put under @discord.ui.button)."""
+    @functools.wraps(fn)
+    async def wrapper(self, interaction: discord.Interaction, button: discord.ui.Button):
+        t0 = time.perf_counter()
+        try:
+            with tracing.trace(f"button {button.custom_id}", SLOW_HANDLER_MS):
+                return await fn(self, interaction, button)
+        finally:
+            INTERACTION_SECONDS.observe(button.custom_id or "-", value=time.perf_counter() - t0)
+    return wrapper
+
+# กดรัว: token bucket ต่อ (กิลด์, ผู้ใช้) — กดติดกันได้ CLICK_BURST ครั้ง แล้วเติม CLICK_RATE ครั้ง/วินาที
+CLICK_BURST = float(os.getenv("CLICK_BURST", "5"))
+CLICK_RATE = float(os.getenv("CLICK_RATE", "1"))
+CLICK_BUCKETS_MAX = 10000
+
+_click_buckets = OrderedDict()  # (guild_id, user_id) -> [tokens, last_monotonic]
+_click_inflight = {}  # (guild_id, user_id, action) -> asyncio.Task ของคลิกที่กำลังทำ
+BUTTON_CLICKS = metrics.Counter("aura_button_clicks_total", "Button clicks by outcome (run / joined / throttled)", ("action", "outcome"))
+ERROR_REPLY = "เกิดข้อผิดพลาด ลองใหม่อีกครั้งนะ"
+SYNCING_REPLY = "ระบบกำลังบันทึกแต้มที่ค้างไว้ตอนฐานข้อมูลล่ม ลองใหม่อีกสักครู่นะ 🕒"
+GACHA_DISABLED_REPLY = "กาชาปิดอยู่ตอนนี้ (แอดมินตั้ง rate เป็น 0 ทุกรางวัล) ยังไม่หักแต้มนะ 🙏"
+
+def _take_click_token(guild_id: int, user_id: int) -> bool:
+    now = time.monotonic()
+    key = (guild_id, user_id)
+    bucket = _click_buckets.get(key)
+    if bucket is None:
+        bucket = _click_buckets[key] = [CLICK_BURST, now]
+        if len(_click_buckets) > CLICK_BUCKETS_MAX:
+            _click_buckets.popitem(last=False)
+    else:
+        bucket[0] = min(CLICK_BURST, bucket[0] + (now - bucket[1]) * CLICK_RATE)
+        bucket[1] = now
+        _click_buckets.move_to_end(key)
+    if bucket[0] < 1:
+        return False
+    bucket[0] -= 1
+    return True
+
+def button_action(action: str):
+    """
+    Button handler wrapper (put under @timed_interaction). The handler returns its
+    ephemeral reply text. Click spam is throttled per user, the interaction is
+    deferred right away (Discord's 3s deadline) and answered through a followup.
+    Clicks of the same user on the same action while one is running share its
+    result instead of hitting the DB again.
+    """
+    def deco(fn):
+        @functools.wraps(fn)
+        async def wrapper(self, interaction: discord.Interaction, button: discord.ui.Button):
+            if not interaction.guild:
+                return await interaction.response.send_message("ใช้ได้เฉพาะในเซิร์ฟเวอร์นะ", ephemeral=True)
+            gid, uid = interaction.guild.id, interaction.user.id
+            if not _take_click_token(gid, uid):
+                BUTTON_CLICKS.inc(action, "throttled")
+                return await interaction.response.send_message("กดเร็วไปนิด รอสักครู่แล้วลองใหม่นะ ⏳", ephemeral=True)
+            try:
+                with tracing.span("discord defer"):
+                    await interaction.response.defer(ephemeral=True, thinking=True)
+            except discord.HTTPException as e:
+                # interaction หมดอายุไปแล้ว → ไม่ต้องทำงานต่อ
+                print(f"[{action.upper()}-ERROR] defer:", e)
+                return
+
+            key = (gid, uid, action)
+            task = _click_inflight.get(key)
+            if task is None:
+                task = _click_inflight[key] = asyncio.create_task(fn(self, interaction, button))
+                task.add_done_callback(lambda t: _click_inflight.pop(key, None) if _click_inflight.get(key) is t else None)
+                BUTTON_CLICKS.inc(action, "run")
+            else:
+                BUTTON_CLICKS.inc(action, "joined")
+            try:
+                text = await asyncio.shield(task)
+            except Exception as e:
+                print(f"[{action.upper()}-ERROR]", e)
+                text = ERROR_REPLY
+            try:
+                with tracing.span("discord followup"):
+                    await interaction.followup.send(text, ephemeral=True)
+            except discord.HTTPException as e:
+                print(f"[{action.upper()}-ERROR] followup:", e)
+        return wrapper
+    return deco
+
 class DailyView(discord.ui.View):
     def __init__(self):
         super().__init__(timeout=None)
 
     @discord.ui.button(label="✅ กดรับ Daily", style=discord.ButtonStyle.success, custom_id="aura:daily")
+    @timed_interaction
+    @button_action("daily")
     async def daily_btn(self, interaction: discord.Interaction, button: discord.ui.Button):
-        try:
-            if not interaction.guild:
-                return await interaction.response.send_message("ใช้ได้เฉพาะในเซิร์ฟเวอร์นะ", ephemeral=True)
-
-            gid, uid = interaction.guild.id, interaction.user.id
-            amt = int(get_setting(gid, "daily_amount", DEFAULT_DAILY_AMOUNT))
-
-            if not can_claim_daily(gid, uid):
-                pts = get_points(gid, uid)
-                return await interaction.response.send_message(
-                    f"วันนี้รับไปแล้วน้า 😆\nคะแนนตอนนี้: **{pts}** แต้ม",
-                    ephemeral=True
-                )
-
-            before, after = add_points(gid, uid, amt)
-            set_daily_claimed(gid, uid)
-
-            await interaction.response.send_message(
-                f"รับ Daily แล้ว ✅ +{amt} แต้ม\nคะแนน: **{before} → {after}**",
-                ephemeral=True
-            )
-            await send_log(
-                interaction.guild,
-                "daily_log_channel_id",
-                f"🟩 **DAILY CLAIM**\n👤 ผู้เล่น: <@{uid}>\n➕ ได้รับ: +{amt} แต้ม\n📊 คะแนน: {before} → {after}"
-            )
-        except Exception as e:
-            print("[DAILY-ERROR]", e)
-            if not interaction.response.is_done():
-                await interaction.response.send_message("เกิดข้อผิดพลาด ลองใหม่อีกครั้งนะ", ephemeral=True)
+        gid, uid = interaction.guild.id, interaction.user.id
+        amt = int(await get_setting_async(gid, "daily_amount", DEFAULT_DAILY_AMOUNT))
+
+        res = await claim_daily_async(gid, uid, amt)
+        if res is None:
+            return ERROR_REPLY
+        if res is SYNCING:
+            return SYNCING_REPLY
+        before, after = res["before"], res["after"]
+
+        if not res["claimed"]:
+            return f"วันนี้รับไปแล้วน้า 😆\nคะแนนตอนนี้: **{after}** แต้ม"
+
+        await send_log(
+            interaction.guild,
+            "daily_log_channel_id",
+            f"🟩 **DAILY CLAIM**\n👤 ผู้เล่น: <@{uid}>\n➕ ได้รับ: +{amt} แต้ม\n📊 คะแนน: {before} → {after}"
+        )
+        return f"รับ Daily แล้ว ✅ +{amt} แต้ม\nคะแนน: **{before} → {after}**"
 
 
 class RollView(discord.ui.View):
@@ -287,61 +1526,213 @@ class RollView(discord.ui.View):
         super().__init__(timeout=None)
 
     @discord.ui.button(label="🎲 สุ่มรางวัล", style=discord.ButtonStyle.danger, custom_id="aura:roll")
+    @timed_interaction
+    @button_action("roll")
     async def roll_btn(self, interaction: discord.Interaction, button: discord.ui.Button):
-        try:
-            if not interaction.guild:
-                return await interaction.response.send_message("ใช้ได้เฉพาะในเซิร์ฟเวอร์นะ", ephemeral=True)
+        return await self._roll(interaction, 1)
+
+    @discord.ui.button(label=f"🎰 สุ่ม x{GACHA_MULTI_ROLL}", style=discord.ButtonStyle.danger, custom_id="aura:roll10")
+    @timed_interaction
+    @button_action("roll10")
+    async def roll10_btn(self, interaction: discord.Interaction, button: discord.ui.Button):
+        return await self._roll(interaction, GACHA_MULTI_ROLL)
+
+    async def _roll(self, interaction: discord.Interaction, count: int) -> str:
+        gid, uid = interaction.guild.id, interaction.user.id
+        table = await get_gacha_table_async(gid)
+        if table is None:
+            return GACHA_DISABLED_REPLY
+        cost = int(await get_setting_async(gid, "roll_cost", DEFAULT_ROLL_COST)) * count
+
+        # หักแต้มก่อน (atomic: หักเฉพาะตอนแต้มพอ กันกดรัวแล้วติดลบ)
+        spent = await spend_points_async(gid, uid, cost)
+        if spent is None:
+            return ERROR_REPLY
+        if spent is SYNCING:
+            return SYNCING_REPLY
+        ok, pts_before, pts_after = spent
+        if not ok:
+            return f"แต้มไม่พอจ้า 😅 ต้องใช้ {cost} แต้ม\nมีอยู่: **{pts_before}**"
+
+        rewards = table.sample_many(count)
+        record_gacha(gid, uid, rewards, cost)
+
+        if count == 1:
+            reward_text = f"**{rewards[0]}**"
+        else:
+            reward_text = "\n" + "\n".join(f"{i}. **{r}**" for i, r in enumerate(rewards, 1))
+
+        title = "🎲 **AURA GACHA**" if count == 1 else f"🎰 **AURA GACHA x{count}**"
+        await send_log(
+            interaction.guild,
+            "gacha_log_channel_id",
+            f"{title}\n👤 ผู้เล่น: <@{uid}>\n🎁 รางวัล: {reward_text}\n💸 ใช้แต้ม: -{cost}\n📊 คะแนน: {pts_before} → {pts_after}"
+        )
+        return f"🎉 ได้รางวัล: {reward_text}\n💰คงเหลือ: **{pts_after}**\n📸 แคปรูปยืนยันด้วยนะ"
 
-            gid, uid = interaction.guild.id, interaction.user.id
-            cost = int(get_setting(gid, "roll_cost", DEFAULT_ROLL_COST))
-
-            pts_before = get_points(gid, uid)
-            if pts_before < cost:
-                return await interaction.response.send_message(
-                    f"แต้มไม่พอจ้า 😅 ต้องใช้ {cost} แต้ม\nมีอยู่: **{pts_before}**",
-                    ephemeral=True
-                )
-
-            # หักแต้มก่อน
-            set_points(gid, uid, pts_before - cost)
-
-            total = sum(r["rate"] for r in GACHA_REWARDS)
-            pick = random.uniform(0, total)
-            cur = 0.0
-            reward = GACHA_REWARDS[-1]["name"]
-            for r in GACHA_REWARDS:
-                cur += r["rate"]
-                if pick <= cur:
-                    reward = r["name"]
-                    break
+    @discord.ui.button(label="📊 เช็คคะแนน", style=discord.ButtonStyle.secondary, custom_id="aura:checkpoints")
+    @timed_interaction
+    @button_action("checkpoints")
+    async def checkpoints_btn(self, interaction: discord.Interaction, button: discord.ui.Button):
+        pts = await get_points_async(interaction.guild.id, interaction.user.id)
+        return f"คะแนนของคุณตอนนี้: **{pts}** แต้ม ✅"
+
+    @discord.ui.button(label="🏆 อันดับ", style=discord.ButtonStyle.secondary, custom_id="aura:leaderboard")
+    @timed_interaction
+    @button_action("leaderboard")
+    async def leaderboard_btn(self, interaction: discord.Interaction, button: discord.ui.Button):
+        gid = interaction.guild.id
+        res = await leaderboard_page_async(gid, 1)
+        if res is None:
+            return ERROR_REPLY
+        (rows, _), _ = res
+        return f"🏆 **TOP {LEADERBOARD_PAGE}**\n{_leaderboard_lines(rows) or 'ยังไม่มีใครมีแต้มเลย'}\n\n{_own_rank_text(gid, interaction.user.id)}"
+
+
+# ======================
+# Leaderboard UI (หน้าปัจจุบันเก็บไว้ใน footer ของ embed → view ไม่ต้องจำ state)
+# ======================
+_MEDALS = {1: "🥇", 2: "🥈", 3: "🥉"}
+
+def _leaderboard_lines(rows) -> str:
+    return "\n".join(f"{_MEDALS.get(rank, f'`#{rank}`')} <@{uid}> — **{pts}** แต้ม" for rank, uid, pts in rows)
+
+def _footer_page(message) -> int:
+    try:
+        return int(message.embeds[0].footer.text.split("หน้า ", 1)[1].split("/", 1)[0])
+    except Exception:
+        return 1
+
+async def leaderboard_embed(guild: discord.Guild, page: int):
+    res = await leaderboard_page_async(guild.id, page)
+    if res is None:
+        return None
+    (rows, total), page = res
+    embed = discord.Embed(
+        title="🏆 AURA LEADERBOARD",
+        description=_leaderboard_lines(rows) or "ยังไม่มีใครมีแต้มเลย",
+        color=0xFFD700,
+    )
+    embed.set_footer(text=f"หน้า {page}/{max(1, math.ceil(total / LEADERBOARD_PAGE))} • ผู้เล่น {total} คน")
+    return embed
+
+def _own_rank_text(guild_id: int, user_id: int) -> str:
+    mine = _leaderboards.rank(guild_id, user_id)
+    return f"อันดับของคุณ: **#{mine[0]}** ({mine[1]} แต้ม)" if mine else "คุณยังไม่มีอันดับ"
+
+class LeaderboardView(discord.ui.View):
+    def __init__(self):
+        super().__init__(timeout=None)
+
+    @discord.ui.button(label="◀", style=discord.ButtonStyle.secondary, custom_id="aura:lb:prev")
+    @timed_interaction
+    async def prev_btn(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self._flip(interaction, -1)
 
-            pts_after = get_points(gid, uid)
-
-            await interaction.response.send_message(
-                f"🎉 ได้รางวัล: **{reward}**\n💰คงเหลือ: **{pts_after}**\n📸 แคปรูปยืนยันด้วยนะ",
-                ephemeral=True
-            )
-            await send_log(
-                interaction.guild,
-                "gacha_log_channel_id",
-                f"🎲 **AURA GACHA**\n👤 ผู้เล่น: <@{uid}>\n🎁 รางวัล: **{reward}**\n💸 ใช้แต้ม: -{cost}\n📊 คะแนน: {pts_before} → {pts_after}"
-            )
+    @discord.ui.button(label="▶", style=discord.ButtonStyle.secondary, custom_id="aura:lb:next")
+    @timed_interaction
+    async def next_btn(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self._flip(interaction, 1)
+
+    async def _flip(self, interaction: discord.Interaction, delta: int):
+        try:
+            if not interaction.guild or not _take_click_token(interaction.guild.id, interaction.user.id):
+                return await interaction.response.defer()
+            await interaction.response.defer()
+            embed = await leaderboard_embed(interaction.guild, _footer_page(interaction.message) + delta)
+            if embed is None:
+                return await interaction.followup.send(ERROR_REPLY, ephemeral=True)
+            await interaction.edit_original_response(embed=embed, view=self)
         except Exception as e:
-            print("[GACHA-ERROR]", e)
-            if not interaction.response.is_done():
-                await interaction.response.send_message("เกิดข้อผิดพลาด ลองใหม่อีกครั้งนะ", ephemeral=True)
+            print("[LEADERBOARD-ERROR]", e)
 
-    @discord.ui.button(label="📊 เช็คคะแนน", style=discord.ButtonStyle.secondary, custom_id="aura:checkpoints")
-    async def checkpoints_btn(self, interaction: discord.Interaction, button: discord.ui.Button):
+
+# ======================
+# Gacha history UI (footer เก็บผู้เล่น + id ต่อไป → view ไม่ต้องจำ state)
+# ======================
+def _rolled_at_unix(raw) -> int:
+    try:
+        return int(datetime.fromisoformat(str(raw).replace("Z", "+00:00")).timestamp())
+    except ValueError:
+        return 0
+
+def _parse_since(raw):
+    """'since:2024-05-01' / '2024-05-01' -> midnight Bangkok time of that date, None if unreadable."""
+    if not raw:
+        return None
+    try:
+        return datetime.strptime(str(raw).removeprefix("since:"), "%Y-%m-%d").replace(tzinfo=TH_TZ)
+    except ValueError:
+        return None
+
+def _history_cursor(message):
+    """(user_id or None, before_id, since or None) from a history embed footer."""
+    try:
+        text = message.embeds[0].footer.text
+        who = text.split("ผู้เล่น ", 1)[1].split(" ", 1)[0]
+        before = int(text.split("#", 1)[1].split(" ", 1)[0]) if "#" in text else None
+        since = _parse_since(text.split("ตั้งแต่ ", 1)[1].split(" ", 1)[0]) if "ตั้งแต่ " in text else None
+        return (None if who == "ทั้งหมด" else int(who)), before, since
+    except Exception:
+        return None, None, None
+
+async def gacha_history_embed(guild: discord.Guild, user_id=None, before_id=None, since: datetime = None):
+    if before_id is None:
+        # หน้าแรก: ส่งที่ค้างในบัฟเฟอร์ก่อนจะได้เห็นผลล่าสุด
+        await run_db(flush_gacha_history)
+    rows = await load_gacha_history_async(guild.id, user_id, before_id, since=since)
+    if rows is None:
+        return None
+    member = guild.get_member(user_id) if user_id else None
+    who = member.display_name if member else (f"<@{user_id}>" if user_id else "ทั้งกิลด์")
+    lines = [
+        f"`#{r['id']}` <t:{_rolled_at_unix(r['rolled_at'])}:R> "
+        + ("" if user_id else f"<@{r['user_id']}> ")
+        + f"**{r['reward']}** (-{r['cost']})"
+        for r in rows
+    ]
+    embed = discord.Embed(
+        title=f"🎲 ประวัติกาชา — {who}",
+        description="\n".join(lines) or "ไม่มีประวัติเพิ่มแล้ว",
+        color=0xFF0033,
+    )
+    more = f" • ถัดไป #{rows[-1]['id']}" if len(rows) == GACHA_HISTORY_PAGE else ""
+    window = f" • ตั้งแต่ {since:%Y-%m-%d}" if since else ""
+    embed.set_footer(text=f"ผู้เล่น {user_id or 'ทั้งหมด'}{window}{more}")
+    return embed
+
+class GachaHistoryView(discord.ui.View):
+    def __init__(self):
+        super().__init__(timeout=None)
+
+    @discord.ui.button(label="⏮ ล่าสุด", style=discord.ButtonStyle.secondary, custom_id="aura:gh:latest")
+    @timed_interaction
+    async def latest_btn(self, interaction: discord.Interaction, button: discord.ui.Button):
+        user_id, _, since = _history_cursor(interaction.message)
+        await self._show(interaction, user_id, None, since)
+
+    @discord.ui.button(label="เก่ากว่า ▶", style=discord.ButtonStyle.secondary, custom_id="aura:gh:older")
+    @timed_interaction
+    async def older_btn(self, interaction: discord.Interaction, button: discord.ui.Button):
+        user_id, before_id, since = _history_cursor(interaction.message)
+        if before_id is None:
+            return await interaction.response.defer()
+        await self._show(interaction, user_id, before_id, since)
+
+    async def _show(self, interaction: discord.Interaction, user_id, before_id, since):
         try:
-            if not interaction.guild:
-                return await interaction.response.send_message("ใช้ได้เฉพาะในเซิร์ฟเวอร์นะ", ephemeral=True)
-            pts = get_points(interaction.guild.id, interaction.user.id)
-            await interaction.response.send_message(f"คะแนนของคุณตอนนี้: **{pts}** แต้ม ✅", ephemeral=True)
+            if not interaction.guild or not _take_click_token(interaction.guild.id, interaction.user.id):
+                return await interaction.response.defer()
+            # สิทธิ์เดียวกับ !gachahistory (ใครเห็นข้อความก็กดได้ → เช็คที่ปุ่มด้วย)
+            if not interaction.permissions.administrator:
+                return await interaction.response.send_message("❌ ดูประวัติกาชาได้เฉพาะแอดมิน", ephemeral=True)
+            await interaction.response.defer()
+            embed = await gacha_history_embed(interaction.guild, user_id, before_id, since)
+            if embed is None:
+                return await interaction.followup.send(ERROR_REPLY, ephemeral=True)
+            await interaction.edit_original_response(embed=embed, view=self)
         except Exception as e:
-            print("[CHECKPOINTS-ERROR]", e)
-            if not interaction.response.is_done():
-                await interaction.response.send_message("เกิดข้อผิดพลาด ลองใหม่อีกครั้งนะ", ephemeral=True)
+            print("[GACHA-HISTORY-ERROR]", e)
 
 
 # ======================
@@ -350,73 +1741,215 @@ class RollView(discord.ui.View):
 @bot.command()
 @commands.has_permissions(administrator=True)
 async def setvoicerewardminutes(ctx, minutes: int):
-    set_setting(ctx.guild.id, "voice_reward_minutes", str(minutes))
+    await set_setting_async(ctx.guild.id, "voice_reward_minutes", str(minutes))
     await ctx.send(f"ตั้งค่า Voice Reward = ครบ **{minutes}** นาที ได้แต้ม ✅")
 
 @bot.command()
 @commands.has_permissions(administrator=True)
 async def setvoicerewardpoints(ctx, points: int):
-    set_setting(ctx.guild.id, "voice_reward_points", str(points))
+    await set_setting_async(ctx.guild.id, "voice_reward_points", str(points))
     await ctx.send(f"ตั้งค่า Voice Reward = ได้รับ **{points}** แต้ม ✅")
 
 @bot.command()
 @commands.has_permissions(administrator=True)
 async def setvoicemutelimit(ctx, minutes: int):
-    set_setting(ctx.guild.id, "voice_mute_limit_min", str(minutes))
+    await set_setting_async(ctx.guild.id, "voice_mute_limit_min", str(minutes))
     await ctx.send(f"ตั้งค่า Mute Limit = ปิดไมค์เกิน **{minutes}** นาที จะรีเซ็ตเวลา ✅")
 
 @bot.command()
 @commands.has_permissions(administrator=True)
 async def addvoicechannel(ctx, channel: discord.VoiceChannel):
     # voice_channels ควร unique (guild_id, channel_id)
-    sb_sync(
+    await sb_async(
         "addvoicechannel",
-        lambda: supabase.table("voice_channels").upsert(
+        lambda: get_supabase().table("voice_channels").upsert(
             {"guild_id": ctx.guild.id, "channel_id": channel.id},
             on_conflict="guild_id,channel_id"
         ).execute()
     )
+    _voice_cache["allowed"].pop(ctx.guild.id, None)
     await ctx.send(f"เพิ่มห้องเสียง {channel.mention} แล้ว ✅")
 
 @bot.command()
 @commands.has_permissions(administrator=True)
 async def listvoicechannels(ctx):
-    ids = list_voice_channels(ctx.guild.id)
+    ids = await list_voice_channels_async(ctx.guild.id)
     names = [ctx.guild.get_channel(cid).mention if ctx.guild.get_channel(cid) else f"`{cid}`" for cid in ids]
     await ctx.send("🔊 ห้องเสียงที่นับแต้ม:\n" + ("\n".join(names) if names else "ไม่มี"))
 
 @bot.command()
 @commands.has_permissions(administrator=True)
 async def setpoint(ctx, member: discord.Member, amount: int):
-    set_points(ctx.guild.id, member.id, amount)
+    await set_points_async(ctx.guild.id, member.id, amount)
     await ctx.send(f"✅ ตั้งค่าแต้ม {member.mention} เป็น **{amount}**")
 
 @bot.command()
 @commands.has_permissions(administrator=True)
 async def givepoint(ctx, member: discord.Member, amount: int):
-    before, after = add_points(ctx.guild.id, member.id, amount)
+    added = await add_points_async(ctx.guild.id, member.id, amount)
+    if added is None:
+        return await ctx.send("❌ เพิ่มแต้มไม่สำเร็จ ลองใหม่อีกครั้งนะ")
+    before, after = added
+    if before is None:
+        return await ctx.send(f"🕒 ฐานข้อมูลไม่ตอบ บันทึกการเพิ่ม **{amount}** แต้มให้ {member.mention} ไว้แล้ว จะเข้าระบบอัตโนมัติ")
     await ctx.send(f"✅ เพิ่มแต้ม {member.mention}: {before} -> {after}")
 
+def _bulk_paid_text(paid: dict, amount: int) -> str:
+    queued = sum(1 for before, _ in paid.values() if before is None)
+    text = f"✅ ให้ **{amount}** แต้ม กับ **{len(paid)}** คนแล้ว"
+    if queued:
+        text += f"\n🕒 ฐานข้อมูลไม่ตอบ {queued} คนบันทึกไว้แล้ว จะเข้าระบบอัตโนมัติ"
+    return text
+
+@bot.command()
+@commands.has_permissions(administrator=True)
+async def giverole(ctx, role: discord.Role, amount: int):
+    members = [m for m in role.members if not m.bot]
+    if not members:
+        return await ctx.send(f"❌ ไม่มีสมาชิกในยศ {role.name}")
+    paid = await add_points_bulk_async(ctx.guild.id, {m.id: amount for m in members})
+    if paid is None:
+        return await ctx.send("❌ เพิ่มแต้มไม่สำเร็จ ลองใหม่อีกครั้งนะ")
+    await ctx.send(_bulk_paid_text(paid, amount) + f" (ยศ {role.name})")
+
+@bot.command()
+@commands.has_permissions(administrator=True)
+async def givevoice(ctx, amount: int, channel: discord.VoiceChannel = None):
+    # ไม่ระบุห้อง → ห้องเสียงที่แอดมินอยู่ตอนนี้
+    channel = channel or (ctx.author.voice.channel if ctx.author.voice else None)
+    if channel is None:
+        return await ctx.send("❌ ระบุห้องเสียง หรือเข้าห้องเสียงก่อนใช้คำสั่งนะ")
+    members = [m for m in channel.members if not m.bot]
+    if not members:
+        return await ctx.send(f"❌ ไม่มีใครอยู่ในห้อง {channel.name}")
+    paid = await add_points_bulk_async(ctx.guild.id, {m.id: amount for m in members})
+    if paid is None:
+        return await ctx.send("❌ เพิ่มแต้มไม่สำเร็จ ลองใหม่อีกครั้งนะ")
+    await ctx.send(_bulk_paid_text(paid, amount) + f" (ห้อง {channel.name})")
+
+@bot.command()
+@commands.has_permissions(administrator=True)
+async def importpoints(ctx, mode: str = "set"):
+    # แนบไฟล์ CSV: user_id,points   mode: set = ตั้งแต้มตามไฟล์, add = บวกเพิ่ม
+    mode = mode.lower()
+    if mode not in ("set", "add"):
+        return await ctx.send("❌ ใช้ `!importpoints set` หรือ `!importpoints add`")
+    if not ctx.message.attachments:
+        return await ctx.send("❌ แนบไฟล์ CSV (user_id,points) มาด้วยนะ")
+    data = await ctx.message.attachments[0].read()
+    balances, bad = await run_db(parse_points_csv, data, mode)
+    if bad:
+        lines = ", ".join(map(str, bad[:10])) + (" ..." if len(bad) > 10 else "")
+        return await ctx.send(f"❌ อ่านบรรทัดไม่ได้: {lines} (ยังไม่ได้นำเข้าอะไร, สูงสุด {IMPORT_MAX_ROWS} คน)")
+    if not balances:
+        return await ctx.send("❌ ไม่พบข้อมูลในไฟล์")
+
+    if mode == "add":
+        paid = await add_points_bulk_async(ctx.guild.id, balances)
+        ok = paid is not None
+    else:
+        ok = await set_points_bulk_async(ctx.guild.id, balances)
+    if not ok:
+        return await ctx.send("❌ นำเข้าไม่สำเร็จ ลองใหม่อีกครั้งนะ")
+    await ctx.send(f"✅ นำเข้าแต้ม ({mode}) **{len(balances)}** คนแล้ว")
+
+@bot.command()
+@commands.has_permissions(administrator=True)
+async def exportpoints(ctx):
+    res = await run_db(export_points_csv, ctx.guild.id)
+    if res is None:
+        return await ctx.send("❌ ส่งออกไม่สำเร็จ ลองใหม่อีกครั้งนะ")
+    fp, count = res
+    try:
+        await ctx.send(f"📤 แต้มทั้งหมด **{count}** คน", file=discord.File(fp, filename=f"points_{ctx.guild.id}.csv"))
+    finally:
+        fp.close()
+
 @bot.command()
 async def points(ctx):
-    pts = get_points(ctx.guild.id, ctx.author.id)
+    pts = await get_points_async(ctx.guild.id, ctx.author.id)
     await ctx.send(f"<@{ctx.author.id}> ตอนนี้มี **{pts}** แต้ม ✅")
 
+@bot.command()
+async def leaderboard(ctx, page: int = 1):
+    embed = await leaderboard_embed(ctx.guild, page)
+    if embed is None:
+        return await ctx.send("❌ โหลดอันดับไม่สำเร็จ ลองใหม่อีกครั้งนะ")
+    await ctx.send(_own_rank_text(ctx.guild.id, ctx.author.id), embed=embed, view=LeaderboardView())
+
 @bot.command()
 @commands.has_permissions(administrator=True)
 async def setupgacha(ctx):
-    cost = int(get_setting(ctx.guild.id, "roll_cost", DEFAULT_ROLL_COST))
+    cost = int(await get_setting_async(ctx.guild.id, "roll_cost", DEFAULT_ROLL_COST))
     embed = discord.Embed(
         title="AURA GACHA",
-        description=f"กดสุ่มรางวัล ใช้ **{cost}** แต้ม/ครั้ง",
+        description=f"กดสุ่มรางวัล ใช้ **{cost}** แต้ม/ครั้ง (สุ่ม x{GACHA_MULTI_ROLL} ใช้ {cost * GACHA_MULTI_ROLL} แต้ม)",
         color=0xFF0033
     )
     await ctx.send(embed=embed, view=RollView())
 
+@bot.command()
+@commands.has_permissions(administrator=True)
+async def setreward(ctx, rate: float, *, name: str):
+    if rate < 0:
+        return await ctx.send("❌ rate ต้องไม่ติดลบ")
+    if await set_gacha_reward_async(ctx.guild.id, name, rate) is None:
+        return await ctx.send("❌ บันทึกไม่สำเร็จ ลองใหม่อีกครั้งนะ")
+    msg = f"✅ ตั้งรางวัล **{name}** rate = {rate}"
+    if await get_gacha_table_async(ctx.guild.id) is None:
+        msg += "\n⚠️ ทุกรางวัลมี rate = 0 → กาชาถูกปิด (กดสุ่มจะไม่หักแต้ม) จนกว่าจะตั้ง rate > 0 สักรางวัล"
+    await ctx.send(msg)
+
+@bot.command()
+@commands.has_permissions(administrator=True)
+async def delreward(ctx, *, name: str):
+    deleted = await delete_gacha_reward_async(ctx.guild.id, name)
+    if deleted is None:
+        return await ctx.send("❌ ลบไม่สำเร็จ ลองใหม่อีกครั้งนะ")
+    await ctx.send(f"✅ ลบรางวัล **{name}** แล้ว" if deleted else f"ไม่พบรางวัล **{name}** (ใช้ `!setreward` เพื่อสร้างตารางของกิลด์ก่อน)")
+
+@bot.command()
+@commands.has_permissions(administrator=True)
+async def rewards(ctx):
+    table = await get_gacha_table_async(ctx.guild.id)
+    if table is None:
+        return await ctx.send("🎁 กาชาถูกปิดอยู่: ทุกรางวัลมี rate = 0 (ใช้ `!setreward` ตั้ง rate > 0 เพื่อเปิด)")
+    lines = [f"• {n} — {table.chance(n) * 100:.2f}%" for n in table.names]
+    await ctx.send("🎁 ตารางรางวัลกาชา:\n" + "\n".join(lines))
+
+@bot.command()
+@commands.has_permissions(administrator=True)
+async def gachahistory(ctx, member: discord.Member | None = None, since: str = None):
+    # !gachahistory [@member] [since:YYYY-MM-DD]
+    since_at = _parse_since(since)
+    if since and since_at is None:
+        return await ctx.send("❌ รูปแบบวันที่ไม่ถูก ใช้ `since:YYYY-MM-DD` เช่น `since:2024-05-01`")
+    embed = await gacha_history_embed(ctx.guild, member.id if member else None, since=since_at)
+    if embed is None:
+        return await ctx.send("❌ โหลดประวัติไม่สำเร็จ ลองใหม่อีกครั้งนะ")
+    await ctx.send(embed=embed, view=GachaHistoryView())
+
+@bot.command()
+@commands.has_permissions(administrator=True)
+async def gachastats(ctx):
+    stats = await load_gacha_stats_async(ctx.guild.id)
+    if stats is None:
+        return await ctx.send("❌ โหลดสถิติไม่สำเร็จ ลองใหม่อีกครั้งนะ")
+    if not stats:
+        return await ctx.send("ยังไม่มีใครสุ่มกาชาเลย")
+    table = await get_gacha_table_async(ctx.guild.id)
+    total = sum(int(r["rolls"]) for r in stats)
+    lines = [
+        f"• {r['reward']} — {r['rolls']} ครั้ง ({int(r['rolls']) / total * 100:.2f}% / ตั้งไว้ {(table.chance(r['reward']) if table else 0) * 100:.2f}%)"
+        for r in stats
+    ]
+    spent = sum(int(r["points_spent"] or 0) for r in stats)
+    await ctx.send(f"📊 สถิติกาชา: สุ่มทั้งหมด **{total}** ครั้ง ใช้ไป **{spent}** แต้ม\n" + "\n".join(lines))
+
 @bot.command()
 @commands.has_permissions(administrator=True)
 async def setupdaily(ctx):
-    amt = int(get_setting(ctx.guild.id, "daily_amount", DEFAULT_DAILY_AMOUNT))
+    amt = int(await get_setting_async(ctx.guild.id, "daily_amount", DEFAULT_DAILY_AMOUNT))
     embed = discord.Embed(
         title="DAILY CLAIM",
         description=f"รับได้วันละครั้ง (+{amt} แต้ม)",
@@ -429,6 +1962,57 @@ async def setupdaily(ctx):
 async def pingbot(ctx):
     await ctx.send(f"pong ✅ latency {round(bot.latency*1000)}ms")
 
+@bot.command()
+@commands.has_permissions(administrator=True)
+async def dbstats(ctx):
+    st = db_stats()
+    sc = settings_cache_stats()
+    lg = log_dispatcher.stats()
+    dm = dm_stats()
+    jr = journal_stats()
+    ticks = " | ".join(
+        f"{name} {st['last_seconds'] * 1000:.0f}ms (ข้าม {st['skipped']})" for name, st in _tick_stats.items()
+    )
+    await ctx.send(
+        f"🗄️ DB executor: รอคิว **{st['queued']}** | กำลังทำ **{st['in_flight']}** / {st['workers']} threads\n"
+        f"⚙️ settings cache: hit **{sc['hits']}** | miss **{sc['misses']}** | "
+        f"evict {sc['evictions']} | {sc['guilds']} กิลด์\n"
+        f"📝 log: คิว **{lg['queued']}** | ส่งแล้ว {lg['lines']} บรรทัด / {lg['messages']} ข้อความ | "
+        f"ทิ้ง **{lg['dropped']}** | error {lg['errors']}\n"
+        f"✉️ DM: คิว **{dm['queued']}** | ส่งแล้ว {dm['sent']} | ล้มเหลว {dm['failed']} | ทิ้ง {dm['dropped']}\n"
+        f"💾 journal: ค้าง **{jr['depth']}** (เก่าสุด {jr['lag_seconds']}s) | breaker {jr['breaker']}\n"
+        f"⏱️ tick: {ticks or '-'}"
+    )
+
+
+# ======================
+# Profiling (!profile) + event loop stall watchdog
+# ======================
+LOOP_STALLS = metrics.Counter("aura_loop_stalls_total", "Event loop stalls longer than LOOP_STALL_MS")
+LOOP_STALL_SECONDS = metrics.Histogram(
+    "aura_loop_stall_seconds", "Length of event loop stalls", buckets=(0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+_profile_lock = asyncio.Lock()
+
+def _record_loop_stall(seconds: float):
+    # เรียกจาก thread ของ watchdog (metrics ไม่ใช้ lock อยู่แล้ว)
+    LOOP_STALLS.inc()
+    LOOP_STALL_SECONDS.observe(value=seconds)
+
+@bot.command()
+@commands.has_permissions(administrator=True)
+async def profile(ctx, seconds: float = 10):
+    seconds = min(max(seconds, 1.0), PROFILE_MAX_SECONDS)
+    if _profile_lock.locked():
+        return await ctx.send("❌ กำลังเก็บ profile อยู่แล้ว รอสักครู่นะ")
+    async with _profile_lock:
+        await ctx.send(f"⏱️ กำลังเก็บ profile {seconds:.0f} วินาที ...")
+        text, samples = await asyncio.to_thread(sample_stacks, seconds)
+    await ctx.send(
+        f"🔥 profile {seconds:.0f} วินาที ({samples} samples) — เปิดด้วย speedscope.app หรือ flamegraph.pl",
+        file=discord.File(io.BytesIO(text.encode("utf-8")), filename=f"profile-{int(time.time())}.folded"),
+    )
+
 
 # ======================
 # Command Error Handler (กันคำสั่งเงียบ)
@@ -446,14 +2030,15 @@ async def on_command_error(ctx, error):
 # ======================
 # Voice tracking loop (เสถียร + ไม่หนัก)
 # ======================
-def is_member_effectively_muted(member: discord.Member) -> bool:
-    vs = member.voice
+def is_voice_state_muted(vs) -> bool:
     return (not vs) or any([vs.self_mute, vs.self_deaf, vs.mute, vs.deaf])
 
+def is_member_effectively_muted(member: discord.Member) -> bool:
+    return is_voice_state_muted(member.voice)
+
 # cache ลดการยิง DB
 _voice_cache = {
     "allowed": {},  # guild_id -> (ts, set(channel_ids))
-    "settings": {}, # guild_id -> (ts, reward_minutes, reward_points, mute_limit)
 }
 CACHE_SECONDS = 30
 
@@ -467,86 +2052,668 @@ def _get_cached_allowed(guild_id: int):
     return allowed
 
 def _get_cached_settings(guild_id: int):
-    now = datetime.now(timezone.utc).timestamp()
-    item = _voice_cache["settings"].get(guild_id)
-    if item and (now - item[0]) < CACHE_SECONDS:
-        return item[1], item[2], item[3]
+    # อ่านจาก settings cache ของกิลด์ (write-through จาก !set* เลยไม่ค้าง 30 วิ)
+    values = get_guild_settings(guild_id)
 
-    reward_min_raw = get_setting(guild_id, "voice_reward_minutes")
+    reward_min_raw = values.get("voice_reward_minutes")
     reward_minutes = int(reward_min_raw) if reward_min_raw else DEFAULT_VOICE_REWARD_MINUTES
 
-    reward_pts_raw = get_setting(guild_id, "voice_reward_points")
+    reward_pts_raw = values.get("voice_reward_points")
     reward_points = int(reward_pts_raw) if reward_pts_raw else DEFAULT_VOICE_REWARD_POINTS
 
-    mute_limit_raw = get_setting(guild_id, "voice_mute_limit_min")
+    mute_limit_raw = values.get("voice_mute_limit_min")
     mute_limit = int(mute_limit_raw) if mute_limit_raw else DEFAULT_VOICE_MUTE_LIMIT_MIN
 
-    _voice_cache["settings"][guild_id] = (now, reward_minutes, reward_points, mute_limit)
     return reward_minutes, reward_points, mute_limit
 
+TICK_FRESH_SKIPPED = metrics.Counter(
+    "aura_voice_tick_fresh_skipped_total", "Members skipped because another process ticked them within VOICE_TICK_MIN_GAP",
+)
+
+# state ของ voice_tick ต่อกิลด์ (array ขนานกัน แทน dict ต่อแถว) — อ่าน DB เฉพาะคนที่เพิ่งเข้ามา
+_voice_states = {}  # guild_id -> GuildVoiceState
+
+metrics.CallbackMetric(
+    "aura_voice_state", "Poll-mode voice state held in memory",
+    lambda: {
+        ("members",): sum(len(st) for st in _voice_states.values()),
+        ("bytes",): sum(st.nbytes() for st in _voice_states.values()),
+    },
+    ("stat",),
+)
+
+async def _tick_guild_voice(guild: discord.Guild):
+    """
+    Batched tick for one guild, on the guild's GuildVoiceState:
+      1 select (voice_progress) only for members not in the state yet or not verified yet
+      + 1 bulk points update (only if someone hit the reward)
+      + 1 multi-row upsert (voice_progress)
+    Members whose row was ticked less than VOICE_TICK_MIN_GAP ago (by another
+    process of the same shard during a restart) are left alone.
+    Returns (members_processed, rewards) where rewards = [(member, before, after)].
+    """
+    allowed = await run_db(_get_cached_allowed, guild.id)
+    if not allowed:
+        return 0, []
+
+    reward_minutes, reward_points, mute_limit = await run_db(_get_cached_settings, guild.id)
+
+    # ✅ วนเฉพาะคนที่อยู่ในห้องที่อนุญาต (ไม่วนทั้งกิลด์)
+    present = {}
+    for ch_id in allowed:
+        ch = guild.get_channel(ch_id)
+        if ch and hasattr(ch, "members"):
+            for m in ch.members:
+                if not m.bot and m.voice and m.voice.channel:
+                    present[m.id] = m
+
+    # ไม่มีคนในห้องเสียงที่อนุญาต ก็จบ
+    if not present:
+        return 0, []
+
+    state = _voice_states.get(guild.id)
+    if state is None:
+        state = _voice_states[guild.id] = GuildVoiceState()
+    missing = state.missing(present)
+    recheck = state.unverified(present, VOICE_STATE_VERIFY_TICKS)
+    if missing or recheck:
+        rows = await get_voice_progress_bulk_async(guild.id, missing + recheck)
+        if rows is None:
+            # อ่านไม่ได้ ห้ามเขียนทับด้วยค่า 0 / ไม่รู้ว่ามีใคร tick อยู่ → รอบนี้ tick เฉพาะคนที่ยืนยันแล้ว
+            for uid in missing + recheck:
+                present.pop(uid)
+        else:
+            for uid in missing:
+                state.load(uid, rows.get(uid))
+            for uid in recheck:
+                state.reconcile(uid, rows.get(uid))
+        if not present:
+            return 0, []
+
+    tick_at = datetime.now(timezone.utc)
+    now = tick_at.timestamp()
+    updated, rewarded, fresh = state.tick(
+        ((m.id, m.voice.channel.id, is_member_effectively_muted(m)) for m in present.values()),
+        now, reward_minutes, mute_limit, VOICE_TICK_MIN_GAP,
+    )
+
+    rewards = []
+    if rewarded:
+        to_reward = [present[state.user_ids[i]] for i in rewarded]
+        paid = await add_points_bulk_async(guild.id, {m.id: reward_points for m in to_reward})
+        if paid is None:
+            # จ่ายแต้มไม่สำเร็จ → ไม่รีเซ็ต active ให้ลองจ่ายใหม่รอบหน้า
+            state.unpay(rewarded, reward_minutes)
+        else:
+            rewards = [(m, *paid[m.id]) for m in to_reward]
+
+    if fresh:
+        TICK_FRESH_SKIPPED.inc(amount=fresh)
+    await update_voice_progress_bulk_async(guild.id, state.updates(updated), tick_at)
+    return len(present) - fresh, rewards
+
+def prune_voice_states(now: float) -> int:
+    """Drop idle members from every tracked guild (also guilds whose channels emptied out). Returns how many."""
+    dropped = 0
+    for gid, state in list(_voice_states.items()):
+        dropped += state.prune(now - VOICE_STATE_IDLE_SECONDS)
+        if not len(state):
+            _voice_states.pop(gid, None)
+    return dropped
+
+# ======================
+# DM แจ้งรางวัล (ส่งผ่านคิว ไม่ await ใน tick)
+# ======================
+_dm_queue = None  # asyncio.Queue สร้างตอนใช้ครั้งแรก (ต้องมี loop)
+_dm_workers = []
+_dm_stats = {"sent": 0, "failed": 0, "dropped": 0}
+
+def dm_stats() -> dict:
+    return {**_dm_stats, "queued": _dm_queue.qsize() if _dm_queue else 0}
+
+metrics.CallbackMetric(
+    "aura_dm_queue", "Reward DM sender counters (queued is current depth)",
+    lambda: {(k,): v for k, v in dm_stats().items()}, ("stat",),
+)
+
+async def _dm_worker():
+    while True:
+        member, text = await _dm_queue.get()
+        try:
+            with tracing.span("discord dm send"):
+                await member.send(text)
+            _dm_stats["sent"] += 1
+        except Exception:
+            _dm_stats["failed"] += 1
+
+def queue_dm(member, text: str) -> bool:
+    """Hand a DM to the bounded sender queue. Returns False if the queue is full."""
+    global _dm_queue
+    if _dm_queue is None:
+        _dm_queue = asyncio.Queue(maxsize=DM_QUEUE_MAX)
+    if not _dm_workers:
+        _dm_workers.extend(asyncio.create_task(_dm_worker(), context=tracing.detached()) for _ in range(max(1, DM_WORKERS)))
+    try:
+        _dm_queue.put_nowait((member, text))
+        return True
+    except asyncio.QueueFull:
+        _dm_stats["dropped"] += 1
+        return False
+
+def _dm_voice_reward(member, reward_minutes: int, reward_points: int, before: int, after: int):
+    queue_dm(
+        member,
+        f"🎧 คุณอยู่ห้องเสียงครบ {reward_minutes} นาทีแล้ว!\n"
+        f"ได้รับ +{reward_points} แต้ม ✅\n"
+        + (f"คะแนน: {before} → {after}" if before is not None else "คะแนนจะอัปเดตเมื่อระบบฐานข้อมูลกลับมา")
+    )
+
+
+# ======================
+# Tick runner: หลายกิลด์พร้อมกัน + กันรอบซ้อน
+# ======================
+_tick_tasks = {}  # ชื่อ loop -> asyncio.Task ของรอบที่กำลังทำ
+_last_tick_ok = {}  # ชื่อ loop -> time.monotonic() ของรอบที่สำเร็จล่าสุด (ใช้ใน /readyz)
+_tick_stats = {}  # ชื่อ loop -> {"runs", "skipped", "last_seconds"}
+
+TICK_SECONDS = metrics.Histogram(
+    "aura_voice_tick_seconds", "Duration of one voice tick / checkpoint", ("loop",),
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 45, 60, 120),
+)
+TICK_MEMBERS = metrics.Counter("aura_voice_tick_members_total", "Voice members processed by ticks", ("loop",))
+metrics.CallbackMetric(
+    "aura_voice_tick_skipped_total", "Ticks skipped because the previous one overran",
+    lambda: {(name,): st["skipped"] for name, st in _tick_stats.items()}, ("loop",), kind="counter",
+)
+
+async def run_for_guilds(label: str, fn):
+    """
+    Run `await fn(guild)` for every guild this shard owns, at most VOICE_TICK_CONCURRENCY at once.
+    A guild that raises is logged and skipped without affecting the others.
+    Returns {guild_id: (seconds, result)}.
+    """
+    sem = asyncio.Semaphore(max(1, VOICE_TICK_CONCURRENCY))
+    out = {}
+
+    async def one(guild):
+        async with sem:
+            t0 = time.perf_counter()
+            try:
+                res = await fn(guild)
+            except Exception as e:
+                print(f"[{label} ERROR] guild={guild.id}", type(e).__name__, e)
+                res = None
+            out[guild.id] = (time.perf_counter() - t0, res)
+
+    await asyncio.gather(*(one(g) for g in owned_guilds()))
+    return out
+
+def _log_tick(label: str, seconds: float, per_guild: dict, members: int, db_calls: int):
+    slow = sorted(per_guild.items(), key=lambda kv: kv[1][0], reverse=True)[:5]
+    print(
+        f"[{label}] {seconds * 1000:.0f}ms guilds={len(per_guild)} members={members} db_calls={db_calls} "
+        f"slowest=" + ", ".join(f"{gid}:{t * 1000:.0f}ms" for gid, (t, _) in slow)
+    )
+
+def launch_tick(label: str, coro_fn) -> bool:
+    """
+    Start one tick in the background. If the previous tick of the same loop is
+    still running the new one is skipped (counted) instead of stacking up.
+    """
+    st = _tick_stats.setdefault(label, {"runs": 0, "skipped": 0, "last_seconds": 0.0})
+    prev = _tick_tasks.get(label)
+    if prev is not None and not prev.done():
+        st["skipped"] += 1
+        print(f"[{label}] รอบก่อนยังไม่จบ (overrun) → ข้ามรอบนี้ (skipped={st['skipped']})")
+        return False
+
+    async def runner():
+        t0 = time.perf_counter()
+        try:
+            await coro_fn()
+            _last_tick_ok[label] = time.monotonic()
+        except Exception as e:
+            # กัน loop หลุดแล้ว task ตาย
+            print(f"[{label} ERROR]", type(e).__name__, e)
+        finally:
+            st["runs"] += 1
+            st["last_seconds"] = time.perf_counter() - t0
+            TICK_SECONDS.observe(label, value=st["last_seconds"])
+
+    _tick_tasks[label] = asyncio.create_task(runner())
+    return True
+
+async def _voice_tick_once():
+    t0 = time.perf_counter()
+    calls_before = sb_call_count()
+
+    async def guild_tick(guild):
+        processed, rewards = await _tick_guild_voice(guild)
+        if rewards:
+            reward_minutes, reward_points, _ = await run_db(_get_cached_settings, guild.id)
+            for member, before, after in rewards:
+                _dm_voice_reward(member, reward_minutes, reward_points, before, after)
+        return processed
+
+    per_guild = await run_for_guilds("VOICE_TICK", guild_tick)
+    prune_voice_states(time.time())
+    members_total = sum(res or 0 for _, res in per_guild.values())
+    TICK_MEMBERS.inc("VOICE_TICK", amount=members_total)
+    if members_total:
+        _log_tick("VOICE_TICK", time.perf_counter() - t0, per_guild, members_total, sb_call_count() - calls_before)
+
 @tasks.loop(minutes=1)
 async def voice_tick():
-    try:
-        for guild in bot.guilds:
-            allowed = _get_cached_allowed(guild.id)
-            if not allowed:
-                continue
+    launch_tick("VOICE_TICK", _voice_tick_once)
 
-            reward_minutes, reward_points, mute_limit = _get_cached_settings(guild.id)
+@voice_tick.before_loop
+async def before_voice_tick():
+    await bot.wait_until_ready()
 
-            # ✅ วนเฉพาะคนที่อยู่ในห้องที่อนุญาต (ไม่วนทั้งกิลด์)
-            voice_members = []
-            for ch_id in allowed:
-                ch = guild.get_channel(ch_id)
-                if ch and hasattr(ch, "members"):
-                    voice_members.extend([m for m in ch.members if not m.bot])
 
-            # ไม่มีคนในห้องเสียงที่อนุญาต ก็จบ
-            if not voice_members:
-                continue
+# ======================
+# Voice tracking แบบ event (VOICE_TRACKING_MODE=events)
+# ======================
+class VoiceSession:
+    """
+    In-memory voice session of one member in an allowed channel.
+    The open segment starts at `since` (time.monotonic()); settle() folds it into
+    active_sec / muted_sec using the same rules as voice_tick:
+    unmuted time adds to active and resets the mute streak,
+    muted time grows the streak and wipes active once it reaches the mute limit.
+    """
+    __slots__ = ("channel_id", "muted", "since", "active_sec", "muted_sec")
+
+    def __init__(self, channel_id: int, muted: bool, since: float, active_minutes: int = 0, muted_minutes: int = 0):
+        self.channel_id = channel_id
+        self.muted = muted
+        self.since = since
+        self.active_sec = float(active_minutes) * 60
+        self.muted_sec = 0.0 if not muted else float(muted_minutes) * 60
+
+    @classmethod
+    def from_row(cls, row, channel_id: int, muted: bool, since: float):
+        row = row or {}
+        return cls(
+            channel_id, muted, since,
+            int(row.get("active_minutes") or 0),
+            int(row.get("muted_streak_minutes") or 0),
+        )
 
-            for member in voice_members:
-                vs = member.voice
-                if not vs or not vs.channel:
-                    continue
-
-                row = get_or_create_voice_progress(guild.id, member.id)
-                active = int(row.get("active_minutes") or 0)
-                muted_streak = int(row.get("muted_streak_minutes") or 0)
-
-                if is_member_effectively_muted(member):
-                    muted_streak += 1
-                    if muted_streak >= mute_limit:
-                        active = 0
-                    update_voice_progress(guild.id, member.id, vs.channel.id, active, muted_streak)
-                    continue
-
-                muted_streak = 0
-                active += 1
-
-                if active >= reward_minutes:
-                    before, after = add_points(guild.id, member.id, reward_points)
-                    active = 0
-                    try:
-                        await member.send(
-                            f"🎧 คุณอยู่ห้องเสียงครบ {reward_minutes} นาทีแล้ว!\n"
-                            f"ได้รับ +{reward_points} แต้ม ✅\n"
-                            f"คะแนน: {before} → {after}"
-                        )
-                    except Exception:
-                        pass
-
-                update_voice_progress(guild.id, member.id, vs.channel.id, active, muted_streak)
+    def settle(self, now: float, reward_sec: float, mute_limit_sec: float) -> int:
+        """Close the open segment at `now`. Returns how many rewards were earned in it."""
+        dt = max(0.0, now - self.since)
+        self.since = now
+        if self.muted:
+            self.muted_sec += dt
+            if self.muted_sec >= mute_limit_sec:
+                self.active_sec = 0.0
+            return 0
+
+        self.muted_sec = 0.0
+        self.active_sec += dt
+        if reward_sec <= 0:
+            return 0
+        earned = int(self.active_sec // reward_sec)
+        self.active_sec -= earned * reward_sec
+        return earned
+
+    def move(self, channel_id: int, muted: bool):
+        """Start a new segment (call right after settle)."""
+        self.channel_id = channel_id
+        if not muted:
+            self.muted_sec = 0.0
+        self.muted = muted
+
+    def as_update(self, user_id: int):
+        return (user_id, self.channel_id, int(self.active_sec // 60), int(self.muted_sec // 60))
+
+_voice_sessions = {}  # guild_id -> {user_id: VoiceSession}
+_voice_locks = {}     # guild_id -> asyncio.Lock (กัน event ซ้อนกับ checkpoint)
+_voice_checkpoint_runs = 0
+
+def _voice_lock(guild_id: int) -> asyncio.Lock:
+    lock = _voice_locks.get(guild_id)
+    if lock is None:
+        lock = _voice_locks[guild_id] = asyncio.Lock()
+    return lock
+
+async def _pay_voice_sessions(guild: discord.Guild, earned: dict, reward_minutes: int, reward_points: int):
+    """
+    earned: {user_id: (member, session, reward_count)}. One bulk increment for everyone.
+    If the payout fails the earned time is put back so the next settle pays it again.
+    """
+    if not earned:
+        return
+    reward_sec = reward_minutes * 60
+    paid = await add_points_bulk_async(guild.id, {uid: n * reward_points for uid, (_, _, n) in earned.items()})
+    if paid is None:
+        for _, sess, n in earned.values():
+            sess.active_sec += n * reward_sec
+        return
+    for uid, (member, _, n) in earned.items():
+        if uid in paid:
+            _dm_voice_reward(member, reward_minutes * n, reward_points * n, *paid[uid])
 
+@bot.event
+async def on_voice_state_update(member: discord.Member, before: discord.VoiceState, after: discord.VoiceState):
+    if VOICE_TRACKING_MODE != "events" or member.bot or not owns_guild(member.guild.id):
+        return
+    try:
+        guild = member.guild
+        allowed = await run_db(_get_cached_allowed, guild.id)
+        reward_minutes, reward_points, mute_limit = await run_db(_get_cached_settings, guild.id)
+        in_allowed = bool(after.channel and after.channel.id in allowed)
+
+        earned = {}
+        async with _voice_lock(guild.id):
+            sessions = _voice_sessions.setdefault(guild.id, {})
+            sess = sessions.get(member.id)
+            if sess is None:
+                if not in_allowed:
+                    return
+                # join: โหลดความคืบหน้าเดิมครั้งเดียว (ถ้าพลาด checkpoint จะเก็บให้ทีหลัง)
+                rows = await get_voice_progress_bulk_async(guild.id, [member.id])
+                if rows is not None:
+                    sessions[member.id] = VoiceSession.from_row(
+                        rows.get(member.id), after.channel.id, is_voice_state_muted(after), time.monotonic()
+                    )
+                return
+
+            n = sess.settle(time.monotonic(), reward_minutes * 60, mute_limit * 60)
+            if n:
+                earned[member.id] = (member, sess, n)
+            if in_allowed:
+                # mute / unmute / ย้ายห้อง
+                sess.move(after.channel.id, is_voice_state_muted(after))
+            else:
+                # leave (หรือย้ายไปห้องที่ไม่นับ)
+                del sessions[member.id]
+
+            # จ่าย + เขียนแถวให้เสร็จก่อนปล่อย lock: ถ้ากลับเข้าห้องเร็วๆ join จะอ่านแถวที่เขียนแล้ว
+            # ไม่ใช่แถวเก่า (ที่อาจยังไม่หักรางวัลที่เพิ่งจ่าย → ได้ซ้ำ)
+            await _pay_voice_sessions(guild, earned, reward_minutes, reward_points)
+            if not in_allowed or earned:
+                await update_voice_progress_bulk_async(guild.id, [sess.as_update(member.id)])
     except Exception as e:
-        # กัน loop หลุดแล้ว task ตาย
-        print("[VOICE_TICK ERROR]", type(e).__name__, e)
+        print("[VOICE_EVENT ERROR]", type(e).__name__, e)
 
-@voice_tick.before_loop
-async def before_voice_tick():
+async def _checkpoint_guild_voice(guild: discord.Guild, persist_all: bool):
+    """
+    Settle every open session of a guild, pay due rewards in one bulk call and
+    persist rows that were rewarded or closed (or everyone when persist_all).
+    Also reconciles sessions with who is actually in the allowed channels,
+    so missed gateway events and members already in voice at startup are covered.
+    """
+    allowed = await run_db(_get_cached_allowed, guild.id)
+    reward_minutes, reward_points, mute_limit = await run_db(_get_cached_settings, guild.id)
+
+    present = {}
+    for ch_id in allowed:
+        ch = guild.get_channel(ch_id)
+        if ch and hasattr(ch, "members"):
+            for m in ch.members:
+                if not m.bot and m.voice and m.voice.channel:
+                    present[m.id] = m
+
+    earned = {}
+    to_persist = {}  # user_id -> VoiceSession
+    async with _voice_lock(guild.id):
+        sessions = _voice_sessions.setdefault(guild.id, {})
+        if not sessions and not present:
+            return 0
+
+        now = time.monotonic()
+        missing = [uid for uid in present if uid not in sessions]
+        if missing:
+            rows = await get_voice_progress_bulk_async(guild.id, missing)
+            if rows is not None:
+                for uid in missing:
+                    m = present[uid]
+                    sessions[uid] = VoiceSession.from_row(rows.get(uid), m.voice.channel.id, is_member_effectively_muted(m), now)
+
+        for uid, sess in list(sessions.items()):
+            n = sess.settle(now, reward_minutes * 60, mute_limit * 60)
+            member = present.get(uid)
+            if member is None:
+                # หลุด event ออกห้อง → ปิด session
+                del sessions[uid]
+                to_persist[uid] = sess
+                member = guild.get_member(uid)
+            else:
+                sess.move(member.voice.channel.id, is_member_effectively_muted(member))
+                if persist_all:
+                    to_persist[uid] = sess
+            if n and member is not None:
+                earned[uid] = (member, sess, n)
+                to_persist[uid] = sess
+
+        # ใต้ lock เหมือน on_voice_state_update: session ที่ปิดไปต้องลง DB ก่อน join รอบใหม่จะอ่าน
+        await _pay_voice_sessions(guild, earned, reward_minutes, reward_points)
+        await update_voice_progress_bulk_async(guild.id, [sess.as_update(uid) for uid, sess in to_persist.items()])
+    return len(present)
+
+async def _voice_checkpoint_once():
+    global _voice_checkpoint_runs
+    _voice_checkpoint_runs += 1
+    persist_all = (_voice_checkpoint_runs % max(1, VOICE_PERSIST_MINUTES)) == 0
+    t0 = time.perf_counter()
+    calls_before = sb_call_count()
+
+    per_guild = await run_for_guilds("VOICE_CHECKPOINT", lambda g: _checkpoint_guild_voice(g, persist_all))
+    members_total = sum(res or 0 for _, res in per_guild.values())
+    TICK_MEMBERS.inc("VOICE_CHECKPOINT", amount=members_total)
+    if members_total:
+        _log_tick("VOICE_CHECKPOINT", time.perf_counter() - t0, per_guild, members_total, sb_call_count() - calls_before)
+
+@tasks.loop(minutes=1)
+async def voice_checkpoint():
+    launch_tick("VOICE_CHECKPOINT", _voice_checkpoint_once)
+
+@voice_checkpoint.before_loop
+async def before_voice_checkpoint():
     await bot.wait_until_ready()
 
 
+# ======================
+# Startup warm-up (โหลด cache ทุกกิลด์เป็นก้อนตอนบูต ก่อนเริ่ม tick)
+# ======================
+WARM_GUILD_CHUNK = 100   # guild_id ต่อ 1 select
+WARM_PAGE_ROWS = 1000    # PostgREST ตัดผลที่ max-rows → อ่านทีละหน้า
+
+_warm_state = {"task": None, "done": False, "seconds": None, "rows": {}}
+
+def _select_pages(label: str, build):
+    """Run build() (a select with a stable order) page by page with range(). Returns all rows, or None on failure."""
+    rows = []
+    while True:
+        start = len(rows)
+        res = sb_sync(label, lambda: build().range(start, start + WARM_PAGE_ROWS - 1).execute())
+        if res is None:
+            return None
+        page = getattr(res, "data", None) or []
+        rows.extend(page)
+        if len(page) < WARM_PAGE_ROWS:
+            return rows
+
+def warm_guild_caches(guild_ids: list) -> dict:
+    """Fill the settings cache and the allowed-voice-channel cache for many guilds with in_() selects."""
+    counts = {"settings": 0, "voice_channels": 0}
+    for chunk in _chunks(guild_ids, WARM_GUILD_CHUNK):
+        rows = _select_pages(
+            "warm settings",
+            lambda: get_supabase().table("settings").select("guild_id,key,value").in_("guild_id", chunk).order("guild_id").order("key"),
+        )
+        if rows is not None:
+            per_guild = {gid: {} for gid in chunk}
+            for r in rows:
+                per_guild.setdefault(int(r["guild_id"]), {})[r["key"]] = r.get("value")
+            for gid, values in per_guild.items():
+                _settings_store(gid, values)
+            counts["settings"] += len(rows)
+
+        rows = _select_pages(
+            "warm voice_channels",
+            lambda: get_supabase().table("voice_channels").select("guild_id,channel_id").in_("guild_id", chunk).order("guild_id").order("channel_id"),
+        )
+        if rows is not None:
+            now = datetime.now(timezone.utc).timestamp()
+            allowed = {gid: set() for gid in chunk}
+            for r in rows:
+                try:
+                    allowed.setdefault(int(r["guild_id"]), set()).add(int(r["channel_id"]))
+                except Exception:
+                    pass
+            for gid, ids in allowed.items():
+                _voice_cache["allowed"][gid] = (now, ids)
+            counts["voice_channels"] += len(rows)
+    return counts
+
+def warm_voice_progress(members_by_guild: dict) -> dict:
+    """
+    members_by_guild: {guild_id: [user_id]} of members sitting in allowed channels.
+    Reads their voice_progress rows across guilds (user ids in chunks of BULK_IN_CHUNK).
+    Returns {(guild_id, user_id): row}, or None on failure.
+    """
+    pairs = [(gid, uid) for gid, uids in members_by_guild.items() for uid in uids]
+    found = {}
+    for chunk in _chunks(pairs, BULK_IN_CHUNK):
+        wanted = set(chunk)
+        gids = sorted({gid for gid, _ in chunk})
+        uids = sorted({uid for _, uid in chunk})
+        rows = _select_pages(
+            "warm voice_progress",
+            lambda: get_supabase().table("voice_progress").select("*").in_("guild_id", gids).in_("user_id", uids).order("guild_id").order("user_id"),
+        )
+        if rows is None:
+            return None
+        for r in rows:
+            key = (int(r["guild_id"]), int(r["user_id"]))
+            if key in wanted:
+                found[key] = r
+    return found
+
+def _voice_members(guild: discord.Guild) -> list:
+    """Non-bot members currently in the guild's allowed voice channels (allowed set must be cached)."""
+    item = _voice_cache["allowed"].get(guild.id)
+    members = []
+    for ch_id in (item[1] if item else ()):
+        ch = guild.get_channel(ch_id)
+        if ch and hasattr(ch, "members"):
+            members.extend(m for m in ch.members if not m.bot and m.voice and m.voice.channel)
+    return members
+
+async def warm_up():
+    """
+    Bulk-load settings, voice channels and the voice_progress rows of members already
+    in voice for every guild, then start the voice loop so its first run is already warm.
+    """
+    t0 = time.perf_counter()
+    calls_before = sb_call_count()
+    rows = {}
+    try:
+        guilds = owned_guilds()
+        rows.update(await run_db(warm_guild_caches, [g.id for g in guilds]))
+
+        # voice_progress ลงที่เก็บของแต่ละโหมด: write-behind cache / session ของโหมด events / voice state ของ poll
+        present = {g.id: _voice_members(g) for g in guilds}
+        progress = await run_db(warm_voice_progress, {gid: [m.id for m in ms] for gid, ms in present.items() if ms})
+        if progress is not None:
+            rows["voice_progress"] = len(progress)
+            if WRITE_BEHIND:
+                for (gid, uid), row in progress.items():
+                    _wb_voice.put_loaded(gid, uid, row)
+            if VOICE_TRACKING_MODE == "events":
+                now = time.monotonic()
+                for g in guilds:
+                    async with _voice_lock(g.id):
+                        sessions = _voice_sessions.setdefault(g.id, {})
+                        for m in present[g.id]:
+                            if m.id not in sessions:
+                                sessions[m.id] = VoiceSession.from_row(
+                                    progress.get((g.id, m.id)), m.voice.channel.id, is_member_effectively_muted(m), now
+                                )
+            else:
+                for g in guilds:
+                    if present[g.id]:
+                        state = _voice_states.setdefault(g.id, GuildVoiceState())
+                        for m in present[g.id]:
+                            state.load(m.id, progress.get((g.id, m.id)))
+    except Exception as e:
+        print("[WARMUP-ERROR]", type(e).__name__, e)
+    finally:
+        seconds = time.perf_counter() - t0
+        _warm_state.update(done=True, seconds=round(seconds, 3), rows=rows)
+        print(
+            f"[WARMUP] {len(owned_guilds())} guilds in {seconds * 1000:.0f}ms | "
+            + " ".join(f"{k}={v}" for k, v in rows.items())
+            + f" | db_calls={sb_call_count() - calls_before}"
+        )
+
+        if VOICE_TRACKING_MODE == "events":
+            if not voice_checkpoint.is_running():
+                voice_checkpoint.start()
+        elif not voice_tick.is_running():
+            voice_tick.start()
+
+
+# ======================
+# Health / readiness (/healthz, /readyz บน myserver)
+# ======================
+_started_at = time.monotonic()
+metrics.CallbackMetric("aura_guilds", "Guilds owned by this shard", lambda: {(): len(owned_guilds())})
+_db_probe_state = {"ok": None, "latency_ms": None, "checked_at": None}
+
+@tasks.loop(seconds=DB_PROBE_SECONDS)
+async def db_probe():
+    # /readyz อ่านผลจากตรงนี้ ไม่ยิง DB ทุก request
+    t0 = time.perf_counter()
+    res = await sb_async(
+        "db_probe",
+        lambda: get_supabase().table("settings").select("guild_id").limit(1).execute(),
+        retries=1,
+    )
+    _db_probe_state.update(
+        ok=res is not None,
+        latency_ms=round((time.perf_counter() - t0) * 1000, 1),
+        checked_at=time.monotonic(),
+    )
+
+def readiness():
+    """
+    Ready = gateway connected with a sane heartbeat, the startup warm-up has
+    finished and the voice loop has completed a tick recently. DB reachability is reported but does not fail
+    readiness: restarting the bot doesn't fix a Supabase outage.
+    """
+    now = time.monotonic()
+    latency = bot.latency
+    gateway_ok = bot.is_ready() and not bot.is_closed() and math.isfinite(latency) and latency < READY_MAX_LATENCY
+
+    loop_name = "VOICE_CHECKPOINT" if VOICE_TRACKING_MODE == "events" else "VOICE_TICK"
+    last_ok = _last_tick_ok.get(loop_name)
+    # ยังไม่เคย tick สำเร็จ: นับจากตอนเริ่ม process (ให้เวลาบูต)
+    tick_age = now - (last_ok if last_ok is not None else _started_at)
+    tick_ok = tick_age < READY_MAX_TICK_AGE
+
+    probe_at = _db_probe_state["checked_at"]
+    details = {
+        "gateway": {
+            "ok": gateway_ok,
+            "latency_ms": round(latency * 1000, 1) if math.isfinite(latency) else None,
+        },
+        "voice_tick": {"ok": tick_ok, "loop": loop_name, "seconds_since_success": round(tick_age, 1)},
+        "warm": {"ok": _warm_state["done"], "seconds": _warm_state["seconds"], "rows": _warm_state["rows"]},
+        "db": {
+            "ok": _db_probe_state["ok"],
+            "latency_ms": _db_probe_state["latency_ms"],
+            "checked_seconds_ago": round(now - probe_at, 1) if probe_at is not None else None,
+        },
+        "journal": journal_stats(),
+        "shard": {"id": SHARD_ID, "count": SHARD_COUNT, "guilds": len(owned_guilds())},
+    }
+    return gateway_ok and _warm_state["done"] and tick_ok, details
+
+
 # ======================
 # Bot Ready
 # ======================
@@ -562,14 +2729,16 @@ async def on_ready():
     # persistent views
     bot.add_view(RollView())
     bot.add_view(DailyView())
+    bot.add_view(LeaderboardView())
+    bot.add_view(GachaHistoryView())
 
-    if not voice_tick.is_running():
-        voice_tick.start()
+    # on_ready ยิงซ้ำได้ตอน reconnect → warm-up ครั้งเดียว (voice loop เริ่มหลัง warm-up เสร็จ)
+    if _warm_state["task"] is None:
+        _warm_state["task"] = asyncio.create_task(warm_up())
 
 
 def main():
-    if server_on:
-        server_on()
+    check_env()
     bot.run(DISCORD_TOKEN)
 
 
@@ -0,0 +1,88 @@
+"""
+Gacha reward tables compiled into alias tables (Vose's method),
+so one draw is O(1) no matter how many rewards a guild configures.
+"""
+import random
+
+
+# ตารางรางวัลเริ่มต้น (ใช้เมื่อกิลด์ยังไม่ได้ตั้งค่าใน gacha_rewards)
+GACHA_REWARDS = [
+    {"name": "สกินสุดแรร์ทอมแอนเจอรี่", "rate": 0.2},
+    {"name": "สกินสุดแรร์ชีส", "rate": 0.2},
+    {"name": "อาหารหมูกระทะ 6 ชม.", "rate": 3},
+    {"name": "เงินเขียว 10,000.-", "rate": 3},
+    {"name": "เงินเขียว 8,000.-", "rate": 5},
+    {"name": "เงินเขี่ยว 4,000.-", "rate": 8.8},
+    {"name": "เหรียญออนไลน์ 1 เหรียญ", "rate": 5},
+    {"name": "เสียใจด้วยคุณไม่ได้รางวัลร้องไห้สะสิ", "rate": 74.8},
+]
+
+
+class AliasTable:
+    """
+    Precompiled sampler for a list of {"name", "rate"} rewards.
+    Rates are relative weights (they don't have to sum to 100).
+    """
+    __slots__ = ("names", "rates", "total", "_prob", "_alias")
+
+    def __init__(self, rewards):
+        rewards = [r for r in rewards if float(r["rate"]) > 0]
+        if not rewards:
+            raise ValueError("gacha table needs at least one reward with rate > 0")
+
+        self.names = [str(r["name"]) for r in rewards]
+        self.rates = [float(r["rate"]) for r in rewards]
+        self.total = sum(self.rates)
+
+        n = len(self.rates)
+        scaled = [rate * n / self.total for rate in self.rates]
+        prob = [0.0] * n
+        alias = list(range(n))
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+
+        while small and large:
+            s = small.pop()
+            l = large.pop()
+            prob[s] = scaled[s]
+            alias[s] = l
+            scaled[l] = (scaled[l] + scaled[s]) - 1.0
+            (small if scaled[l] < 1.0 else large).append(l)
+
+        # ที่เหลือคือ 1.0 (ต่างกันแค่ floating point error)
+        for i in large + small:
+            prob[i] = 1.0
+
+        self._prob = prob
+        self._alias = alias
+
+    def __len__(self):
+        return len(self.names)
+
+    def chance(self, name: str) -> float:
+        """Configured probability of a reward (0..1)."""
+        return sum(rate for n, rate in zip(self.names, self.rates) if n == name) / self.total
+
+    def sample_index(self, rng=random) -> int:
+        u = rng.random() * len(self._prob)
+        i = int(u)
+        return i if (u - i) < self._prob[i] else self._alias[i]
+
+    def sample(self, rng=random) -> str:
+        return self.names[self.sample_index(rng)]
+
+    def sample_indices(self, count: int, rng=random) -> list:
+        """Draw `count` results in one pass (used by roll x10 and the stats harness)."""
+        rnd = rng.random
+        prob, alias = self._prob, self._alias
+        n = len(prob)
+        out = [0] * count
+        for k in range(count):
+            u = rnd() * n
+            i = int(u)
+            out[k] = i if (u - i) < prob[i] else alias[i]
+        return out
+
+    def sample_many(self, count: int, rng=random) -> list:
+        names = self.names
+        return [names[i] for i in self.sample_indices(count, rng)]
@@ -0,0 +1,90 @@
+"""
+Durable local write journal (SQLite in WAL mode).
+
+Writes that could not reach Supabase are appended here as JSON entries, and a
+background replayer drains them in order once the DB is back, so an outage
+delays balances instead of losing them. The file is opened on first use, so
+importing the bot does not touch the disk.
+"""
+import json
+import sqlite3
+import threading
+import time
+
+
+class WriteJournal:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+        self._depth = 0
+        self._oldest = None
+
+    def _db(self) -> sqlite3.Connection:
+        # เรียกภายใต้ self._lock
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS journal ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " created_at REAL NOT NULL,"
+                " label TEXT NOT NULL,"
+                " entry TEXT NOT NULL)"
+            )
+            self._depth, self._oldest = conn.execute("SELECT COUNT(*), MIN(created_at) FROM journal").fetchone()
+            self._conn = conn
+        return self._conn
+
+    def open(self):
+        """Open the file now (picks up entries left by the previous run)."""
+        with self._lock:
+            self._db()
+
+    def depth(self) -> int:
+        if self._conn is None:
+            self.open()
+        return self._depth
+
+    def lag_seconds(self) -> float:
+        """Age of the oldest entry still waiting (0 when empty)."""
+        if self._conn is None:
+            self.open()
+        oldest = self._oldest
+        return max(0.0, time.time() - oldest) if oldest is not None else 0.0
+
+    def append(self, label: str, entry: dict) -> int:
+        now = time.time()
+        with self._lock:
+            cur = self._db().execute(
+                "INSERT INTO journal (created_at, label, entry) VALUES (?, ?, ?)",
+                (now, label, json.dumps(entry, ensure_ascii=False)),
+            )
+            self._depth += 1
+            if self._oldest is None:
+                self._oldest = now
+            return cur.lastrowid
+
+    def peek(self, limit: int) -> list:
+        """Oldest entries first: [(id, label, entry_dict)]."""
+        with self._lock:
+            rows = self._db().execute(
+                "SELECT id, label, entry FROM journal ORDER BY id LIMIT ?", (limit,)
+            ).fetchall()
+        return [(rid, label, json.loads(entry)) for rid, label, entry in rows]
+
+    def delete(self, ids):
+        ids = list(ids)
+        if not ids:
+            return
+        with self._lock:
+            conn = self._db()
+            conn.execute(f"DELETE FROM journal WHERE id IN ({','.join('?' * len(ids))})", ids)
+            self._depth, self._oldest = conn.execute("SELECT COUNT(*), MIN(created_at) FROM journal").fetchone()
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,125 @@
+"""
+In-memory leaderboard: per-guild rank index kept up to date by the points helpers.
+
+A guild is seeded once from the `users` table; after that every balance the bot
+writes or reads is pushed in with update(), so the top page and any user's own
+rank come from a bisect over a sorted list instead of a table sort.
+The points helpers report balances from several DB executor threads while the
+buttons read pages on the event loop, so Leaderboards guards every index (and
+the seed-in-progress buffers) with one lock; RankIndex itself is not locked
+and is only touched under it.
+"""
+import bisect
+import threading
+from collections import OrderedDict
+
+
+class RankIndex:
+    """Sorted keys (-points, user_id) + {user_id: points}. Rank 1 = most points; ties by user id."""
+
+    def __init__(self, rows=()):
+        self._points = {int(uid): int(pts) for uid, pts in rows}
+        self._keys = sorted((-pts, uid) for uid, pts in self._points.items())
+
+    def __len__(self):
+        return len(self._keys)
+
+    def update(self, user_id: int, points: int):
+        old = self._points.get(user_id)
+        if old == points:
+            return
+        if old is not None:
+            i = bisect.bisect_left(self._keys, (-old, user_id))
+            del self._keys[i]
+        self._points[user_id] = points
+        bisect.insort(self._keys, (-points, user_id))
+
+    def rank(self, user_id: int):
+        """(rank, points) or None if the user has no row."""
+        pts = self._points.get(user_id)
+        if pts is None:
+            return None
+        return bisect.bisect_left(self._keys, (-pts, user_id)) + 1, pts
+
+    def page(self, offset: int, limit: int) -> list:
+        """[(rank, user_id, points)] starting at rank offset + 1."""
+        return [(offset + i + 1, uid, -neg) for i, (neg, uid) in enumerate(self._keys[offset:offset + limit])]
+
+
+class Leaderboards:
+    """
+    RankIndex per guild, LRU-bounded to `max_guilds`.
+
+    Seeding is begin_load() -> read the table -> finish_load(rows); balances
+    reported while the read is in flight are buffered and applied on top, so a
+    slow seed cannot roll a concurrent update back.
+    """
+
+    def __init__(self, max_guilds: int):
+        self.max_guilds = max_guilds
+        self._indexes = OrderedDict()  # guild_id -> RankIndex
+        self._pending = {}             # guild_id -> [(user_id, points)] ระหว่างโหลด
+        self._lock = threading.Lock()
+
+    def clear(self):
+        with self._lock:
+            self._indexes.clear()
+            self._pending.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"guilds": len(self._indexes), "users": sum(len(ix) for ix in self._indexes.values())}
+
+    def begin_load(self, guild_id: int):
+        with self._lock:
+            self._pending.setdefault(guild_id, [])
+
+    def finish_load(self, guild_id: int, rows):
+        """rows: iterable of (user_id, points). rows=None means the read failed."""
+        with self._lock:
+            pending = self._pending.pop(guild_id, [])
+            if rows is None or any(pts is None for _, pts in pending):
+                return None
+            index = RankIndex(rows)
+            for uid, pts in pending:
+                index.update(uid, pts)
+            self._indexes[guild_id] = index
+            self._indexes.move_to_end(guild_id)
+            while len(self._indexes) > self.max_guilds:
+                self._indexes.popitem(last=False)
+            return index
+
+    def update(self, guild_id: int, user_id: int, points):
+        """Report a user's current balance. points=None (unknown) drops the guild so it is re-seeded."""
+        with self._lock:
+            pending = self._pending.get(guild_id)
+            if pending is not None:
+                pending.append((user_id, None if points is None else int(points)))
+            if points is None:
+                self._indexes.pop(guild_id, None)
+                return
+            index = self._indexes.get(guild_id)
+            if index is not None:
+                index.update(user_id, int(points))
+
+    def invalidate(self, guild_id: int):
+        with self._lock:
+            self._indexes.pop(guild_id, None)
+
+    def rank(self, guild_id: int, user_id: int):
+        with self._lock:
+            index = self._indexes.get(guild_id)
+            return index.rank(user_id) if index is not None else None
+
+    def page(self, guild_id: int, offset: int, limit: int):
+        """(rows, total) or None if the guild is not loaded."""
+        with self._lock:
+            index = self._indexes.get(guild_id)
+            if index is None:
+                return None
+            self._indexes.move_to_end(guild_id)
+            return index.page(offset, limit), len(index)
+
+    def loaded(self, guild_id: int) -> bool:
+        with self._lock:
+            return guild_id in self._indexes
@@ -0,0 +1,112 @@
+"""
+Coalescing log dispatcher for the daily / gacha log channels.
+
+Handlers call enqueue() and return immediately. One worker task per channel
+merges queued lines into as few messages as possible (max 2000 chars each),
+flushing when a message is full or `flush_interval` seconds after the first
+queued line. When a channel's queue is full new lines are dropped and counted.
+"""
+import asyncio
+
+import tracing
+
+
+MAX_MESSAGE_CHARS = 2000   # ลิมิตข้อความของ Discord
+SEPARATOR = "\n\n"
+
+
+class LogDispatcher:
+    def __init__(self, flush_interval: float = 1.5, max_queue: int = 1000, max_chars: int = MAX_MESSAGE_CHARS):
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.max_chars = max_chars
+        self._queues = {}    # channel_id -> asyncio.Queue
+        self._channels = {}  # channel_id -> channel ล่าสุด (มี .send)
+        self._workers = {}   # channel_id -> asyncio.Task
+        self._stats = {"enqueued": 0, "dropped": 0, "messages": 0, "lines": 0, "errors": 0}
+
+    def stats(self) -> dict:
+        return {
+            **self._stats,
+            "channels": len(self._queues),
+            "queued": sum(q.qsize() for q in self._queues.values()),
+        }
+
+    def enqueue(self, channel, text: str) -> bool:
+        """Queue a log line for `channel`. Never waits; returns False if it was dropped."""
+        text = text[:self.max_chars]
+        q = self._queues.get(channel.id)
+        if q is None:
+            q = self._queues[channel.id] = asyncio.Queue(maxsize=self.max_queue)
+        self._channels[channel.id] = channel
+
+        try:
+            q.put_nowait(text)
+        except asyncio.QueueFull:
+            self._stats["dropped"] += 1
+            return False
+        self._stats["enqueued"] += 1
+
+        task = self._workers.get(channel.id)
+        if task is None or task.done():
+            # worker อยู่ยาว → ไม่รับ trace ของ handler ที่บังเอิญสร้างมัน
+            self._workers[channel.id] = asyncio.create_task(self._worker(channel.id, q), context=tracing.detached())
+        return True
+
+    async def _next_batch(self, q: asyncio.Queue, first: str):
+        """Collect lines after `first` until the message is full or the interval ends. Returns (batch, carry)."""
+        loop = asyncio.get_running_loop()
+        batch = [first]
+        size = len(first)
+        deadline = loop.time() + self.flush_interval
+        while True:
+            if q.empty():
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    return batch, None
+                try:
+                    nxt = await asyncio.wait_for(q.get(), timeout)
+                except asyncio.TimeoutError:
+                    return batch, None
+            else:
+                nxt = q.get_nowait()
+            if size + len(SEPARATOR) + len(nxt) > self.max_chars:
+                return batch, nxt
+            batch.append(nxt)
+            size += len(SEPARATOR) + len(nxt)
+
+    async def _worker(self, channel_id: int, q: asyncio.Queue):
+        carry = None
+        while True:
+            first = carry if carry is not None else await q.get()
+            batch, carry = await self._next_batch(q, first)
+            await self._send(channel_id, batch)
+
+    async def _send(self, channel_id: int, batch: list):
+        try:
+            with tracing.span("discord log send"):
+                await self._channels[channel_id].send(SEPARATOR.join(batch))
+            self._stats["messages"] += 1
+            self._stats["lines"] += len(batch)
+        except Exception as e:
+            self._stats["errors"] += 1
+            print("[LOG-ERROR]", e)
+
+    async def close(self):
+        """Stop the workers and send whatever is still queued (used on shutdown)."""
+        for task in self._workers.values():
+            task.cancel()
+        self._workers.clear()
+        for channel_id, q in self._queues.items():
+            lines = []
+            while not q.empty():
+                lines.append(q.get_nowait())
+            batch, size = [], 0
+            for line in lines:
+                if batch and size + len(SEPARATOR) + len(line) > self.max_chars:
+                    await self._send(channel_id, batch)
+                    batch, size = [], 0
+                size += (len(SEPARATOR) if batch else 0) + len(line)
+                batch.append(line)
+            if batch:
+                await self._send(channel_id, batch)
@@ -0,0 +1,185 @@
+"""
+Tiny Prometheus-style metrics for the bot, rendered by /metrics on the keep-alive server.
+
+Updates never take a lock: every thread writes only to its own shard
+(threading.local) and render() merges the shards when /metrics is scraped.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_registry = []  # metric ทั้งหมดตามลำดับที่สร้าง
+_const_labels = ""  # label คงที่ที่ติดทุก sample (เช่น shard="0")
+
+
+def _escape(v) -> str:
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def set_const_labels(**labels):
+    """Attach fixed labels (e.g. the shard id) to every rendered sample."""
+    global _const_labels
+    _const_labels = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+
+
+def _fmt_labels(names, values, extra=""):
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    if _const_labels:
+        parts.append(_const_labels)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt_value(v) -> str:
+    if isinstance(v, float):
+        if v == float("inf"):
+            return "+Inf"
+        return repr(v)
+    return str(v)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._shards = []  # dict ของแต่ละ thread (list.append เป็น atomic)
+        _registry.append(self)
+
+    def _shard(self) -> dict:
+        try:
+            return self._local.d
+        except AttributeError:
+            d = self._local.d = {}
+            self._shards.append(d)
+            return d
+
+    def _snapshot(self, shard: dict) -> list:
+        # thread เจ้าของอาจเพิ่ม key ระหว่างอ่าน → ลองใหม่
+        while True:
+            try:
+                return list(shard.items())
+            except RuntimeError:
+                continue
+
+    def samples(self):
+        """Yield (suffix, label_values, extra_label, value)."""
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, values, extra, v in self.samples():
+            lines.append(f"{self.name}{suffix}{_fmt_labels(self.labelnames, values, extra)} {_fmt_value(v)}")
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        d = self._shard()
+        d[labels] = d.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return sum(dict(self._snapshot(s)).get(labels, 0) for s in list(self._shards))
+
+    def samples(self):
+        total = {}
+        for shard in list(self._shards):
+            for k, v in self._snapshot(shard):
+                total[k] = total.get(k, 0) + v
+        for k in sorted(total, key=str):
+            yield "", k, "", total[k]
+
+
+class Gauge(Counter):
+    """Up/down gauge (e.g. in-flight calls). Shards hold deltas, so inc/dec from any thread is safe."""
+    kind = "gauge"
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    @contextmanager
+    def track(self, *labels):
+        self.inc(*labels)
+        try:
+            yield
+        finally:
+            self.dec(*labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, *labels, value: float):
+        d = self._shard()
+        row = d.get(labels)
+        if row is None:
+            # [count ต่อ bucket..., +Inf, sum]
+            row = d[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        for i, b in enumerate(self.buckets):
+            if value <= b:
+                row[i] += 1
+                break
+        else:
+            row[len(self.buckets)] += 1
+        row[-1] += value
+
+    @contextmanager
+    def time(self, *labels):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(*labels, value=time.perf_counter() - t0)
+
+    def samples(self):
+        total = {}
+        n = len(self.buckets) + 2
+        for shard in list(self._shards):
+            for k, row in self._snapshot(shard):
+                acc = total.setdefault(k, [0] * (n - 1) + [0.0])
+                for i in range(n):
+                    acc[i] += row[i]
+        for k in sorted(total, key=str):
+            row = total[k]
+            cum = 0
+            for i, b in enumerate(self.buckets):
+                cum += row[i]
+                yield "_bucket", k, f'le="{_fmt_value(float(b))}"', cum
+            cum += row[len(self.buckets)]
+            yield "_bucket", k, 'le="+Inf"', cum
+            yield "_sum", k, "", row[-1]
+            yield "_count", k, "", cum
+
+
+class CallbackMetric(_Metric):
+    """Values read at scrape time from `fn()` -> {label_values_tuple: value} (for caches, queues, ...)."""
+
+    def __init__(self, name: str, help: str, fn, labelnames=(), kind: str = "gauge"):
+        super().__init__(name, help, labelnames)
+        self.kind = kind
+        self._fn = fn
+
+    def samples(self):
+        try:
+            values = self._fn()
+        except Exception:
+            return
+        for k in sorted(values, key=str):
+            yield "", k, "", values[k]
+
+
+def render() -> str:
+    return "\n".join(m.render() for m in list(_registry)) + "\n"
@@ -1,16 +1,43 @@
-from flask import Flask
-from threading import Thread
-
-app = Flask(__name__)
-
-@app.route("/")
-def home():
-    return "Server is running!"
-
-def run():
-    app.run(host="0.0.0.0", port=8080)
-
-def server_on():
-    t = Thread(target=run)
-    t.daemon = True
-    t.start()
+import os
+
+from aiohttp import web
+
+import metrics
+
+PORT = int(os.getenv("PORT", "8080"))
+
+
+def _make_app(readiness):
+    async def home(request):
+        return web.Response(text="Server is running!")
+
+    async def healthz(request):
+        # process ยังตอบได้ = alive
+        return web.json_response({"status": "ok"})
+
+    async def readyz(request):
+        ready, details = readiness()
+        return web.json_response({"ready": ready, **details}, status=200 if ready else 503)
+
+    async def metrics_endpoint(request):
+        return web.Response(text=metrics.render(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/", home)
+    app.router.add_get("/healthz", healthz)
+    app.router.add_get("/readyz", readyz)
+    app.router.add_get("/metrics", metrics_endpoint)
+    return app
+
+
+async def server_on(readiness, host: str = "0.0.0.0", port: int = PORT):
+    """
+    Start the health server inside the running event loop (call from setup_hook).
+    readiness() -> (ready: bool, details: dict) must be cheap: it runs on every /readyz.
+    Returns the AppRunner so the caller can clean it up on shutdown.
+    """
+    runner = web.AppRunner(_make_app(readiness), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    print(f"[HEALTH] listening on {host}:{port}")
+    return runner
@@ -0,0 +1,105 @@
+"""
+Sampling profiler and event-loop stall watchdog (stdlib only).
+
+sample_stacks() walks every thread's current frame at a fixed interval and
+counts collapsed stacks ("thread;outer;...;inner count" per line), the input
+format of flamegraph.pl / speedscope. LoopWatchdog runs in its own thread and
+prints the event-loop thread's stack when the loop stops answering heartbeats.
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+
+
+def _frame_name(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _collapse(frame) -> str:
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame.f_code))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+def sample_stacks(seconds: float, interval: float = 0.005) -> tuple:
+    """Sample all threads (except this one) for `seconds`. Returns (collapsed text, samples taken)."""
+    me = threading.get_ident()
+    names = {}
+    stacks = Counter()
+    samples = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        if len(names) != threading.active_count():
+            names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident != me:
+                stacks[f"{names.get(ident, ident)};{_collapse(frame)}"] += 1
+        samples += 1
+        time.sleep(interval)
+    text = "\n".join(f"{stack} {n}" for stack, n in stacks.most_common()) + "\n"
+    return text, samples
+
+
+class LoopWatchdog:
+    """
+    A coroutine on the loop bumps a heartbeat every `interval`; a watchdog thread
+    reports (once per stall) the loop thread's stack when the heartbeat is older
+    than `threshold_ms` — i.e. the callback that is blocking the loop right now.
+    """
+
+    def __init__(self, threshold_ms: float, interval: float = 0.1, on_stall=None):
+        self.threshold = threshold_ms / 1000
+        self.interval = interval
+        self.on_stall = on_stall  # on_stall(seconds_blocked) เรียกจาก thread ของ watchdog
+        self.stalls = 0
+        self.worst = 0.0
+        self._beat = time.monotonic()
+        self._loop_thread = None
+        self._task = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    async def _heartbeat(self):
+        while True:
+            self._beat = time.monotonic()
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._task = asyncio.get_running_loop().create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._task:
+            self._task.cancel()
+
+    def _watch(self):
+        reported = None
+        while not self._stop.wait(self.interval):
+            beat = self._beat
+            blocked = time.monotonic() - beat - self.interval
+            if blocked < self.threshold:
+                if reported is not None:
+                    # stall จบแล้ว: heartbeat แรกหลัง stall บอกความยาวจริง
+                    total = beat - reported - self.interval
+                    self.worst = max(self.worst, total)
+                    if self.on_stall:
+                        self.on_stall(total)
+                    reported = None
+                continue
+            if reported == beat:
+                continue
+            reported = beat
+            self.stalls += 1
+            frame = sys._current_frames().get(self._loop_thread)
+            stack = "".join(traceback.format_stack(frame)[-8:]) if frame is not None else "  <no frame>\n"
+            print(f"[LOOP-STALL] event loop blocked for >{blocked * 1000:.0f}ms, currently in:\n{stack}", end="")
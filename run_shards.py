@@ -0,0 +1,83 @@
+"""
+Run the bot as SHARD_COUNT processes on one machine, one gateway shard each.
+
+    SHARD_COUNT=4 python run_shards.py
+
+Every child gets its own SHARD_ID, PORT (BASE_PORT + shard id, for /healthz
+/readyz /metrics) and journal file. A child that exits is restarted with
+backoff. SIGTERM / SIGINT are forwarded to every child as SIGTERM (the bot
+flushes its caches in close()); children still running after
+SHARD_STOP_TIMEOUT seconds are killed. On a platform that already runs
+one container per shard, set SHARD_ID / SHARD_COUNT there and run bot.py.
+"""
+import os
+import signal
+import subprocess
+import sys
+import time
+
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "2"))
+BASE_PORT = int(os.getenv("BASE_PORT", os.getenv("PORT", "8080")))
+RESTART_BACKOFF_MAX = 60.0
+# เวลาให้ลูกปิดตัวเอง (flush write-behind / gacha_history / log) ก่อนโดน kill
+SHARD_STOP_TIMEOUT = float(os.getenv("SHARD_STOP_TIMEOUT", "30"))
+
+_stopping = False
+
+
+def _spawn(shard_id: int) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "SHARD_ID": str(shard_id),
+        "SHARD_COUNT": str(SHARD_COUNT),
+        "PORT": str(BASE_PORT + shard_id),
+    }
+    print(f"[SHARDS] start shard {shard_id}/{SHARD_COUNT} (port {BASE_PORT + shard_id})", flush=True)
+    return subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "bot.py")], env=env)
+
+
+def _stop(signum, frame):
+    global _stopping
+    _stopping = True
+
+
+def main():
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+
+    procs = {i: _spawn(i) for i in range(SHARD_COUNT)}
+    backoff = {i: 1.0 for i in procs}
+    restart_at = {}
+
+    while not _stopping:
+        now = time.monotonic()
+        for i, p in list(procs.items()):
+            if p is not None and p.poll() is not None:
+                print(f"[SHARDS] shard {i} exited with {p.returncode}, restart in {backoff[i]:.0f}s", flush=True)
+                procs[i] = None
+                restart_at[i] = now + backoff[i]
+                backoff[i] = min(RESTART_BACKOFF_MAX, backoff[i] * 2)
+            elif p is None and now >= restart_at[i]:
+                procs[i] = _spawn(i)
+            elif p is not None and now - restart_at.get(i, 0) > RESTART_BACKOFF_MAX:
+                backoff[i] = 1.0  # อยู่ได้นานพอแล้ว รีเซ็ต backoff
+        time.sleep(0.5)
+
+    running = {i: p for i, p in procs.items() if p is not None and p.poll() is None}
+    for i, p in running.items():
+        print(f"[SHARDS] stop shard {i}", flush=True)
+        p.send_signal(signal.SIGTERM)
+    # เส้นตายเดียวกันทุก shard (ไม่ใช่ 30 วิต่อตัวเรียงกัน) → ลูกทุกตัว flush พร้อมกัน
+    deadline = time.monotonic() + SHARD_STOP_TIMEOUT
+    for i, p in running.items():
+        try:
+            code = p.wait(timeout=max(0.0, deadline - time.monotonic()))
+            print(f"[SHARDS] shard {i} exited with {code}", flush=True)
+        except subprocess.TimeoutExpired:
+            print(f"[SHARDS] shard {i} did not stop within {SHARD_STOP_TIMEOUT:.0f}s, killing", flush=True)
+            p.kill()
+            p.wait()
+
+
+if __name__ == "__main__":
+    main()
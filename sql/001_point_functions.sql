@@ -0,0 +1,50 @@
+-- Atomic point mutations used by bot.py.
+-- Run once in the Supabase SQL editor (needs users unique (guild_id, user_id)).
+
+-- เพิ่ม/ลดแต้มแบบ atomic ในคำสั่งเดียว (สร้างแถวให้ถ้ายังไม่มี)
+create or replace function aura_add_points(p_guild_id bigint, p_user_id bigint, p_amount bigint)
+returns table(points_before bigint, points_after bigint)
+language sql
+as $$
+  insert into users as u (guild_id, user_id, points)
+  values (p_guild_id, p_user_id, p_amount)
+  on conflict (guild_id, user_id)
+  do update set points = coalesce(u.points, 0) + excluded.points
+  returning (u.points - p_amount)::bigint, u.points::bigint;
+$$;
+
+-- หักแต้มเฉพาะตอนที่แต้มพอ (ใช้กับกาชา) — ok = false ถ้าแต้มไม่พอ
+create or replace function aura_spend_points(p_guild_id bigint, p_user_id bigint, p_cost bigint)
+returns table(ok boolean, points_before bigint, points_after bigint)
+language plpgsql
+as $$
+declare
+  v_after bigint;
+begin
+  update users
+     set points = points - p_cost
+   where guild_id = p_guild_id and user_id = p_user_id and points >= p_cost
+  returning points into v_after;
+
+  if found then
+    return query select true, v_after + p_cost, v_after;
+  else
+    select coalesce(max(points), 0) into v_after
+      from users where guild_id = p_guild_id and user_id = p_user_id;
+    return query select false, v_after, v_after;
+  end if;
+end;
+$$;
+
+-- เพิ่มแต้มหลายคนในคำสั่งเดียว (voice reward) — user_ids ต้องไม่ซ้ำกัน
+create or replace function aura_add_points_bulk(p_guild_id bigint, p_user_ids bigint[], p_amounts bigint[])
+returns table(user_id bigint, points_after bigint)
+language sql
+as $$
+  insert into users as u (guild_id, user_id, points)
+  select p_guild_id, t.uid, t.amount
+    from unnest(p_user_ids, p_amounts) as t(uid, amount)
+  on conflict (guild_id, user_id)
+  do update set points = coalesce(u.points, 0) + excluded.points
+  returning u.user_id::bigint, u.points::bigint;
+$$;
@@ -0,0 +1,8 @@
+-- Per-guild gacha reward tables (bot.py falls back to gacha.GACHA_REWARDS when a guild has none).
+create table if not exists gacha_rewards (
+  guild_id bigint not null,
+  name text not null,
+  rate double precision not null check (rate >= 0),
+  position int not null default 0,
+  primary key (guild_id, name)
+);
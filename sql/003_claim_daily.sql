@@ -0,0 +1,27 @@
+-- Daily claim in one round trip: check last_daily, credit points and stamp the claim atomically.
+-- p_today is the Bangkok date as 'YYYY-MM-DD' (same format bot.py always stored in users.last_daily).
+create or replace function aura_claim_daily(p_guild_id bigint, p_user_id bigint, p_amount bigint, p_today text)
+returns table(claimed boolean, points_before bigint, points_after bigint)
+language plpgsql
+as $$
+declare
+  v_after bigint;
+begin
+  insert into users as u (guild_id, user_id, points, last_daily)
+  values (p_guild_id, p_user_id, p_amount, p_today)
+  on conflict (guild_id, user_id)
+  do update set points = coalesce(u.points, 0) + excluded.points,
+                last_daily = excluded.last_daily
+   where u.last_daily is distinct from excluded.last_daily
+  returning u.points into v_after;
+
+  if found then
+    return query select true, v_after - p_amount, v_after;
+  else
+    -- วันนี้รับไปแล้ว
+    select coalesce(points, 0) into v_after
+      from users where guild_id = p_guild_id and user_id = p_user_id;
+    return query select false, v_after, v_after;
+  end if;
+end;
+$$;
@@ -0,0 +1,46 @@
+-- Every gacha result, written in batches by bot.py (aura_record_gacha).
+create table if not exists gacha_history (
+  id bigint generated always as identity primary key,
+  guild_id bigint not null,
+  user_id bigint not null,
+  reward text not null,
+  cost bigint not null default 0,
+  rolled_at timestamptz not null default now()
+);
+
+-- !gachahistory @member: keyset by id desc per user / per guild
+create index if not exists gacha_history_user_idx on gacha_history (guild_id, user_id, id desc);
+create index if not exists gacha_history_guild_idx on gacha_history (guild_id, id desc);
+-- !gachahistory since:YYYY-MM-DD: rolled_at >= since per guild
+create index if not exists gacha_history_time_idx on gacha_history (guild_id, rolled_at desc);
+
+-- Per-reward counters kept up to date by aura_record_gacha (!gachastats never scans history).
+create table if not exists gacha_reward_stats (
+  guild_id bigint not null,
+  reward text not null,
+  rolls bigint not null default 0,
+  points_spent bigint not null default 0,
+  primary key (guild_id, reward)
+);
+
+-- p_rows: [{"guild_id", "user_id", "reward", "cost", "rolled_at"}, ...]
+create or replace function aura_record_gacha(p_rows jsonb)
+returns void
+language sql
+as $$
+  with ins as (
+    insert into gacha_history (guild_id, user_id, reward, cost, rolled_at)
+    select (r->>'guild_id')::bigint,
+           (r->>'user_id')::bigint,
+           r->>'reward',
+           coalesce((r->>'cost')::bigint, 0),
+           coalesce((r->>'rolled_at')::timestamptz, now())
+      from jsonb_array_elements(p_rows) as r
+    returning guild_id, reward, cost
+  )
+  insert into gacha_reward_stats as s (guild_id, reward, rolls, points_spent)
+  select guild_id, reward, count(*), sum(cost) from ins group by guild_id, reward
+  on conflict (guild_id, reward)
+  do update set rolls = s.rolls + excluded.rolls,
+                points_spent = s.points_spent + excluded.points_spent;
+$$;
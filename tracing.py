@@ -0,0 +1,76 @@
+"""
+Lightweight span tracer for handlers.
+
+trace(name) opens a root trace for one command / button handler; span(name)
+times a piece of work (DB call, Discord send) and attaches it to the current
+trace through a contextvar. run_db copies the context into the executor, so
+spans recorded on DB threads land in the handler that caused them. Every span
+is also observed in the aura_span_seconds histogram, with or without a trace.
+"""
+import contextvars
+import time
+from contextlib import contextmanager
+
+import metrics
+
+
+SPAN_SECONDS = metrics.Histogram("aura_span_seconds", "Duration of traced spans", ("span",))
+SLOW_HANDLERS = metrics.Counter("aura_slow_handlers_total", "Handlers slower than the slow threshold", ("handler",))
+
+_current = contextvars.ContextVar("aura_trace", default=None)
+
+
+class Trace:
+    __slots__ = ("name", "started", "spans")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started = time.perf_counter()
+        self.spans = []  # (name, seconds) — list.append ปลอดภัยข้าม thread
+
+    def breakdown(self) -> str:
+        """Spans grouped by name, slowest total first: "db spend_points 2100ms x1 | ..." """
+        totals = {}
+        for name, seconds in self.spans:
+            t = totals.setdefault(name, [0.0, 0])
+            t[0] += seconds
+            t[1] += 1
+        parts = sorted(totals.items(), key=lambda kv: kv[1][0], reverse=True)
+        return " | ".join(f"{name} {t * 1000:.0f}ms x{n}" for name, (t, n) in parts) or "-"
+
+
+@contextmanager
+def trace(name: str, slow_ms: float):
+    """Root trace of a handler; logs the span breakdown when it takes longer than slow_ms."""
+    tr = Trace(name)
+    token = _current.set(tr)
+    try:
+        yield tr
+    finally:
+        _current.reset(token)
+        elapsed = time.perf_counter() - tr.started
+        if slow_ms and elapsed * 1000 >= slow_ms:
+            SLOW_HANDLERS.inc(name)
+            print(f"[SLOW] {name} {elapsed * 1000:.0f}ms | {tr.breakdown()}")
+
+
+def record(name: str, seconds: float):
+    """Add an already measured span (e.g. time spent waiting in a queue) to the current trace."""
+    SPAN_SECONDS.observe(name, value=seconds)
+    tr = _current.get()
+    if tr is not None:
+        tr.spans.append((name, seconds))
+
+
+@contextmanager
+def span(name: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - t0)
+
+
+def detached() -> contextvars.Context:
+    """Empty context for long-lived background tasks, so they never inherit the trace of the handler that spawned them."""
+    return contextvars.Context()
@@ -0,0 +1,171 @@
+"""
+Compact per-guild voice state for the poll-mode voice tick.
+
+Instead of a dict per voice_progress row, a guild keeps parallel typed arrays
+(user id, channel id, active minutes, mute streak, last tick) plus one
+{user_id: slot} index. A minute tick is one pass over those arrays.
+
+A member's row is read from the DB when they join the store (or in the startup
+warm-up; that read counts for the first tick), and re-read every tick until the DB has shown this process's own last write for `verify_ticks`
+ticks in a row. A newer last_tick_utc means another process (an old shard still
+running during a restart) is ticking the same member: the row is adopted and the
+VOICE_TICK_MIN_GAP guard applies again. The gap is longer than the tick interval,
+so this process stands aside for as long as the other one keeps ticking.
+Used from the event loop only (no locking).
+"""
+from array import array
+from datetime import datetime, timezone
+
+
+def parse_tick(raw) -> float:
+    """last_tick_utc (ISO string) -> epoch seconds, 0.0 if missing or unreadable."""
+    if not raw:
+        return 0.0
+    try:
+        ts = datetime.fromisoformat(str(raw).replace("Z", "+00:00"))
+    except ValueError:
+        return 0.0
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts.timestamp()
+
+
+class GuildVoiceState:
+    """
+    One guild's voice progress as parallel arrays indexed by slot.
+
+    `ticked` marks slots whose values come from this process's own last tick (the
+    VOICE_TICK_MIN_GAP guard only applies to rows taken from the DB); `clean`
+    counts consecutive re-reads where the DB still held that tick.
+    """
+    __slots__ = ("user_ids", "channel_ids", "active", "muted", "last_tick", "ticked", "clean", "_slot", "_just_read")
+
+    def __init__(self):
+        self.user_ids = array("q")
+        self.channel_ids = array("q")    # 0 = ไม่มีห้อง
+        self.active = array("l")
+        self.muted = array("l")
+        self.last_tick = array("d")      # epoch seconds
+        self.ticked = bytearray()
+        self.clean = bytearray()         # re-read ติดกันกี่รอบที่ DB ตรงกับที่เราเขียน (สูงสุด 255)
+        self._slot = {}                  # user_id -> slot
+        self._just_read = set()          # user_id ที่เพิ่งอ่านจาก DB และยังไม่ผ่าน tick → tick ถัดไปไม่ต้องอ่านซ้ำ
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    def __contains__(self, user_id):
+        return user_id in self._slot
+
+    def missing(self, user_ids) -> list:
+        slot = self._slot
+        return [uid for uid in user_ids if uid not in slot]
+
+    def load(self, user_id: int, row):
+        """Add a member from its voice_progress row (None = no row yet). Existing slots are kept."""
+        if user_id in self._slot:
+            return
+        row = row or {}
+        self._slot[user_id] = len(self.user_ids)
+        self.user_ids.append(user_id)
+        self.channel_ids.append(int(row.get("channel_id") or 0))
+        self.active.append(int(row.get("active_minutes") or 0))
+        self.muted.append(int(row.get("muted_streak_minutes") or 0))
+        self.last_tick.append(parse_tick(row.get("last_tick_utc")))
+        self.ticked.append(0)
+        self.clean.append(0)
+        self._just_read.add(user_id)
+
+    def unverified(self, user_ids, verify_ticks: int) -> list:
+        """Loaded members whose row still has to be re-read from the DB this tick (not just loaded)."""
+        slot, clean, just_read = self._slot, self.clean, self._just_read
+        return [uid for uid in user_ids if uid in slot and uid not in just_read and clean[slot[uid]] < verify_ticks]
+
+    def reconcile(self, user_id: int, row):
+        """
+        Compare a re-read row with this process's last tick of the member.
+        Same tick -> one more clean read. Newer tick -> someone else is ticking:
+        take their values and let the min-gap guard decide the next tick.
+        Older or missing (our write not visible yet, e.g. journaled) -> keep ours, not clean.
+        """
+        i = self._slot[user_id]
+        db_tick = parse_tick((row or {}).get("last_tick_utc"))
+        ours = self.last_tick[i]
+        if db_tick > ours + 0.001:
+            self.channel_ids[i] = int(row.get("channel_id") or 0)
+            self.active[i] = int(row.get("active_minutes") or 0)
+            self.muted[i] = int(row.get("muted_streak_minutes") or 0)
+            self.last_tick[i] = db_tick
+            self.ticked[i] = 0
+            self.clean[i] = 0
+        elif self.ticked[i] and abs(db_tick - ours) <= 0.001:
+            self.clean[i] = min(255, self.clean[i] + 1)
+        else:
+            self.clean[i] = 0
+
+    def tick(self, present, now: float, reward_minutes: int, mute_limit: int, min_gap: float):
+        """
+        One minute for every (user_id, channel_id, is_muted) in `present` (all must be loaded).
+        Same rules as before: unmuted adds a minute and pays at reward_minutes,
+        muted grows the streak and wipes active once it reaches mute_limit.
+        Returns (updated, rewarded, fresh): slot lists and the number of members
+        skipped because another process ticked them less than `min_gap` ago.
+        """
+        slot_of = self._slot
+        self._just_read.clear()
+        channel_ids, active, muted = self.channel_ids, self.active, self.muted
+        last_tick, ticked = self.last_tick, self.ticked
+        updated, rewarded = [], []
+        fresh = 0
+        for uid, ch_id, is_muted in present:
+            i = slot_of[uid]
+            if not ticked[i] and now - last_tick[i] < min_gap:
+                fresh += 1
+                continue
+            if is_muted:
+                muted[i] += 1
+                if muted[i] >= mute_limit:
+                    active[i] = 0
+            else:
+                muted[i] = 0
+                active[i] += 1
+                if active[i] >= reward_minutes:
+                    active[i] = 0
+                    rewarded.append(i)
+            channel_ids[i] = ch_id
+            last_tick[i] = now
+            ticked[i] = 1
+            updated.append(i)
+        return updated, rewarded, fresh
+
+    def unpay(self, slots, reward_minutes: int):
+        """Paying failed: put active back at the threshold so the next tick pays again."""
+        for i in slots:
+            self.active[i] = reward_minutes
+
+    def updates(self, slots) -> list:
+        """[(user_id, channel_id, active_minutes, muted_streak)] for update_voice_progress_bulk."""
+        return [
+            (self.user_ids[i], self.channel_ids[i] or None, self.active[i], self.muted[i])
+            for i in slots
+        ]
+
+    def prune(self, older_than: float) -> int:
+        """Drop members not ticked since `older_than` (epoch); compacts the arrays. Returns how many."""
+        keep = [i for i, ts in enumerate(self.last_tick) if ts >= older_than]
+        dropped = len(self.user_ids) - len(keep)
+        if not dropped:
+            return 0
+        for name in ("user_ids", "channel_ids", "active", "muted", "last_tick"):
+            old = getattr(self, name)
+            setattr(self, name, array(old.typecode, (old[i] for i in keep)))
+        self.ticked = bytearray(self.ticked[i] for i in keep)
+        self.clean = bytearray(self.clean[i] for i in keep)
+        self._slot = {uid: i for i, uid in enumerate(self.user_ids)}
+        self._just_read &= self._slot.keys()
+        return dropped
+
+    def nbytes(self) -> int:
+        """Approximate size of the arrays (without the slot dict)."""
+        arrays = (self.user_ids, self.channel_ids, self.active, self.muted, self.last_tick)
+        return sum(a.itemsize * len(a) for a in arrays) + len(self.ticked) + len(self.clean)
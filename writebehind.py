@@ -0,0 +1,130 @@
+"""
+Write-behind row cache (WRITE_BEHIND=1).
+
+Keeps rows per guild in memory (LRU, bounded per guild). Mutations mark rows
+dirty, and a background flusher takes dirty rows in batches and upserts them.
+All methods are thread-safe because the DB helpers run on the executor threads.
+"""
+import threading
+from collections import OrderedDict
+
+
+class RowCache:
+    def __init__(self, name: str, max_rows_per_guild: int):
+        self.name = name
+        self.max_rows_per_guild = max_rows_per_guild
+        self._guilds = {}  # guild_id -> OrderedDict(user_id -> row)
+        self._dirty = {}   # guild_id -> set(user_id)
+        self._lock = threading.RLock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "flushed": 0}
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                **self._stats,
+                "rows": sum(len(rows) for rows in self._guilds.values()),
+                "dirty": sum(len(d) for d in self._dirty.values()),
+            }
+
+    def clear(self):
+        with self._lock:
+            self._guilds.clear()
+            self._dirty.clear()
+
+    def get(self, guild_id: int, user_id: int):
+        """Cached row (the live dict — only mutate it through mutate()) or None."""
+        with self._lock:
+            rows = self._guilds.get(guild_id)
+            row = rows.get(user_id) if rows else None
+            if row is None:
+                self._stats["misses"] += 1
+                return None
+            rows.move_to_end(user_id)
+            self._stats["hits"] += 1
+            return row
+
+    def missing(self, guild_id: int, user_ids) -> list:
+        with self._lock:
+            rows = self._guilds.get(guild_id) or {}
+            out = [uid for uid in user_ids if uid not in rows]
+            self._stats["misses"] += len(out)
+            return out
+
+    def dirty_rows(self, guild_id: int) -> dict:
+        """Copies of the guild's rows that are newer than the DB: {user_id: row}."""
+        with self._lock:
+            rows = self._guilds.get(guild_id) or {}
+            return {uid: dict(rows[uid]) for uid in self._dirty.get(guild_id, ()) if uid in rows}
+
+    def put_loaded(self, guild_id: int, user_id: int, row: dict):
+        """Add a row read from the DB. An existing (possibly newer, dirty) row wins."""
+        with self._lock:
+            rows = self._guilds.setdefault(guild_id, OrderedDict())
+            if user_id not in rows:
+                rows[user_id] = row
+                self._evict(guild_id)
+
+    def mutate(self, guild_id: int, user_id: int, fn, default=None):
+        """
+        Run fn(row) -> (result, changed) under the cache lock; the row is marked
+        dirty when `changed`. A missing row starts as a copy of `default`, or
+        raises KeyError when no default is given (the caller must load it first).
+        Returns `result`.
+        """
+        with self._lock:
+            rows = self._guilds.setdefault(guild_id, OrderedDict())
+            row = rows.get(user_id)
+            if row is None:
+                if default is None:
+                    raise KeyError(user_id)
+                row = rows[user_id] = dict(default)
+            else:
+                self._stats["hits"] += 1
+            rows.move_to_end(user_id)
+            result, changed = fn(row)
+            if changed:
+                self._dirty.setdefault(guild_id, set()).add(user_id)
+            self._evict(guild_id)
+            return result
+
+    def take_dirty(self, limit: int = None) -> list:
+        """Pop up to `limit` dirty rows as [(guild_id, user_id, row_copy)]."""
+        out = []
+        with self._lock:
+            for guild_id in list(self._dirty):
+                dirty = self._dirty[guild_id]
+                rows = self._guilds.get(guild_id, {})
+                while dirty and (limit is None or len(out) < limit):
+                    uid = dirty.pop()
+                    if uid in rows:
+                        out.append((guild_id, uid, dict(rows[uid])))
+                if not dirty:
+                    del self._dirty[guild_id]
+                if limit is not None and len(out) >= limit:
+                    break
+        return out
+
+    def mark_flushed(self, count: int):
+        with self._lock:
+            self._stats["flushed"] += count
+            for guild_id in list(self._guilds):
+                self._evict(guild_id)
+
+    def restore_dirty(self, items):
+        """Flush failed: mark the rows dirty again (their current values get written next time)."""
+        with self._lock:
+            for guild_id, uid, _ in items:
+                self._dirty.setdefault(guild_id, set()).add(uid)
+
+    def _evict(self, guild_id: int):
+        # ทิ้งแถวเก่าสุดที่ไม่ dirty (แถว dirty รอ flush ก่อน)
+        rows = self._guilds.get(guild_id)
+        if not rows or len(rows) <= self.max_rows_per_guild:
+            return
+        dirty = self._dirty.get(guild_id, ())
+        for uid in list(rows):
+            if len(rows) <= self.max_rows_per_guild:
+                break
+            if uid not in dirty:
+                del rows[uid]
+                self._stats["evictions"] += 1